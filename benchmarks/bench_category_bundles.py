@@ -0,0 +1,100 @@
+### Cold start with and without precompiled category bundles (category_bundles.py).
+# A fresh process needs the category matrix of every model before it can score the first sentence:
+#   live:    the categories are embedded (OpenAI requests against the local stub server, which answers
+#            after --latency-ms like the real API; GloVe from a synthetic store)
+#   bundle:  the categories are read from a bundle compiled once beforehand; only labels that are not
+#            in it (--new of them) are embedded live
+# Reported per model family: time to the category matrix, backend requests, and the largest
+# difference between the bundled and the live cosine scores of a few queries.
+#
+#   python benchmarks/bench_category_bundles.py
+#   python benchmarks/bench_category_bundles.py --categories 2000 --new 50 --json bundles.json
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from category_bundles import compile_bundle, embed_with_bundles, load_bundles, model_fingerprint  # noqa: E402
+from embedders import get_encoder  # noqa: E402
+from glove_store import glove_store_path  # noqa: E402
+from load_service import synthetic_store  # noqa: E402
+from openai_limits import build_openai_client  # noqa: E402
+from openai_stub_server import StubEmbeddingsServer  # noqa: E402
+from scoring import CategoryScorer  # noqa: E402
+
+SEED = 1234
+MODEL_FAMILIES = ("glove_50d", "openai_small_1536", "openai_large_3072")
+QUERIES = ["roses are red", "the weather is sunny", "cars drive fast on rainy roads"]
+
+
+def category_labels(count, rng):
+    return ["w%d" % index for index in rng.choice(np.arange(1000, 100000), size=count, replace=False)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold starts with precompiled category bundles")
+    parser.add_argument("--categories", type=int, default=500, help="labels in the bundle")
+    parser.add_argument("--new", type=int, default=10, help="labels added after the bundle was compiled")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="stub backend latency")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(SEED)
+    labels = category_labels(args.categories + args.new, rng)
+    compiled, current = labels[:args.categories], labels
+
+    results = {"categories": len(current), "new": args.new, "models": {}}
+    with tempfile.TemporaryDirectory() as directory, StubEmbeddingsServer(latency=args.latency_ms / 1000.0) as server:
+        synthetic_store(directory, "50d")
+
+        def encoder_kwargs(model_family):
+            if model_family.startswith("openai_"):
+                return {"client": build_openai_client(api_key="benchmark", base_url=server.base_url)}
+            return {"store_path": os.path.join(directory, glove_store_path("50d"))}
+
+        compile_bundle(
+            compiled, MODEL_FAMILIES, os.path.join(directory, "bundles"),
+            {model_family: encoder_kwargs(model_family) for model_family in MODEL_FAMILIES},
+        )
+        # the synthetic store is not at the default path, so its fingerprint is passed in
+        glove = get_encoder("glove_50d", **encoder_kwargs("glove_50d"))
+        start = time.perf_counter()
+        bundles = load_bundles(os.path.join(directory, "bundles"), {"glove_50d": model_fingerprint("glove_50d", glove)})
+        load_ms = (time.perf_counter() - start) * 1000.0
+        results["bundle_load_ms"] = load_ms
+        print(f"{len(current)} categories ({args.new} not in the bundle); bundle loaded in {load_ms:.1f} ms")
+
+        for model_family in MODEL_FAMILIES:
+            runs = {}
+            for mode in ("live", "bundle"):
+                encoder = get_encoder(model_family, **encoder_kwargs(model_family))
+                requests_before = len(server.requests)
+                start = time.perf_counter()
+                vectors = embed_with_bundles(bundles if mode == "bundle" else None, model_family, current, encoder.encode)
+                elapsed = time.perf_counter() - start
+                runs[mode] = {"ms": elapsed * 1000.0, "backend_requests": len(server.requests) - requests_before}
+                runs[mode]["scores"] = CategoryScorer(vectors).score_batch(encoder.encode(QUERIES))
+            difference = float(np.max(np.abs(runs["live"].pop("scores") - runs["bundle"].pop("scores"))))
+            results["models"][model_family] = dict(runs, max_score_difference=difference)
+            print(
+                f"  {model_family:<18} live {runs['live']['ms']:8.1f} ms ({runs['live']['backend_requests']} requests)   "
+                f"bundle {runs['bundle']['ms']:8.1f} ms ({runs['bundle']['backend_requests']} requests)   "
+                f"max score difference {difference:.2e}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
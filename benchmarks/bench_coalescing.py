@@ -0,0 +1,157 @@
+### Backend calls saved by request coalescing under a scripted typing workload.
+# Several sessions type sentences word by word, committing every word (each commit is a rerun that
+# computes both OpenAI models), and finish with one rerun that does not change the inputs (e.g.
+# ticking "Show performance"). Sessions type the same few sentences at about the same time, like
+# a class trying the demo together. A new commit interrupts the session's previous rerun, as
+# Streamlit does when an input changes while the script is still running.
+#   baseline:  the old behaviour, every rerun computes every model and interrupted reruns keep running
+#   coalesced: SessionWork per session, a shared Singleflight, and run_concurrently cancelling
+#              the jobs of an interrupted rerun that have not started yet
+# Backend calls are counted by the local OpenAI stub server (see openai_stub_server.py).
+#
+#   python benchmarks/bench_coalescing.py
+#   python benchmarks/bench_coalescing.py --sessions 12 --latency-ms 400 --json coalescing.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from coalescing import SessionWork, Singleflight  # noqa: E402
+from openai_stub_server import StubEmbeddingsServer  # noqa: E402
+from pipeline import ModelJob, run_concurrently  # noqa: E402
+
+SEED = 1234
+MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+SENTENCES = (
+    "Roses are red, trucks are blue, and Seattle is grey right now",
+    "I would like a warm cup of chocolate milk",
+    "The weather is sunny and the flowers are blooming",
+)
+
+
+def typing_script(sessions, gap_ms, rng):
+    """
+    [(session, [(time_s, text), ...])]: every word is committed, then one rerun with the same text
+    """
+    scripts = []
+    for session in range(sessions):
+        words = SENTENCES[session % len(SENTENCES)].split()
+        clock = rng.uniform(0.0, gap_ms / 1000.0)
+        commits = []
+        for count in range(1, len(words) + 1):
+            commits.append((clock, " ".join(words[:count])))
+            clock += rng.uniform(0.5, 1.5) * gap_ms / 1000.0
+        commits.append((clock + 1.0, commits[-1][1]))
+        scripts.append((session, commits))
+    return scripts
+
+
+def run_session(commits, start, compute, coalesced, abandoned):
+    work = SessionWork() if coalesced else None
+    index = 0
+    while index < len(commits):
+        at, text = commits[index]
+        time.sleep(max(0.0, start + at - time.perf_counter()))
+        jobs = []
+        for model in MODELS:
+            if coalesced:
+                fn = (lambda model=model, text=text: work.run(model, text, lambda: compute(model, text)))
+            else:
+                fn = (lambda model=model, text=text: compute(model, text))
+            jobs.append(ModelJob(model, fn, kind="io", timeout=30))
+        results = run_concurrently(jobs)
+        # Streamlit notices a newer input at the script's next st.* call, i.e. after a result arrives;
+        # it then reruns with the latest input and skips the ones in between
+        interrupted = False
+        for _ in results:
+            now = time.perf_counter() - start
+            if index + 1 < len(commits) and commits[index + 1][0] <= now:
+                interrupted = True
+                break
+        if interrupted and not coalesced:
+            # the old pipeline let the jobs of an interrupted rerun run to the end
+            abandoned.append(results)
+        else:
+            results.close()
+        now = time.perf_counter() - start
+        index += 1
+        while index + 1 < len(commits) and commits[index + 1][0] <= now:
+            index += 1
+    return work.stats() if work else {}
+
+
+def run_mode(coalesced, args, server):
+    from openai import OpenAI
+
+    client = OpenAI(api_key="benchmark", base_url=server.base_url, max_retries=0)
+    singleflight = Singleflight()
+
+    def compute(model, text):
+        request = lambda: client.embeddings.create(input=text, model=model)  # noqa: E731
+        if coalesced:
+            return singleflight.run((model, text), request)
+        return request()
+
+    before = len(server.requests)
+    rng = random.Random(SEED)
+    scripts = typing_script(args.sessions, args.gap_ms, rng)
+    start = time.perf_counter() + 0.1
+    abandoned = []
+    stats = [None] * args.sessions
+    threads = [
+        threading.Thread(target=lambda session=session, commits=commits: stats.__setitem__(
+            session, run_session(commits, start, compute, coalesced, abandoned)))
+        for session, commits in scripts
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for results in abandoned:
+        for _ in results:
+            pass
+    result = {
+        "commits": sum(len(commits) for _, commits in scripts),
+        "backend_calls": len(server.requests) - before,
+        "wall_s": time.perf_counter() - start,
+    }
+    if coalesced:
+        result["session_work"] = {key: sum(stat[key] for stat in stats) for key in stats[0]}
+        result["singleflight"] = singleflight.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request coalescing under a typing workload")
+    parser.add_argument("--sessions", type=int, default=6)
+    parser.add_argument("--gap-ms", type=float, default=150.0, help="mean time between commits")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="stub backend latency")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with StubEmbeddingsServer(latency=args.latency_ms / 1000.0) as server:
+        for mode, coalesced in (("baseline", False), ("coalesced", True)):
+            results[mode] = run_mode(coalesced, args, server)
+            print(f"{mode:<10} {results[mode]['commits']} commits: {results[mode]['backend_calls']} backend calls, "
+                  f"{results[mode]['wall_s']:.1f}s")
+    saved = results["baseline"]["backend_calls"] - results["coalesced"]["backend_calls"]
+    results["saved_calls"] = saved
+    results["saved_fraction"] = saved / max(1, results["baseline"]["backend_calls"])
+    print(f"saved {saved} backend calls ({results['saved_fraction']:.0%}); "
+          f"sessions: {results['coalesced']['session_work']}, singleflight: {results['coalesced']['singleflight']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+### Accuracy versus latency of coarse-to-fine scoring on truncated text-embedding-3 vectors.
+# Categories (or documents) are ranked for a set of queries:
+#   loop:      today's ranking, the app's per-category cosine_similarity loop (on --loop-queries queries)
+#   full:      CategoryScorer at full width (same ranking as the loop, one matrix product)
+#   d=<n>:     CategoryScorer on the first n components, renormalized, shortlist 0 = prefix scores only,
+#              otherwise the shortlist is rescored at full width
+# Agreement is measured against the full-width ranking: top-1 agreement and recall@10 (overlap of the
+# ten best categories).
+#
+# --vectors takes real embeddings (an .npy matrix, e.g. exported text-embedding-3-large vectors): the
+# first --categories rows are the categories, the next --queries rows the queries. Without it the
+# vectors are synthetic with a decaying spectrum (component k has scale (k + 1) ** -0.5) and topic
+# structure, as a stand-in for Matryoshka-trained embeddings whose leading components carry most of
+# the signal; the stub server's vectors are i.i.d. and would make every prefix equally uninformative.
+#
+#   python benchmarks/bench_coarse_to_fine.py
+#   python benchmarks/bench_coarse_to_fine.py --vectors large.npy --dims 256 512 1024 --json c2f.json
+
+import argparse
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "off")
+
+import numpy as np  # noqa: E402
+
+from scoring import CategoryScorer, normalize_rows  # noqa: E402
+
+SEED = 1234
+DECAY = 0.5
+RECALL_AT = 10
+
+
+def synthetic_vectors(rng, num_categories, num_queries, dim, topics=200, noise=0.8):
+    """
+    (categories, queries): topic clusters with a decaying spectrum; each query is a noisy copy of a category
+    """
+    scale = (np.arange(dim) + 1.0) ** -DECAY
+    centers = rng.standard_normal((topics, dim)) * scale
+    categories = centers[rng.integers(topics, size=num_categories)] + noise * rng.standard_normal((num_categories, dim)) * scale
+    targets = rng.integers(num_categories, size=num_queries)
+    queries = categories[targets] + noise * rng.standard_normal((num_queries, dim)) * scale
+    return categories.astype(np.float32), queries.astype(np.float32)
+
+
+def timed_rankings(scorer, queries, k):
+    start = time.perf_counter()
+    rankings = scorer.top_k_batch(queries, k)
+    elapsed = time.perf_counter() - start
+    return np.array([[index for index, _ in ranking] for ranking in rankings]), elapsed * 1000.0 / len(queries)
+
+
+def agreement(rankings, truth):
+    top1 = float(np.mean(rankings[:, 0] == truth[:, 0]))
+    recall = float(np.mean([len(set(row) & set(expected)) / len(expected) for row, expected in zip(rankings, truth)]))
+    return top1, recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark coarse-to-fine scoring on truncated embeddings")
+    parser.add_argument("--vectors", help=".npy matrix of real embeddings (categories, then queries)")
+    parser.add_argument("--dim", type=int, default=3072, help="synthetic dimension (text-embedding-3-large)")
+    parser.add_argument("--categories", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--loop-queries", type=int, default=20, help="queries timed with the cosine_similarity loop")
+    parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256, 512, 1024])
+    parser.add_argument("--shortlists", type=int, nargs="+", default=[0, 50, 200])
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    import miniproject_1_student as app
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        categories, queries = vectors[:args.categories], vectors[args.categories:args.categories + args.queries]
+        source = args.vectors
+    else:
+        categories, queries = synthetic_vectors(np.random.default_rng(SEED), args.categories, args.queries, args.dim)
+        source = "synthetic"
+    dim = categories.shape[1]
+    k = min(RECALL_AT, len(categories))
+    print(f"{len(categories)} categories x {dim} dims ({source}), {len(queries)} queries")
+
+    full_scorer = CategoryScorer(categories)
+    truth, full_ms = timed_rankings(full_scorer, queries, k)
+    results = {"source": source, "dim": dim, "categories": len(categories), "queries": len(queries), "runs": []}
+
+    loop_queries = queries[:args.loop_queries]
+    start = time.perf_counter()
+    loop_top1 = [int(np.argmax([app.cosine_similarity(query, category) for category in categories])) for query in loop_queries]
+    loop_ms = (time.perf_counter() - start) * 1000.0 / max(1, len(loop_queries))
+    loop_agreement = float(np.mean(np.array(loop_top1) == truth[:len(loop_queries), 0])) if len(loop_queries) else None
+    results["runs"].append({"name": "loop", "ms_per_query": loop_ms, "top1_agreement": loop_agreement})
+    results["runs"].append({
+        "name": "full", "dimensions": dim, "ms_per_query": full_ms, "top1_agreement": 1.0, "recall_at_10": 1.0,
+        "matrix_mb": full_scorer.matrix.nbytes / 2**20,
+    })
+    print(f"  {'loop (cosine_similarity)':<28} {loop_ms:9.3f} ms/query   top-1 {loop_agreement:.4f}")
+    print(f"  {'full width':<28} {full_ms:9.3f} ms/query   matrix {full_scorer.matrix.nbytes / 2**20:7.1f} MB")
+
+    for dimensions in [d for d in args.dims if d < dim]:
+        for shortlist in args.shortlists:
+            scorer = CategoryScorer(categories, rerank=shortlist, dimensions=dimensions)
+            rankings, ms = timed_rankings(scorer, queries, k)
+            top1, recall = agreement(rankings, truth)
+            results["runs"].append({
+                "name": f"d={dimensions}", "dimensions": dimensions, "shortlist": shortlist, "ms_per_query": ms,
+                "top1_agreement": top1, "recall_at_10": recall, "matrix_mb": scorer.matrix.nbytes / 2**20,
+            })
+            print(
+                f"  d={dimensions:<5} shortlist {shortlist:<4}        {ms:9.3f} ms/query   matrix "
+                f"{scorer.matrix.nbytes / 2**20:7.1f} MB   top-1 {top1:.4f}   recall@10 {recall:.4f}"
+            )
+
+    # renormalized prefix cosine vs full cosine, for the record
+    sample = normalize_rows(queries[:50]) @ normalize_rows(categories[:2000]).T
+    for dimensions in [d for d in args.dims if d < dim]:
+        prefix = normalize_rows(queries[:50, :dimensions]) @ normalize_rows(categories[:2000, :dimensions]).T
+        correlation = float(np.corrcoef(sample.ravel(), prefix.ravel())[0, 1])
+        results.setdefault("prefix_cosine_correlation", {})[dimensions] = correlation
+        print(f"  d={dimensions:<5} prefix cosine vs full cosine: correlation {correlation:.4f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
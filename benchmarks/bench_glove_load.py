@@ -0,0 +1,102 @@
+### Startup time and memory of the GloVe loaders.
+# Each loader runs in a fresh Python process, so the numbers are a real cold start:
+#   legacy: pickle.load of word_index_dict_*_temp.pkl + np.load of embeddings_*_temp.npy
+#   store:  load_glove_store of the memory-mapped store (see glove_store.py)
+# Both then look up and average a short sentence, like one app rerun does.
+#
+# Usage (from the repository root, after the GloVe files are downloaded):
+#   python benchmarks/bench_glove_load.py 50d
+#   python benchmarks/bench_glove_load.py 25d 50d 100d --json results.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SENTENCE = "roses are red trucks are blue and seattle is grey right now"
+
+LOADERS = {
+    "legacy": """
+import pickle
+import numpy as np
+with open("word_index_dict_{model_type}_temp.pkl", "rb") as f:
+    word_index_dict = pickle.load(f, encoding="latin")
+embeddings = np.load("embeddings_{model_type}_temp.npy")
+""",
+    "store": """
+from glove_store import glove_store_path, load_glove_store
+word_index_dict = load_glove_store(glove_store_path("{model_type}"))
+embeddings = word_index_dict.embeddings
+""",
+}
+
+CHILD = """
+import json
+import resource
+import time
+
+start = time.perf_counter()
+{loader}
+loaded = time.perf_counter()
+
+import numpy as np
+vector = np.zeros(embeddings.shape[1])
+for word in "{sentence}".split():
+    if word in word_index_dict:
+        vector += embeddings[word_index_dict[word]]
+done = time.perf_counter()
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return float("nan")
+
+print(json.dumps({{
+    "load_s": loaded - start,
+    "first_query_s": done - loaded,
+    "rss_mb": rss_mb(),
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+}}))
+"""
+
+
+def run_loader(name, model_type):
+    code = CHILD.format(loader=LOADERS[name].format(model_type=model_type), sentence=SENTENCE)
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cold start of the GloVe loaders")
+    parser.add_argument("model_types", nargs="+", help='GloVe model types, e.g. "50d"')
+    parser.add_argument("--repeat", type=int, default=3, help="runs per loader (best load time is kept)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for model_type in args.model_types:
+        results[model_type] = {}
+        for name in LOADERS:
+            runs = [run_loader(name, model_type) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["load_s"])
+            results[model_type][name] = best
+            print(
+                f"{model_type:>5} {name:>7}: load {best['load_s'] * 1000:8.1f} ms, "
+                f"first query {best['first_query_s'] * 1000:6.2f} ms, "
+                f"RSS {best['rss_mb']:8.1f} MB (peak {best['peak_rss_mb']:8.1f} MB)"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
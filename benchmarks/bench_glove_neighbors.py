@@ -0,0 +1,105 @@
+### Latency of nearest-word lookup over the full GloVe vocabulary (25d, 50d, 100d).
+# Uses the real GloVe stores when they exist (glove_<type>_store, built by the app or glove_store.py);
+# otherwise a synthetic store of --vocab-size random words (1.2M, like glove.twitter.27B) is built
+# in a temporary directory so the numbers have the right scale.
+#
+#   python benchmarks/bench_glove_neighbors.py
+#   python benchmarks/bench_glove_neighbors.py --model-types 50d --block-rows 131072 --json neighbors.json
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from glove_neighbors import GloveNeighbors  # noqa: E402
+from glove_store import GloveStoreWriter, glove_store_exists, glove_store_path, load_glove_store  # noqa: E402
+
+SEED = 1234
+QUERY_WORDS = ["red", "blue", "seattle", "flowers", "food", "happy", "car", "weather", "milk", "chocolate"]
+
+
+def synthetic_store(directory, model_type, vocab_size):
+    dim = int(model_type.rstrip("d"))
+    rng = np.random.default_rng(SEED)
+    path = os.path.join(directory, glove_store_path(model_type))
+    writer = GloveStoreWriter(path, vocab_size, vocab_size, dim)
+    for start in range(0, vocab_size, 65536):
+        rows = min(65536, vocab_size - start)
+        writer.vectors[start:start + rows] = rng.standard_normal((rows, dim), dtype=np.float32)
+    for row, word in enumerate(QUERY_WORDS):
+        writer.add_word(word, row)
+    for row in range(len(QUERY_WORDS), vocab_size):
+        writer.add_word("w%d" % row, row)
+    writer.close()
+    return load_glove_store(path)
+
+
+def median_ms(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nearest-word lookup over GloVe")
+    parser.add_argument("--model-types", default="25d,50d,100d")
+    parser.add_argument("--vocab-size", type=int, default=1193514, help="synthetic vocabulary size")
+    parser.add_argument("--block-rows", type=int, default=65536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for model_type in args.model_types.split(","):
+            real_path = os.path.join(REPO_ROOT, glove_store_path(model_type))
+            if glove_store_exists(real_path):
+                store, source = load_glove_store(real_path), "glove"
+            else:
+                store, source = synthetic_store(directory, model_type, args.vocab_size), "synthetic"
+            words = [word for word in QUERY_WORDS if word in store]
+
+            start = time.perf_counter()
+            neighbors = GloveNeighbors(store, store.embeddings, block_rows=args.block_rows)
+            prepare_s = time.perf_counter() - start
+
+            batch = (words * 4)[:32]
+            result = {
+                "source": source,
+                "vocab_size": len(store),
+                "prepare_s": prepare_s,
+                "single_query_ms": median_ms(lambda: neighbors.nearest(words[:1], args.k), args.repeat),
+                "batch_32_ms": median_ms(lambda: neighbors.nearest(batch, args.k), args.repeat),
+                "analogy_ms": median_ms(lambda: neighbors.analogy(words[0], words[1], words[2], args.k), args.repeat),
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+            }
+            result["batch_32_per_query_ms"] = result["batch_32_ms"] / len(batch)
+            results[model_type] = result
+            print(
+                f"{model_type:>5} ({source}, {len(store)} words): prepare {prepare_s:6.2f}s, "
+                f"1 query {result['single_query_ms']:7.1f} ms, 32 queries {result['batch_32_ms']:7.1f} ms "
+                f"({result['batch_32_per_query_ms']:5.1f} ms/query), analogy {result['analogy_ms']:7.1f} ms, "
+                f"peak RSS {result['peak_rss_mb']:7.0f} MB"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+### Converting raw GloVe text into a GloVe store: streaming converter versus loading everything first.
+#   streaming:  glove_assets.convert_glove_text (two passes, --block-rows lines parsed at a time)
+#   in-memory:  the usual recipe, a {word: np.array} dict of the whole file, then a store written from it
+# Each run is a fresh subprocess. Reported: peak Python/numpy heap (tracemalloc), the memory that
+# grows with the vocabulary, and peak RSS (ru_maxrss), which also counts the pages of the
+# memory-mapped store matrix the OS keeps resident while it is written. The input is a synthetic
+# glove.twitter.27B-style file (--rows lines of --dim values with 5 decimals, about 7 bytes a value);
+# pass --text to convert a real one (e.g. glove.twitter.27B.100d.txt: 1.19M rows).
+#
+#   python benchmarks/bench_glove_text.py
+#   python benchmarks/bench_glove_text.py --rows 400000 --dim 100 --json glove_text.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+SEED = 1234
+
+RUN = """
+import resource, sys, time, tracemalloc
+sys.path.insert(0, {repo!r})
+import numpy as np
+tracemalloc.start()
+start = time.perf_counter()
+if {mode!r} == "streaming":
+    from glove_assets import convert_glove_text
+    convert_glove_text({text!r}, {store!r}, dim={dim}, block_rows={block_rows})
+else:
+    from glove_store import GloveStoreWriter
+    vectors = {{}}
+    with open({text!r}, encoding="utf-8") as f:
+        for line in f:
+            word, *values = line.rstrip().split(" ")
+            vectors.setdefault(word, np.asarray(values, dtype=np.float32))
+    writer = GloveStoreWriter({store!r}, len(vectors), len(vectors), {dim})
+    for row, (word, vector) in enumerate(vectors.items()):
+        writer.vectors[row] = vector
+        writer.add_word(word, row)
+    writer.close()
+print(time.perf_counter() - start, tracemalloc.get_traced_memory()[1], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def write_text(path, rows, dim, rng, block=10000):
+    with open(path, "w", encoding="utf-8") as f:
+        for start in range(0, rows, block):
+            count = min(block, rows - start)
+            values = rng.standard_normal((count, dim)).astype(np.float32)
+            f.writelines(
+                "w%d " % (start + offset) + " ".join("%.5f" % value for value in row) + "\n"
+                for offset, row in enumerate(values)
+            )
+
+
+def run(mode, text, store, dim, block_rows):
+    code = RUN.format(repo=REPO_ROOT, mode=mode, text=text, store=store, dim=dim, block_rows=block_rows)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    seconds, peak_heap, max_rss_kb = output.split()
+    return float(seconds), int(peak_heap) / 2**20, int(max_rss_kb) / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming GloVe text converter")
+    parser.add_argument("--text", help="real GloVe text file (default: a synthetic one)")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=100)
+    parser.add_argument("--block-rows", type=int, default=16384)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        text = args.text
+        if text is None:
+            text = os.path.join(directory, "glove.txt")
+            start = time.perf_counter()
+            write_text(text, args.rows, args.dim, np.random.default_rng(SEED))
+            print(f"synthetic text: {args.rows} rows x {args.dim} in {time.perf_counter() - start:.1f}s")
+        size_mb = os.path.getsize(text) / 2**20
+        results = {"text_mb": size_mb, "dim": args.dim, "block_rows": args.block_rows, "runs": {}}
+        print(f"{text}: {size_mb:.0f} MB")
+        for mode in ("streaming", "in-memory"):
+            seconds, heap_mb, rss_mb = run(mode, text, os.path.join(directory, mode + "_store"), args.dim, args.block_rows)
+            results["runs"][mode] = {
+                "seconds": seconds, "peak_heap_mb": heap_mb, "peak_rss_mb": rss_mb, "mb_per_s": size_mb / seconds,
+            }
+            print(f"  {mode:<10} {seconds:7.1f} s  {size_mb / seconds:6.1f} MB/s  "
+                  f"peak heap {heap_mb:7.1f} MB  peak RSS {rss_mb:7.1f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+### Batch sizes and queueing delay achieved by the MiniLM micro-batcher.
+# Simulates many concurrent sessions, each encoding one sentence at a time, and compares
+# direct batch-size-1 calls against MicroBatcher in front of the same encoder.
+#
+# By default the encoder is a cost model (fixed per-call overhead + per-item cost), so the script
+# runs without torch. Pass --real to use all-MiniLM-L6-v2 through sentence-transformers.
+#
+#   python benchmarks/bench_micro_batching.py --clients 32 --requests 20
+#   python benchmarks/bench_micro_batching.py --real --max-wait-ms 2 --json batching.json
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from micro_batching import MicroBatcher  # noqa: E402
+
+SENTENCES = [
+    "Roses are red, trucks are blue, and Seattle is grey right now",
+    "Chocolate milk",
+    "Milk chocolate",
+    "I am so happy today",
+    "The weather is terrible",
+]
+
+
+def make_cost_model(overhead_ms, per_item_ms, dim=384):
+    lock = threading.Lock()
+
+    def encode(sentences):
+        # the model is not reentrant: one forward pass at a time, like a CPU-bound torch model
+        with lock:
+            time.sleep((overhead_ms + per_item_ms * len(sentences)) / 1000.0)
+        return np.zeros((len(sentences), dim), dtype=np.float32)
+
+    return encode
+
+
+def make_real_model():
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    lock = threading.Lock()
+
+    def encode(sentences):
+        with lock:
+            return model.encode(sentences, batch_size=len(sentences))
+
+    return encode
+
+
+def run_clients(encode_one, clients, requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(index):
+        for request in range(requests):
+            start = time.perf_counter()
+            encode_one(SENTENCES[(index + request) % len(SENTENCES)])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000.0
+    return {
+        "throughput_per_s": len(latencies) / elapsed,
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sentence-transformer micro-batcher")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent sessions")
+    parser.add_argument("--requests", type=int, default=20, help="requests per session")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--overhead-ms", type=float, default=8.0, help="cost model: per-call overhead")
+    parser.add_argument("--per-item-ms", type=float, default=0.5, help="cost model: per-sentence cost")
+    parser.add_argument("--real", action="store_true", help="use all-MiniLM-L6-v2 instead of the cost model")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    encode = make_real_model() if args.real else make_cost_model(args.overhead_ms, args.per_item_ms)
+
+    direct = run_clients(lambda sentence: encode([sentence])[0], args.clients, args.requests)
+    batcher = MicroBatcher(encode, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    batched = run_clients(batcher.encode, args.clients, args.requests)
+    batched.update(batcher.stats())
+    batcher.close()
+
+    print(f"direct : {direct['throughput_per_s']:8.1f} req/s, p50 {direct['latency_ms_p50']:7.1f} ms, "
+          f"p95 {direct['latency_ms_p95']:7.1f} ms")
+    print(f"batched: {batched['throughput_per_s']:8.1f} req/s, p50 {batched['latency_ms_p50']:7.1f} ms, "
+          f"p95 {batched['latency_ms_p95']:7.1f} ms")
+    print(f"         mean batch size {batched['mean_batch_size']:.1f}, "
+          f"queue delay mean {batched['queue_delay_ms_mean']:.2f} ms / p95 {batched['queue_delay_ms_p95']:.2f} ms")
+    print(f"         batch sizes {batched['batch_sizes']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"direct": direct, "batched": batched}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+### Pairwise sentence similarity (pairwise.py) against the per-pair way of comparing sentences.
+# N synthetic sentences (a share of them duplicates) of random words from a synthetic GloVe store:
+#   per pair:   every sentence embedded on its own, every pair scored with the app's formula
+#               (np.dot over the two norms, one pair at a time); timed on --sample-rows rows and
+#               extrapolated to all N x N pairs
+#   matrix:     embed_unique (each unique sentence once, in batches) + similarity_matrix in blocks
+#   top-k:      embed_unique + similarity_top_k (only k neighbours per row are kept)
+# Reported: seconds, peak Python/numpy heap (tracemalloc) and, for top-k, agreement of the
+# neighbours with a full sort of the matrix rows on --sample-rows rows.
+#
+#   python benchmarks/bench_pairwise.py
+#   python benchmarks/bench_pairwise.py --sentences 50000 --top-k 10 --skip-matrix --json pairwise.json
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedders import GloveEncoder  # noqa: E402
+from glove_store import glove_store_path  # noqa: E402
+from load_service import synthetic_store  # noqa: E402
+from pairwise import embed_unique, similarity_matrix, similarity_top_k  # noqa: E402
+
+SEED = 1234
+
+
+def sentences(count, rng, duplicates=0.1):
+    texts = [" ".join("w%d" % index for index in row) for row in rng.integers(1000, 200000, size=(count, 8))]
+    for index in np.flatnonzero(rng.random(count) < duplicates):
+        texts[index] = texts[rng.integers(count)]
+    return texts
+
+
+def measured(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def per_pair(encoder, texts, rows):
+    vectors = [encoder.encode([text])[0] for text in texts]
+    scores = np.empty((rows, len(texts)), dtype=np.float32)
+    for i in range(rows):
+        for j in range(len(texts)):
+            norm = np.linalg.norm(vectors[i]) * np.linalg.norm(vectors[j])
+            scores[i, j] = np.dot(vectors[i], vectors[j]) / norm if norm else 0.0
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark blockwise pairwise sentence similarity")
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--model-type", default="50d")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--block-rows", type=int, default=1024)
+    parser.add_argument("--sample-rows", type=int, default=20, help="rows timed per pair and checked against a full sort")
+    parser.add_argument("--skip-matrix", action="store_true", help="only top-k (the full matrix is N x N float32)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(SEED)
+    texts = sentences(args.sentences, rng)
+    n = len(texts)
+    results = {"sentences": n, "unique": len(set(texts)), "top_k": args.top_k, "block_rows": args.block_rows}
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic_store(directory, args.model_type)
+        encoder = GloveEncoder(args.model_type, store_path=os.path.join(directory, glove_store_path(args.model_type)))
+        print(f"{n} sentences ({results['unique']} unique), GloVe {args.model_type}, blocks of {args.block_rows} rows")
+
+        start = time.perf_counter()
+        sample = per_pair(encoder, texts, args.sample_rows)
+        seconds = (time.perf_counter() - start) * n / args.sample_rows
+        results["per_pair"] = {"seconds_estimated": seconds}
+        print(f"  per pair  {seconds:9.1f} s (extrapolated from {args.sample_rows} rows)")
+
+        embeddings, embed_seconds, _ = measured(lambda: embed_unique(encoder.encode, texts))
+        results["embed_unique_seconds"] = embed_seconds
+        print(f"  embed_unique {embed_seconds:6.2f} s")
+
+        if not args.skip_matrix:
+            matrix, seconds, peak = measured(lambda: similarity_matrix(embeddings, block_rows=args.block_rows))
+            difference = float(np.max(np.abs(matrix[:args.sample_rows] - sample)))
+            results["matrix"] = {"seconds": embed_seconds + seconds, "peak_heap_mb": peak, "max_difference": difference}
+            print(f"  matrix    {embed_seconds + seconds:9.2f} s  peak heap {peak:8.1f} MB  "
+                  f"max difference to per pair {difference:.1e}")
+            del matrix
+
+        (scores, columns), seconds, peak = measured(
+            lambda: similarity_top_k(embeddings, k=args.top_k, block_rows=args.block_rows)
+        )
+        # reference: full sort of the sampled rows, without the row itself
+        reference = np.argsort(-sample, axis=1, kind="stable")
+        agreement = np.mean([
+            len(set(columns[row]) & set([column for column in reference[row] if column != row][:args.top_k])) / args.top_k
+            for row in range(args.sample_rows)
+        ])
+        results["top_k"] = {"seconds": embed_seconds + seconds, "peak_heap_mb": peak, "agreement": float(agreement)}
+        print(f"  top-{args.top_k:<5} {embed_seconds + seconds:9.2f} s  peak heap {peak:8.1f} MB  "
+              f"neighbour agreement with a full sort {agreement:.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+### Memory and top-1 agreement of reduced-precision category scoring (float16 / int8).
+# For each of the four models the categories and a set of query sentences are embedded, ranked with
+# today's per-category cosine_similarity loop (float64) and with CategoryScorer at float32 / float16 /
+# int8, with and without full-precision reranking of the top candidates.
+#
+# GloVe uses the real glove_50d store when it exists (synthetic otherwise), the sentence transformer
+# the real all-MiniLM-L6-v2 when it can be loaded, and the OpenAI models the deterministic vectors of
+# openai_stub_server (no API key needed). Vectors that are not from the real model are marked as such.
+#
+#   python benchmarks/bench_quantized.py
+#   python benchmarks/bench_quantized.py --categories 1000 --queries 2000 --json quantized.json
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "off")
+
+import numpy as np  # noqa: E402
+
+from glove_batch import GloveBatchEncoder  # noqa: E402
+from glove_store import GloveStoreWriter, glove_store_exists, glove_store_path, load_glove_store  # noqa: E402
+from openai_stub_server import stub_embedding  # noqa: E402
+from quantized_vectors import PRECISIONS, QuantizedMatrix  # noqa: E402
+from scoring import CategoryScorer  # noqa: E402
+
+SEED = 1234
+VOCAB_SIZE = 5000
+RERANK = 10
+
+
+def synthetic_glove(directory, dim):
+    rng = np.random.default_rng(SEED)
+    path = os.path.join(directory, "glove_bench_store")
+    writer = GloveStoreWriter(path, VOCAB_SIZE, VOCAB_SIZE, dim)
+    writer.vectors[:] = rng.standard_normal((VOCAB_SIZE, dim), dtype=np.float32)
+    for row in range(VOCAB_SIZE):
+        writer.add_word("w%d" % row, row)
+    writer.close()
+    return load_glove_store(path)
+
+
+def model_encoders(directory):
+    """
+    (model, source, encode(texts) -> float64 matrix, words) for the four models
+    """
+    real_path = os.path.join(REPO_ROOT, glove_store_path("50d"))
+    if glove_store_exists(real_path):
+        store, glove_source = load_glove_store(real_path), "glove"
+        words = [store.word(entry) for entry in range(min(VOCAB_SIZE, len(store)))]
+    else:
+        store, glove_source = synthetic_glove(directory, 50), "synthetic"
+        words = ["w%d" % row for row in range(VOCAB_SIZE)]
+    glove = GloveBatchEncoder(store, store.embeddings)
+    yield "glove_50d", glove_source, lambda texts: glove.encode(texts).astype(np.float64), words
+
+    try:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer("all-MiniLM-L6-v2")
+        yield "sentence_transformer_384", "all-MiniLM-L6-v2", lambda texts: model.encode(texts).astype(np.float64), words
+    except Exception:
+        yield "sentence_transformer_384", "stub", lambda texts: stub_texts(texts, "all-MiniLM-L6-v2", 384), words
+
+    yield "openai_small_1536", "stub", lambda texts: stub_texts(texts, "text-embedding-3-small"), words
+    yield "openai_large_3072", "stub", lambda texts: stub_texts(texts, "text-embedding-3-large"), words
+
+
+def stub_texts(texts, model_name, dimensions=None):
+    # today's code keeps API vectors as float64 (np.array of the JSON floats)
+    return np.array([stub_embedding(text, model_name, dimensions) for text in texts], dtype=np.float64)
+
+
+def baseline_top1(cosine_similarity, category_vectors, query_vectors):
+    """
+    Best category per query with the app's per-category cosine_similarity loop
+    """
+    top1 = []
+    for query in query_vectors:
+        scores = [cosine_similarity(query, category) for category in category_vectors]
+        top1.append(int(np.argmax(scores)))
+    return np.array(top1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float16 / int8 category scoring")
+    parser.add_argument("--categories", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--words-per-query", type=int, default=8)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    import miniproject_1_student as app
+
+    rng = np.random.default_rng(SEED)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for model, source, encode, words in model_encoders(directory):
+            picks = rng.choice(len(words), args.categories + args.queries * args.words_per_query)
+            categories = [words[index] for index in picks[:args.categories]]
+            queries = [
+                " ".join(words[index] for index in picks[args.categories + start:args.categories + start + args.words_per_query])
+                for start in range(0, args.queries * args.words_per_query, args.words_per_query)
+            ]
+            category_vectors = encode(categories)
+            query_vectors = encode(queries)
+            truth = baseline_top1(app.cosine_similarity, category_vectors, query_vectors)
+
+            dim = category_vectors.shape[1]
+            result = {
+                "source": source,
+                "dim": dim,
+                "float64_bytes_per_vector": dim * 8,
+                "float64_matrix_bytes": int(category_vectors.nbytes),
+                "precisions": {},
+            }
+            print(f"{model} ({source}), {args.categories} categories, {args.queries} queries, float64 matrix {category_vectors.nbytes / 1024:.0f} KB")
+            for precision in PRECISIONS:
+                nbytes = QuantizedMatrix(category_vectors[:1], precision).nbytes
+                entry = {"bytes_per_vector": nbytes, "memory_saved": 1.0 - nbytes / (dim * 8.0)}
+                for rerank in (0, RERANK) if precision != "float32" else (0,):
+                    scorer = CategoryScorer(category_vectors, precision=precision, rerank=rerank)
+                    start = time.perf_counter()
+                    rankings = scorer.top_k_batch(query_vectors, 1)
+                    elapsed = time.perf_counter() - start
+                    agreement = float(np.mean(np.array([ranking[0][0] for ranking in rankings]) == truth))
+                    entry["rerank_%d" % rerank] = {"top1_agreement": agreement, "ms_per_query": elapsed * 1000.0 / len(queries)}
+                    print(
+                        f"  {precision:>7} rerank={rerank:<3} {nbytes:7d} B/vector "
+                        f"({entry['memory_saved']:6.1%} saved)  top-1 agreement {agreement:.4f}  "
+                        f"{elapsed * 1000.0 / len(queries):.3f} ms/query"
+                    )
+                result["precisions"][precision] = entry
+            results[model] = result
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
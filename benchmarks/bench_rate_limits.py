@@ -0,0 +1,130 @@
+### OpenAI client behaviour under throttling, against the local stub server's 429 schedules.
+# Threads embed one sentence per request in a loop, like concurrent sessions, for --duration seconds.
+#   baseline: the old client, OpenAI() with the SDK's default retries; a failed request becomes a zero
+#             vector (what get_openai_embeddings used to return), i.e. a wrong answer
+#   limited:  openai_limits.build_openai_client (budgets, AIMD concurrency, jittered backoff that
+#             honours Retry-After); a request that stays throttled raises RateLimited and is reported
+# Scenarios:
+#   windows:  every request is answered 429 during two windows in which the request budget is used up;
+#             Retry-After is 0.5s, shorter than the windows (the limit persists across retries)
+#   capacity: 429 (Retry-After 0.5s) whenever more than --capacity requests are in flight
+#
+#   python benchmarks/bench_rate_limits.py
+#   python benchmarks/bench_rate_limits.py --threads 32 --duration 10 --json rate_limits.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from openai_limits import RateLimited, build_openai_client  # noqa: E402
+from openai_stub_server import StubEmbeddingsServer, throttle_above, throttle_windows  # noqa: E402
+
+SEED = 1234
+MODEL = "text-embedding-3-small"
+WORDS = "roses are red trucks blue seattle grey weather sunny flowers chocolate milk warm cup".split()
+
+
+def run_clients(client, threads, duration):
+    """
+    Drive client from threads for duration seconds; returns per-request outcomes and latencies
+    """
+    outcomes = {"ok": 0, "zero_vector": 0, "rate_limited": 0}
+    latencies = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(SEED + index)
+        while time.perf_counter() < stop:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(6))
+            start = time.perf_counter()
+            try:
+                client.embeddings.create(input=sentence, model=MODEL)
+                outcome = "ok"
+            except RateLimited:
+                outcome = "rate_limited"
+            except Exception:
+                # the old get_openai_embeddings logged the error and returned np.zeros(1536)
+                outcome = "zero_vector"
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    latencies = np.array(latencies) * 1000.0
+    return dict(
+        outcomes,
+        latency_ms_p50=float(np.percentile(latencies, 50)) if len(latencies) else None,
+        latency_ms_p95=float(np.percentile(latencies, 95)) if len(latencies) else None,
+    )
+
+
+def run_scenario(throttle_if, args):
+    results = {}
+    for mode in ("baseline", "limited"):
+        with StubEmbeddingsServer(latency=args.latency_ms / 1000.0, throttle_if=throttle_if) as server:
+            if mode == "baseline":
+                from openai import OpenAI
+
+                client = OpenAI(api_key="benchmark", base_url=server.base_url)
+            else:
+                client = build_openai_client(api_key="benchmark", base_url=server.base_url)
+            start = time.perf_counter()
+            result = run_clients(client, args.threads, args.duration)
+            result["wall_s"] = time.perf_counter() - start
+            result["backend_requests"] = len(server.requests)
+            result["backend_429s"] = server.throttled
+            if mode == "limited":
+                result["client"] = client.stats()
+        results[mode] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OpenAI client under 429 throttling")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=6.0, help="seconds of load per run")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub backend latency")
+    parser.add_argument("--capacity", type=int, default=4, help="concurrent requests the capacity scenario allows")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    scenarios = {
+        "windows": throttle_windows([(1.0, 3.0), (4.0, 4.5)], retry_after=0.5),
+        "capacity": throttle_above(args.capacity),
+    }
+    results = {}
+    for name, throttle_if in scenarios.items():
+        results[name] = run_scenario(throttle_if, args)
+        for mode, result in results[name].items():
+            print(
+                f"{name:<9} {mode:<9} ok {result['ok']:5d}  zero vectors {result['zero_vector']:4d}  "
+                f"reported throttled {result['rate_limited']:4d}  backend {result['backend_requests']:5d} requests "
+                f"({result['backend_429s']} x 429)  p50 {result['latency_ms_p50'] or 0:.0f} ms  "
+                f"p95 {result['latency_ms_p95'] or 0:.0f} ms"
+            )
+        client = results[name]["limited"]["client"]
+        print(f"{'':<9} limited: {client['retries']} retries, concurrency limit {client['concurrency_limit']:.1f} "
+              f"after {client['concurrency_decreases']} decreases")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
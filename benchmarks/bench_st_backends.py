@@ -0,0 +1,133 @@
+### Parity and CPU throughput of the sentence-transformer inference backends (st_inference.py).
+# Every backend encodes the same corpus of sentences of mixed length (3 to 80 words):
+#   parity:      cosine similarity of each embedding to the current one (torch fp32, the whole
+#                micro-batch padded to its longest sentence, as the app encoded before), and
+#                agreement of the category ranking with the app's five categories
+#   throughput:  sentences per second one at a time (batch 1, like single queries) and in
+#                micro-batches of --batch-size, with and without length bucketing
+# The check fails (exit status 1) when a backend's lowest cosine is below --min-cosine or its
+# top-1 category disagrees with the reference on more than --max-top1-disagreement of the sentences.
+# Thread settings apply to every backend (torch fixes the inter-op pool once per process).
+#
+#   python benchmarks/bench_st_backends.py
+#   python benchmarks/bench_st_backends.py --backends torch torch-int8 onnx-int8 --intra-op-threads 4 --json st.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from scoring import CategoryScorer, normalize_rows  # noqa: E402
+from st_inference import BACKENDS, DEFAULT_LENGTH_BUCKETS, encode_bucketed, load_sentence_transformer  # noqa: E402
+
+SEED = 1234
+MODEL = "all-MiniLM-L6-v2"
+CATEGORIES = "Flowers Colors Cars Weather Food".split()
+WORDS = (
+    "roses are red trucks blue and seattle is grey right now the weather sunny flowers blooming "
+    "i would like a warm cup of chocolate milk cars drive fast on rainy roads food tastes good "
+    "anger joy sad frustration worry happiness positive negative market prices rose sharply today"
+).split()
+
+
+def corpus(count, rng):
+    # mostly short queries with a tail of long ones, like search input
+    lengths = [rng.randint(3, 12) if rng.random() < 0.75 else rng.randint(12, 80) for _ in range(count)]
+    return [" ".join(rng.choice(WORDS) for _ in range(length)) for length in lengths]
+
+
+def encode_batches(model, sentences, batch_size, length_buckets):
+    return np.concatenate([
+        encode_bucketed(model, sentences[start:start + batch_size], length_buckets)
+        for start in range(0, len(sentences), batch_size)
+    ])
+
+
+def throughput(fn, count, min_seconds=1.0):
+    """
+    Items per second of fn() (which processes count items), repeated for at least min_seconds
+    """
+    fn()
+    runs, start = 0, time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return runs * count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and throughput of the sentence-transformer backends")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--sentences", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32, help="micro-batch size (ST_BATCH_MAX_SIZE)")
+    parser.add_argument("--single", type=int, default=64, help="sentences timed one at a time")
+    parser.add_argument("--intra-op-threads", type=int, default=None)
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--max-top1-disagreement", type=float, default=0.02)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    sentences = corpus(args.sentences, random.Random(SEED))
+    threads = {"intra_op_threads": args.intra_op_threads, "inter_op_threads": args.inter_op_threads}
+    reference_model = load_sentence_transformer(MODEL, "torch", **threads)
+    reference = normalize_rows(encode_batches(reference_model, sentences, args.batch_size, None))
+    reference_top1 = CategoryScorer(encode_bucketed(reference_model, CATEGORIES, None)).top_k_batch(reference, 1)
+    print(f"{len(sentences)} sentences, micro-batches of {args.batch_size}, threads {threads}")
+
+    results = {"sentences": len(sentences), "batch_size": args.batch_size, "threads": threads, "backends": {}}
+    failed = []
+    for backend in args.backends:
+        try:
+            model = reference_model if backend == "torch" else load_sentence_transformer(MODEL, backend, **threads)
+        except Exception as e:
+            print(f"  {backend:<11} unavailable: {e}")
+            results["backends"][backend] = {"error": str(e)}
+            continue
+        embeddings = normalize_rows(encode_batches(model, sentences, args.batch_size, DEFAULT_LENGTH_BUCKETS))
+        cosines = np.sum(embeddings * reference, axis=1)
+        top1 = CategoryScorer(encode_bucketed(model, CATEGORIES, None)).top_k_batch(embeddings, 1)
+        disagreement = float(np.mean([a[0][0] != b[0][0] for a, b in zip(top1, reference_top1)]))
+        result = {
+            "min_cosine": float(cosines.min()),
+            "mean_cosine": float(cosines.mean()),
+            "top1_disagreement": disagreement,
+            "single_per_s": throughput(
+                lambda: [encode_bucketed(model, [sentence], None) for sentence in sentences[:args.single]], args.single
+            ),
+            "batched_per_s": throughput(
+                lambda: encode_batches(model, sentences, args.batch_size, None), len(sentences)
+            ),
+            "bucketed_per_s": throughput(
+                lambda: encode_batches(model, sentences, args.batch_size, DEFAULT_LENGTH_BUCKETS), len(sentences)
+            ),
+        }
+        result["parity"] = result["min_cosine"] >= args.min_cosine and disagreement <= args.max_top1_disagreement
+        if not result["parity"]:
+            failed.append(backend)
+        results["backends"][backend] = result
+        print(
+            f"  {backend:<11} cosine min {result['min_cosine']:.5f} mean {result['mean_cosine']:.5f}  "
+            f"top-1 disagreement {disagreement:.3f}  {'ok' if result['parity'] else 'FAILED'}   "
+            f"batch 1 {result['single_per_s']:7.1f}/s  batched {result['batched_per_s']:7.1f}/s  "
+            f"bucketed {result['bucketed_per_s']:7.1f}/s"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        sys.exit(f"Parity check failed for {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
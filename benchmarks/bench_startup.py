@@ -0,0 +1,136 @@
+### App startup: import time and time-to-first-result, each measured in a fresh interpreter.
+#   import:  `import miniproject_1_student` with lazy heavy imports, and with sentence_transformers,
+#            openai, gdown and matplotlib imported up front (how the module used to behave)
+#   first result: GloVe and sentence-transformer rankings for one query, run in Streamlit bare mode
+#            - cold:    the query arrives right after import and loads every model itself
+#            - warm-up: start_model_warm_up() runs right after import and the query arrives after
+#                       --think-time seconds (a user typing), so only the query latency is left
+# Uses the real glove_<type>_store when it exists in the repo, otherwise a small synthetic store.
+#
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --repeat 5 --think-time 5 --json startup.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from glove_store import GloveStoreWriter, glove_store_exists, glove_store_path  # noqa: E402
+
+SEED = 1234
+HEAVY_MODULES = ("sentence_transformers", "torch", "openai", "gdown", "matplotlib")
+CATEGORIES = "Flowers Colors Cars Weather Food"
+SENTENCE = "Roses are red, trucks are blue, and Seattle is grey right now"
+
+CHILD = r"""
+import json, os, sys, time
+start = time.perf_counter()
+if {eager}:
+    for module in ("sentence_transformers", "openai", "gdown", "matplotlib.pyplot"):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+import streamlit as st
+import miniproject_1_student as app
+result = {{"import_s": time.perf_counter() - start, "heavy_modules": [m for m in {heavy!r} if m in sys.modules]}}
+if {scenario!r} != "import":
+    st.session_state.categories = {categories!r}
+    st.session_state.text_search = {sentence!r}
+    if {scenario!r} == "warm-up":
+        app.start_model_warm_up({model_type!r})
+        time.sleep({think_time})
+    submitted = time.perf_counter()
+    word_index_dict, embeddings = app.load_glove_embeddings_gdrive({model_type!r})
+    app.get_sorted_cosine_similarity({{"embedding_model": "glove", "word_index_dict": word_index_dict,
+                                      "embeddings": embeddings, "model_type": {model_type!r}}})
+    result["glove_result_s"] = time.perf_counter() - submitted
+    try:
+        app.get_sorted_cosine_similarity({{"embedding_model": "transformers", "model_name": "all-MiniLM-L6-v2"}})
+        result["transformer_result_s"] = time.perf_counter() - submitted
+    except Exception as e:
+        result["transformer_error"] = repr(e)
+    result["since_start_s"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def synthetic_store(directory, model_type, vocab_size=200000):
+    dim = int(model_type.rstrip("d"))
+    rng = np.random.default_rng(SEED)
+    words = sorted({word.strip(",").lower() for word in (CATEGORIES + " " + SENTENCE).split()})
+    writer = GloveStoreWriter(os.path.join(directory, glove_store_path(model_type)), vocab_size, vocab_size, dim)
+    writer.vectors[:] = rng.standard_normal((vocab_size, dim), dtype=np.float32)
+    for row, word in enumerate(words):
+        writer.add_word(word, row)
+    for row in range(len(words), vocab_size):
+        writer.add_word("w%d" % row, row)
+    writer.close()
+
+
+def run_child(cwd, scenario, eager, model_type, think_time):
+    code = CHILD.format(
+        eager=eager, heavy=HEAVY_MODULES, scenario=scenario, categories=CATEGORIES,
+        sentence=SENTENCE, model_type=model_type, think_time=think_time,
+    )
+    env = dict(os.environ, EMBEDDING_CACHE_PATH="off", PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])))
+    output = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    summary = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples if key in sample]
+        summary[key] = statistics.median(values) if isinstance(values[0], float) else values[0]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app import time and time-to-first-result")
+    parser.add_argument("--model-type", default="50d")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--think-time", type=float, default=3.0, help="seconds between page load and query (warm-up)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if glove_store_exists(os.path.join(REPO_ROOT, glove_store_path(args.model_type))):
+            cwd = REPO_ROOT
+        else:
+            synthetic_store(directory, args.model_type)
+            cwd = directory
+        runs = [
+            ("import/eager", "import", True),
+            ("import/lazy", "import", False),
+            ("first_result/cold", "cold", False),
+            ("first_result/warm-up", "warm-up", False),
+        ]
+        for name, scenario, eager in runs:
+            samples = [run_child(cwd, scenario, eager, args.model_type, args.think_time) for _ in range(args.repeat)]
+            results[name] = summarize(samples)
+            line = f"{name:<22} import {results[name]['import_s'] * 1000:8.1f} ms"
+            if "glove_result_s" in results[name]:
+                line += f"   GloVe result {results[name]['glove_result_s'] * 1000:8.1f} ms"
+            if "transformer_result_s" in results[name]:
+                line += f"   MiniLM result {results[name]['transformer_result_s'] * 1000:8.1f} ms"
+            elif "transformer_error" in results[name]:
+                line += f"   MiniLM failed: {results[name]['transformer_error']}"
+            print(line + f"   heavy modules: {', '.join(results[name]['heavy_modules']) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+### Recall@k and QPS of the approximate IVF index against exact search.
+# By default the corpus is synthetic clustered data (seeded), which behaves like sentence embeddings
+# much better than uniform noise. With --corpus the documents of a JSONL/CSV file are embedded with
+# one of the app's model families instead, and a sample of them is used as queries.
+#
+#   python benchmarks/bench_vector_index.py --size 200000 --dim 384
+#   python benchmarks/bench_vector_index.py --corpus docs.jsonl --model glove_50d --json index.json
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import ExactIndex, IVFIndex  # noqa: E402
+
+SEED = 1234
+
+
+def synthetic_corpus(size, dim, clusters, num_queries):
+    rng = np.random.default_rng(SEED)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    corpus = centers[rng.integers(0, clusters, size)] + 0.6 * rng.standard_normal((size, dim), dtype=np.float32)
+    queries = corpus[rng.choice(size, num_queries, replace=False)] + 0.2 * rng.standard_normal((num_queries, dim), dtype=np.float32)
+    return corpus, queries
+
+
+def embedded_corpus(path, model_family, num_queries):
+    from classify import read_records
+    from embedders import get_encoder
+
+    encoder = get_encoder(model_family)
+    texts = [text for _, text in read_records(path)]
+    corpus = np.concatenate([encoder.encode(texts[start:start + 1024]) for start in range(0, len(texts), 1024)])
+    rng = np.random.default_rng(SEED)
+    queries = corpus[rng.choice(len(corpus), min(num_queries, len(corpus)), replace=False)]
+    return corpus, queries
+
+
+def timed_search(index, queries, k, **kwargs):
+    index.search(queries[:10], k, **kwargs)
+    start = time.perf_counter()
+    _, ids = index.search(queries, k, **kwargs)
+    return ids, len(queries) / (time.perf_counter() - start)
+
+
+def recall_at_k(truth, found):
+    k = truth.shape[1]
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark approximate vs exact vector search")
+    parser.add_argument("--size", type=int, default=200000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimension")
+    parser.add_argument("--clusters", type=int, default=1000, help="synthetic topic clusters")
+    parser.add_argument("--corpus", help="JSONL/CSV documents to embed instead of synthetic data")
+    parser.add_argument("--model", default="glove_50d", help="model family for --corpus")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF buckets (default: 4 * sqrt(n))")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64", help="comma separated nprobe values")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus, queries = embedded_corpus(args.corpus, args.model, args.queries)
+    else:
+        corpus, queries = synthetic_corpus(args.size, args.dim, args.clusters, args.queries)
+    nlist = args.nlist or int(4 * np.sqrt(len(corpus)))
+    print(f"corpus {corpus.shape}, {len(queries)} queries, k={args.k}, nlist={nlist}")
+
+    exact = ExactIndex(corpus.shape[1])
+    exact.add(corpus)
+    truth, exact_qps = timed_search(exact, queries, args.k)
+    print(f"exact          recall@{args.k} 1.000  {exact_qps:10.1f} QPS")
+
+    start = time.perf_counter()
+    ivf = IVFIndex(corpus.shape[1], nlist=nlist)
+    rng = np.random.default_rng(SEED)
+    ivf.train(corpus[rng.choice(len(corpus), min(len(corpus), 50 * nlist), replace=False)])
+    train_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for chunk in range(0, len(corpus), 65536):
+        ivf.add(corpus[chunk:chunk + 65536])
+    add_s = time.perf_counter() - start
+    print(f"IVF train {train_s:.2f}s, add {add_s:.2f}s")
+
+    results = {
+        "corpus_size": len(corpus),
+        "dim": int(corpus.shape[1]),
+        "k": args.k,
+        "nlist": nlist,
+        "exact_qps": exact_qps,
+        "ivf_train_s": train_s,
+        "ivf_add_s": add_s,
+        "ivf": [],
+    }
+    for nprobe in (int(value) for value in args.nprobe.split(",")):
+        found, qps = timed_search(ivf, queries, args.k, nprobe=nprobe)
+        recall = recall_at_k(truth, found)
+        results["ivf"].append({"nprobe": nprobe, "recall": recall, "qps": qps, "speedup": qps / exact_qps})
+        print(f"IVF nprobe={nprobe:<4} recall@{args.k} {recall:.3f}  {qps:10.1f} QPS  ({qps / exact_qps:5.1f}x)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+### Multi-process memory check for GloVe residency modes.
+# Starts --workers processes that each open the GloVe store, read every vector and look up words,
+# then (all still alive) report RSS, PSS (shared pages split between the processes mapping them)
+# and USS (pages private to the process) from /proc/self/smaps_rollup.
+#   private: each worker copies the matrix into its own memory (like the old np.load of the .npy)
+#   mmap:    the memory-mapped store on disk (page cache shared by the OS)
+#   shared:  GLOVE_SHARED_MEMORY=1, one copy in /dev/shm attached by every worker (glove_shared.py)
+# The check fails (exit status 1) if shared workers hold more than 10% of the matrix privately, if
+# the shared mode's total PSS is not well below the private mode's, or if the shared copy is still
+# in /dev/shm after the last worker has exited.
+#
+#   python benchmarks/check_shared_glove.py
+#   python benchmarks/check_shared_glove.py --workers 8 --vocab-size 1193514 --json shared.json
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from glove_shared import SHM_ROOT, shared_store_name  # noqa: E402
+from glove_store import GloveStoreWriter, glove_store_exists, glove_store_path  # noqa: E402
+
+SEED = 1234
+MODES = ("private", "mmap", "shared")
+
+
+def synthetic_store(directory, model_type, vocab_size):
+    dim = int(model_type.rstrip("d"))
+    rng = np.random.default_rng(SEED)
+    path = os.path.join(directory, glove_store_path(model_type))
+    writer = GloveStoreWriter(path, vocab_size, vocab_size, dim)
+    for start in range(0, vocab_size, 65536):
+        rows = min(65536, vocab_size - start)
+        writer.vectors[start:start + rows] = rng.standard_normal((rows, dim), dtype=np.float32)
+    for row in range(vocab_size):
+        writer.add_word("w%d" % row, row)
+    writer.close()
+    return path
+
+
+def memory_mb():
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    return {
+        "rss_mb": values["Rss"],
+        "pss_mb": values["Pss"],
+        "uss_mb": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def worker(mode, store_path, barrier, results):
+    if mode == "shared":
+        os.environ["GLOVE_SHARED_MEMORY"] = "1"
+    from glove_shared import open_glove_store
+
+    store = open_glove_store(store_path)
+    embeddings = np.array(store.embeddings) if mode == "private" else store.embeddings
+    total = 0.0
+    for start in range(0, len(embeddings), 65536):
+        total += float(np.asarray(embeddings[start:start + 65536]).sum())
+    found = sum(store.get("w%d" % row) is not None for row in range(0, len(store), 97))
+    barrier.wait()
+    results.put(dict(memory_mb(), found=found))
+    barrier.wait()
+
+
+def run_mode(mode, store_path, workers):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, store_path, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get(timeout=600) for _ in processes]
+    for process in processes:
+        process.join()
+    return {
+        "workers": workers,
+        "total_rss_mb": sum(sample["rss_mb"] for sample in samples),
+        "total_pss_mb": sum(sample["pss_mb"] for sample in samples),
+        "mean_uss_mb": sum(sample["uss_mb"] for sample in samples) / workers,
+        "exit_codes": [process.exitcode for process in processes],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check GloVe memory use across worker processes")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--model-type", default="50d")
+    parser.add_argument("--vocab-size", type=int, default=400000, help="synthetic vocabulary size")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(REPO_ROOT, glove_store_path(args.model_type))
+        if not glove_store_exists(store_path):
+            store_path = synthetic_store(directory, args.model_type, args.vocab_size)
+        matrix_mb = os.path.getsize(os.path.join(store_path, "vectors.npy")) / 2**20
+        print(f"store {store_path}: vectors {matrix_mb:.0f} MB, {args.workers} workers")
+        for mode in MODES:
+            results[mode] = run_mode(mode, store_path, args.workers)
+            print(
+                f"{mode:<8} total RSS {results[mode]['total_rss_mb']:7.0f} MB   total PSS {results[mode]['total_pss_mb']:7.0f} MB"
+                f"   private per worker {results[mode]['mean_uss_mb']:6.0f} MB"
+            )
+        leftover = os.path.exists(os.path.join(SHM_ROOT, shared_store_name(store_path)))
+
+    checks = {
+        "shared workers keep < 10% of the matrix private": results["shared"]["mean_uss_mb"] - results["mmap"]["mean_uss_mb"] < 0.1 * matrix_mb,
+        "shared total PSS below private total PSS": results["shared"]["total_pss_mb"] < results["private"]["total_pss_mb"] - 0.5 * (args.workers - 1) * matrix_mb,
+        "shared copy removed after the last worker exited": not leftover,
+        "all workers exited cleanly": all(code == 0 for result in results.values() for code in result["exit_codes"]),
+    }
+    for name, ok in checks.items():
+        print(("PASS " if ok else "FAIL ") + name)
+    results["checks"] = checks
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+### Load generator for the HTTP classification service (classify_service.py).
+# Opens --connections keep-alive connections and sends POST /v1/classify requests for --duration
+# seconds, then reports p50/p95/p99 latency, requests per second and the responses by status.
+#   closed loop (default): every connection sends its next request as soon as the previous answer arrives
+#   open loop (--rate):    requests are issued on a fixed schedule and latency is measured from the
+#                          scheduled time, so a server that falls behind shows up in the percentiles
+# Without --url a service is started in a subprocess (on the real glove_<type>_store when it exists
+# in the repo, otherwise on a small synthetic store) and its batching and rejection counters are
+# included in the report.
+#
+#   python benchmarks/load_service.py
+#   python benchmarks/load_service.py --connections 64 --texts-per-request 4 --json load.json
+#   python benchmarks/load_service.py --url http://127.0.0.1:8080 --model sentence_transformer_384 --rate 200
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from urllib.parse import urlsplit
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from glove_store import GloveStoreWriter, glove_store_exists, glove_store_path  # noqa: E402
+
+SEED = 1234
+CATEGORIES = "Flowers Colors Cars Weather Food"
+WORDS = (
+    "roses are red trucks blue and seattle is grey right now the weather sunny flowers blooming "
+    "i would like a warm cup of chocolate milk cars drive fast on rainy roads food tastes good"
+).split()
+
+
+def synthetic_store(directory, model_type, vocab_size=200000):
+    dim = int(model_type.rstrip("d"))
+    rng = np.random.default_rng(SEED)
+    words = sorted(set(WORDS) | {label.lower() for label in CATEGORIES.split()})
+    writer = GloveStoreWriter(os.path.join(directory, glove_store_path(model_type)), vocab_size, vocab_size, dim)
+    writer.vectors[:] = rng.standard_normal((vocab_size, dim), dtype=np.float32)
+    for row, word in enumerate(words):
+        writer.add_word(word, row)
+    for row in range(len(words), vocab_size):
+        writer.add_word("w%d" % row, row)
+    writer.close()
+
+
+def request_bodies(model, texts_per_request, count, rng):
+    """
+    Encoded POST bodies with random sentences (reused round-robin by the connections)
+    """
+    bodies = []
+    for _ in range(count):
+        texts = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))) for _ in range(texts_per_request)]
+        bodies.append(json.dumps({"model": model, "categories": CATEGORIES, "texts": texts}).encode("utf-8"))
+    return bodies
+
+
+class Connection:
+    """
+    Minimal HTTP/1.1 keep-alive client connection
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.opened = 0
+
+    async def request(self, method, path, body=b""):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.opened += 1
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        self.writer.write(head.encode("latin-1") + body)
+        try:
+            response = await self.reader.readuntil(b"\r\n\r\n")
+            lines = response.decode("latin-1").split("\r\n")
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            payload = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.close()
+            raise
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return int(lines[0].split(" ", 2)[1]), payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def get_json(host, port, path):
+    connection = Connection(host, port)
+    try:
+        status, payload = await connection.request("GET", path)
+        return json.loads(payload) if status == 200 else None
+    finally:
+        connection.close()
+
+
+async def run_load(host, port, bodies, args):
+    latencies = []
+    statuses = collections.Counter()
+    connections = [Connection(host, port) for _ in range(args.connections)]
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    stop = start + args.duration
+    schedule = asyncio.Queue()
+
+    async def send(connection, body, issued):
+        try:
+            status, _ = await connection.request("POST", "/v1/classify", body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            status = "connection error"
+        statuses[status] += 1
+        if status == 200:
+            latencies.append(loop.time() - issued)
+
+    async def closed_loop(index, connection):
+        sent = 0
+        while loop.time() < stop:
+            await send(connection, bodies[(index + sent * args.connections) % len(bodies)], loop.time())
+            sent += 1
+
+    async def open_loop(connection):
+        while True:
+            issued, body = await schedule.get()
+            if issued is None:
+                return
+            await send(connection, body, issued)
+
+    async def scheduler():
+        interval = 1.0 / args.rate
+        for index in range(int(args.duration * args.rate)):
+            issued = start + index * interval
+            await asyncio.sleep(max(0.0, issued - loop.time()))
+            schedule.put_nowait((issued, bodies[index % len(bodies)]))
+        for _ in connections:
+            schedule.put_nowait((None, None))
+
+    if args.rate:
+        await asyncio.gather(scheduler(), *(open_loop(connection) for connection in connections))
+    else:
+        await asyncio.gather(*(closed_loop(index, connection) for index, connection in enumerate(connections)))
+    elapsed = loop.time() - start
+    for connection in connections:
+        connection.close()
+
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        "mode": "open loop %g req/s" % args.rate if args.rate else "closed loop",
+        "connections": args.connections,
+        "connections_opened": sum(connection.opened for connection in connections),
+        "texts_per_request": args.texts_per_request,
+        "elapsed_s": elapsed,
+        "requests": sum(statuses.values()),
+        "ok": statuses[200],
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "requests_per_s": statuses[200] / elapsed,
+        "texts_per_s": statuses[200] * args.texts_per_request / elapsed,
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)) if len(latencies_ms) else None,
+        "latency_ms_p99": float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+        "latency_ms_max": float(latencies_ms.max()) if len(latencies_ms) else None,
+    }
+
+
+def start_service(directory, args):
+    """
+    Start classify_service.py in a subprocess; returns (process, host, port)
+    """
+    cwd = REPO_ROOT
+    if args.model.startswith("glove_"):
+        model_type = args.model.split("_", 1)[1]
+        if not glove_store_exists(os.path.join(REPO_ROOT, glove_store_path(model_type))):
+            synthetic_store(directory, model_type)
+            cwd = directory
+    command = [
+        sys.executable, os.path.join(REPO_ROOT, "classify_service.py"), "--models", args.model, "--port", "0",
+        "--max-batch-size", str(args.max_batch_size), "--max-wait-ms", str(args.max_wait_ms),
+        "--max-pending", str(args.max_pending),
+    ]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])))
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Serving"):
+        process.kill()
+        raise RuntimeError(f"classify_service.py did not start (exit status {process.wait()})")
+    address = urlsplit(line.rsplit(" ", 1)[1].strip())
+    return process, address.hostname, address.port
+
+
+async def measure(host, port, args):
+    bodies = request_bodies(args.model, args.texts_per_request, 1024, random.Random(SEED))
+    before = await get_json(host, port, "/stats")
+    result = await run_load(host, port, bodies, args)
+    after = await get_json(host, port, "/stats")
+    if before and after and args.model in after["models"]:
+        stats, previous = after["models"][args.model], before["models"][args.model]
+        batches = stats["batches"] - previous["batches"]
+        result["server"] = {
+            "batches": batches,
+            "mean_batch_size": (stats["texts"] - previous["texts"]) / batches if batches else 0.0,
+            "rejected": stats["rejected"] - previous["rejected"],
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against the classification service")
+    parser.add_argument("--url", help="running service, e.g. http://127.0.0.1:8080 (default: start one)")
+    parser.add_argument("--model", default="glove_50d")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--rate", type=float, default=None, help="open loop: requests per second")
+    parser.add_argument("--texts-per-request", type=int, default=1)
+    parser.add_argument("--max-batch-size", type=int, default=64, help="for the started service")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="for the started service")
+    parser.add_argument("--max-pending", type=int, default=2048, help="for the started service")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        if args.url:
+            address = urlsplit(args.url)
+            host, port = address.hostname, address.port or 80
+        else:
+            process, host, port = start_service(directory, args)
+        try:
+            result = asyncio.run(measure(host, port, args))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    print(
+        f"{args.model}, {result['mode']}, {result['connections']} connections "
+        f"({result['connections_opened']} opened), {result['texts_per_request']} text(s) per request"
+    )
+    print(f"  {result['ok']}/{result['requests']} ok in {result['elapsed_s']:.1f}s: "
+          f"{result['requests_per_s']:.0f} req/s ({result['texts_per_s']:.0f} texts/s); statuses {result['statuses']}")
+    if result["ok"]:
+        print(f"  latency p50 {result['latency_ms_p50']:.1f} ms, p95 {result['latency_ms_p95']:.1f} ms, "
+              f"p99 {result['latency_ms_p99']:.1f} ms, max {result['latency_ms_max']:.1f} ms")
+    if "server" in result:
+        print(f"  server: {result['server']['batches']} batches, {result['server']['mean_batch_size']:.1f} texts/batch, "
+              f"{result['server']['rejected']} rejected")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+### Reproducible benchmark suite: micro, model-level and end-to-end.
+#   micro:  cosine_similarity, averaged_glove_embeddings_gdrive (sentence lengths),
+#           get_sorted_cosine_similarity with GloVe (category counts)
+#   model:  MiniLM encode throughput at batch sizes 1 and 32 (skipped without sentence-transformers)
+#   e2e:    the app's concurrent four-model pipeline, with OpenAI replaced by the local stub server
+#           (openai_stub_server.py) and a configurable latency
+# GloVe runs on a synthetic store with a fixed seed, so no download is needed and runs are comparable.
+# Results are written as JSON; --compare flags benchmarks whose median time regressed.
+#
+#   python benchmarks/run_benchmarks.py --output bench.json
+#   python benchmarks/run_benchmarks.py --output new.json --compare bench.json --threshold 0.15
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# benchmarks measure the computation itself, not the persistent embedding cache
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "off")
+
+import numpy as np  # noqa: E402
+
+from glove_store import GloveStoreWriter, load_glove_store  # noqa: E402
+from openai_stub_server import StubEmbeddingsServer  # noqa: E402
+
+SEED = 1234
+CATEGORY_COUNTS = (5, 100, 1000, 5000)
+SENTENCE_LENGTHS = (5, 20, 100)
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    """
+    Median/min seconds per call of fn; each sample runs enough calls to last about min_time
+    """
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    median = statistics.median(samples)
+    return {"median_s": median, "min_s": min(samples), "calls_per_sample": number, "ops_per_s": 1.0 / median}
+
+
+def build_synthetic_glove(directory, vocab_size, dim):
+    """
+    Random GloVe store with vocab_size words of dimension dim
+    """
+    rng = np.random.default_rng(SEED)
+    words = ["w%d" % index for index in range(vocab_size)]
+    path = os.path.join(directory, "glove_bench_store")
+    writer = GloveStoreWriter(path, vocab_size, vocab_size, dim)
+    writer.vectors[:] = rng.standard_normal((vocab_size, dim), dtype=np.float32)
+    for row, word in enumerate(words):
+        writer.add_word(word, row)
+    writer.close()
+    return load_glove_store(path), words
+
+
+def set_inputs(st, sentence, categories):
+    st.session_state.text_search = sentence
+    st.session_state.categories = " ".join(categories)
+    for key in list(st.session_state.keys()):
+        if key.startswith("cat_embed_"):
+            del st.session_state[key]
+
+
+def run_micro(app, st, store, words, results):
+    rng = random.Random(SEED)
+    model_type = "%dd" % store.dim
+
+    x, y = np.random.default_rng(SEED).standard_normal((2, store.dim))
+    results["micro/cosine_similarity/%dd" % store.dim] = measure(lambda: app.cosine_similarity(x, y))
+    x, y = np.random.default_rng(SEED).standard_normal((2, 3072))
+    results["micro/cosine_similarity/3072d"] = measure(lambda: app.cosine_similarity(x, y))
+
+    for length in SENTENCE_LENGTHS:
+        sentence = " ".join(rng.choice(words) for _ in range(length))
+        results["micro/averaged_glove/%d_words" % length] = measure(
+            lambda: app.averaged_glove_embeddings_gdrive(sentence, store, store.embeddings, model_type)
+        )
+
+    metadata = {"embedding_model": "glove", "word_index_dict": store, "embeddings": store.embeddings, "model_type": model_type}
+    sentence = " ".join(rng.choice(words) for _ in range(12))
+    for count in CATEGORY_COUNTS:
+        set_inputs(st, sentence, rng.sample(words, count))
+        results["micro/get_sorted_cosine_similarity/glove/%d_categories" % count] = measure(
+            lambda: app.get_sorted_cosine_similarity(metadata)
+        )
+
+
+def run_model(results):
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print("model: sentence-transformers not installed, skipping MiniLM benchmarks")
+        return
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    sentences = ["Roses are red, trucks are blue, and Seattle is grey right now %d" % index for index in range(32)]
+    for batch_size in (1, 32):
+        timing = measure(lambda: model.encode(sentences[:batch_size], batch_size=batch_size), repeat=3)
+        timing["sentences_per_s"] = batch_size / timing["median_s"]
+        results["model/minilm_encode/batch_%d" % batch_size] = timing
+
+
+def run_e2e(app, st, store, words, openai_latency_ms, results):
+    rng = random.Random(SEED)
+    model_type = "%dd" % store.dim
+    jobs_metadata = {
+        "glove_" + model_type: ("cpu", {"embedding_model": "glove", "word_index_dict": store,
+                                        "embeddings": store.embeddings, "model_type": model_type}),
+        "openai_small_1536": ("io", {"embedding_model": "openai", "model_name": "text-embedding-3-small"}),
+        "openai_large_3072": ("io", {"embedding_model": "openai", "model_name": "text-embedding-3-large"}),
+    }
+    try:
+        import sentence_transformers  # noqa: F401
+
+        jobs_metadata["sentence_transformer_384"] = (
+            "cpu", {"embedding_model": "transformers", "model_name": "all-MiniLM-L6-v2"}
+        )
+    except ImportError:
+        print("e2e: sentence-transformers not installed, pipeline runs without MiniLM")
+
+    def pipeline():
+        jobs = [
+            app.ModelJob(name, (lambda metadata=metadata: app.get_sorted_cosine_similarity(metadata)), kind=kind)
+            for name, (kind, metadata) in jobs_metadata.items()
+        ]
+        for result in app.run_concurrently(jobs):
+            if not result.ok:
+                raise result.error
+
+    categories = rng.sample(words, 5)
+    sentences = [" ".join(rng.choice(words) for _ in range(12)) for _ in range(64)]
+    counter = iter(range(1 << 30))
+
+    def cold():
+        # new sentence and empty category cache: every model embeds query and categories
+        set_inputs(st, sentences[next(counter) % len(sentences)], categories)
+        pipeline()
+
+    def warm():
+        # categories already embedded: only the query is embedded and scored
+        st.session_state.text_search = sentences[next(counter) % len(sentences)]
+        pipeline()
+
+    results["e2e/pipeline/cold/openai_%dms" % openai_latency_ms] = measure(cold, repeat=3)
+    results["e2e/pipeline/warm/openai_%dms" % openai_latency_ms] = measure(warm, repeat=3)
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Print benchmarks whose median got slower than the baseline by more than threshold
+    Returns the number of regressions
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = 0
+    for name, timing in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = timing["median_s"] / baseline[name]["median_s"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  improved"
+        print(f"{name:<60} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--suites", default="micro,model,e2e", help="comma separated: micro,model,e2e")
+    parser.add_argument("--vocab-size", type=int, default=100000, help="synthetic GloVe vocabulary size")
+    parser.add_argument("--dim", type=int, default=50, help="synthetic GloVe dimension")
+    parser.add_argument("--openai-latency-ms", type=float, default=50.0, help="latency of the fake OpenAI server")
+    parser.add_argument("--output", default="bench.json", help="JSON results file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative slowdown flagged as regression")
+    args = parser.parse_args()
+    suites = set(args.suites.split(","))
+
+    with StubEmbeddingsServer(latency=args.openai_latency_ms / 1000.0) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        # the app's OpenAI client picks these up when it is created
+        os.environ["OPENAI_API_KEY"] = "benchmark"
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+
+        import streamlit as st
+        import miniproject_1_student as app
+
+        store, words = build_synthetic_glove(directory, args.vocab_size, args.dim)
+        results = {}
+        if "micro" in suites:
+            run_micro(app, st, store, words, results)
+        if "model" in suites:
+            run_model(results)
+        if "e2e" in suites:
+            run_e2e(app, st, store, words, int(args.openai_latency_ms), results)
+
+    for name, timing in sorted(results.items()):
+        print(f"{name:<60} {timing['median_s'] * 1000:10.3f} ms  ({timing['ops_per_s']:10.1f}/s)")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to", args.output)
+
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
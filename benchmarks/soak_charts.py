@@ -0,0 +1,132 @@
+### Soak test of chart rendering: memory growth and time per rerun over many reruns.
+# Each rerun draws the four result pie charts, like the results tabs. Queries come from a pool of
+# --distinct rankings, so after a while most reruns repeat an earlier query (as real traffic does).
+#   legacy:     plt.subplots per chart, never closed, rendered like st.pyplot (the old code path)
+#   matplotlib: render_piechart (memoized PNG, pyplot-free figures)
+#   altair:     render_piechart with the Vega-Lite renderer
+# Every mode runs in a fresh interpreter (Streamlit bare mode), so RSS numbers are comparable.
+#
+#   python benchmarks/soak_charts.py
+#   python benchmarks/soak_charts.py --reruns 5000 --distinct 200 --json soak.json
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+SEED = 1234
+MODELS = ("glove_50d", "sentence_transformer_384", "openai_small_1536", "openai_large_3072")
+CATEGORIES = ["Flowers", "Colors", "Cars", "Weather", "Food"]
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def rankings(distinct):
+    import numpy as np
+
+    rng = np.random.default_rng(SEED)
+    pool = []
+    for _ in range(distinct):
+        ranking = {}
+        for model in MODELS:
+            scores = np.exp(rng.uniform(-0.2, 0.9, len(CATEGORIES)))
+            order = np.argsort(-scores, kind="stable")
+            ranking[model] = [(int(index), float(scores[index])) for index in order]
+        pool.append(ranking)
+    return pool
+
+
+def legacy_render(model, ranking):
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    fig, ax = plt.subplots(figsize=(3, 3))
+    explode = np.zeros(len(ranking))
+    explode[0] = 0.2
+    explode[2] = 0.05
+    ax.pie([score for _, score in ranking], labels=[CATEGORIES[index] for index, _ in ranking],
+           autopct="%1.1f%%", explode=explode)
+    # st.pyplot saves the figure but leaves it open
+    fig.savefig(io.BytesIO(), format="png", dpi=200, bbox_inches="tight")
+
+
+def soak(mode, reruns, distinct):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import streamlit as st  # noqa: F401
+
+    import miniproject_1_student as app
+    from charts import chart_inputs
+
+    pool = rankings(distinct)
+    order = np.random.default_rng(SEED).integers(0, distinct, reruns)
+    samples = [(0, rss_mb())]
+    start = time.perf_counter()
+    for rerun, choice in enumerate(order, 1):
+        for model, ranking in pool[choice].items():
+            if mode == "legacy":
+                legacy_render(model, ranking)
+            else:
+                labels, scores = chart_inputs(ranking, CATEGORIES)
+                app.render_piechart(model, labels, scores, mode)
+        if rerun % max(1, reruns // 10) == 0:
+            samples.append((rerun, rss_mb()))
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "reruns": reruns,
+        "ms_per_rerun": elapsed * 1000.0 / reruns,
+        "rss_start_mb": samples[0][1],
+        "rss_end_mb": samples[-1][1],
+        "rss_growth_mb": samples[-1][1] - samples[0][1],
+        "open_pyplot_figures": len(plt.get_fignums()),
+        "rss_samples": samples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test of chart rendering memory")
+    parser.add_argument("--modes", default="legacy,matplotlib,altair")
+    parser.add_argument("--reruns", type=int, default=1000)
+    parser.add_argument("--distinct", type=int, default=100, help="distinct query rankings in the pool")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(soak(args.child, args.reruns, args.distinct)))
+        return
+
+    results = {}
+    env = dict(os.environ, EMBEDDING_CACHE_PATH="off", APP_WARM_UP="0")
+    for mode in args.modes.split(","):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--reruns", str(args.reruns), "--distinct", str(args.distinct)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        results[mode] = result
+        print(
+            f"{mode:<11} {args.reruns} reruns: {result['ms_per_rerun']:7.2f} ms/rerun, RSS {result['rss_start_mb']:6.0f} -> "
+            f"{result['rss_end_mb']:6.0f} MB ({result['rss_growth_mb']:+.0f} MB), open pyplot figures {result['open_pyplot_figures']}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
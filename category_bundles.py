@@ -0,0 +1,348 @@
+### Precompiled category-embedding bundles.
+# A bundle holds the embeddings of one category list for any of the model families, so a cold start
+# of the app, classify.py or classify_service.py does not embed the categories again (paid OpenAI
+# requests included). It is a single uncompressed .npz file:
+#   labels      the category labels, in order
+#   <family>    normalized float32 matrix (len(labels), dim) per model family, e.g. glove_50d
+#   metadata    JSON: bundle format version, sha256 of the category list, and per model family the
+#               model name, dimension, number of rows and the fingerprint of the model that embedded
+#               them (model_fingerprint: GloVe store content, ST_BACKEND backend, model versions)
+# Bundles are looked up label by label, so a category list that only partly matches takes what it
+# can and embeds the rest live. A file written with another format version is skipped, and so is a
+# matrix whose dimension does not match its model family or whose fingerprint does not match the
+# model in use (checked on the first lookup of a model family, when the model is available).
+# Vectors are computed by the embedders encoders, which tokenize GloVe text like the app does.
+#
+#   python category_bundles.py "Flowers Colors Cars Weather Food" --models glove_50d openai_small_1536
+#   python category_bundles.py --list
+# The app, classify.py and classify_service.py read every bundle in CATEGORY_BUNDLES (a directory or
+# one .npz file, default category_bundles/).
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from scoring import normalize_rows
+
+BUNDLE_FORMAT = 2
+DEFAULT_BUNDLE_DIR = "category_bundles"
+
+
+def bundle_location():
+    """
+    Bundle directory (or file) from CATEGORY_BUNDLES
+    """
+    return os.getenv("CATEGORY_BUNDLES", DEFAULT_BUNDLE_DIR)
+
+
+def categories_hash(categories):
+    """
+    sha256 of a category list (labels in order, case sensitive)
+    """
+    return hashlib.sha256("\n".join(categories).encode("utf-8")).hexdigest()
+
+
+def bundle_path(directory, categories):
+    return os.path.join(directory, "categories-" + categories_hash(categories)[:16] + ".npz")
+
+
+def family_dimension(model_family):
+    """
+    Embedding dimension encoded in a model family name (glove_50d -> 50, openai_small_1536 -> 1536)
+    """
+    match = re.search(r"(\d+)d?$", model_family)
+    return int(match.group(1)) if match else None
+
+
+def glove_fingerprint(store):
+    """
+    Content fingerprint of a GloveStore: vocabulary metadata, shape and a sample of rows
+    The same for a rebuilt store and its shared-memory copy, different for other vectors
+    """
+    embeddings = store.embeddings
+    digest = hashlib.blake2b(json.dumps(store.meta, sort_keys=True).encode("utf-8"), digest_size=8)
+    digest.update(np.array(embeddings.shape, dtype=np.int64).tobytes())
+    step = max(1, len(embeddings) // 64)
+    digest.update(np.ascontiguousarray(embeddings[::step], dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def model_fingerprint(model_family, encoder=None):
+    """
+    What the vectors of a model family depend on besides the labels, as a JSON-compatible dict
+    encoder: the embedders encoder in use; by default the one get_encoder(model_family) would build
+    """
+    from embedders import OPENAI_EMBEDDING_VERSION, OPENAI_MODELS
+
+    if model_family.startswith("glove_"):
+        if encoder is not None:
+            store = encoder.store
+        else:
+            from glove_shared import open_glove_store
+            from glove_store import glove_store_path
+
+            store = open_glove_store(glove_store_path(model_family.split("_", 1)[1]))
+        return {"glove_store": glove_fingerprint(store)}
+    if model_family in OPENAI_MODELS:
+        version = getattr(encoder, "version", OPENAI_EMBEDDING_VERSION)
+        return {"model_name": OPENAI_MODELS[model_family], "version": version}
+    import st_inference
+
+    inference = getattr(encoder, "inference", None) or st_inference.config_from_env()
+    return {
+        "model_name": getattr(encoder, "model_name", "all-MiniLM-L6-v2"),
+        "backend": inference["backend"],
+        "version": st_inference.embedding_version(inference["backend"]),
+    }
+
+
+def write_bundle(path, categories, matrices, model_names=None, fingerprints=None):
+    """
+    Write a bundle atomically (a reader never sees a partial file)
+
+    Args:
+        categories: category labels; repeated labels are stored once
+        matrices: {model_family: (len(categories), dim) matrix}, rows in category order
+        model_names: optional {model_family: model name} recorded in the metadata
+        fingerprints: {model_family: model_fingerprint}; a family without one is never used by readers
+    """
+    categories = list(categories)
+    first_rows = {}
+    for row, label in enumerate(categories):
+        first_rows.setdefault(label, row)
+    labels = list(first_rows)
+    rows = np.array(list(first_rows.values()), dtype=np.int64)
+
+    arrays = {"labels": np.array(labels, dtype=np.str_)}
+    models = {}
+    for model_family, matrix in matrices.items():
+        matrix = normalize_rows(np.asarray(matrix)[rows])
+        arrays[model_family] = matrix
+        models[model_family] = {
+            "model_name": (model_names or {}).get(model_family, model_family),
+            "dim": int(matrix.shape[1]),
+            "rows": len(labels),
+            "fingerprint": (fingerprints or {}).get(model_family),
+        }
+    metadata = {
+        "format": BUNDLE_FORMAT,
+        "categories_hash": categories_hash(labels),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "models": models,
+    }
+    arrays["metadata"] = np.array(json.dumps(metadata))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+    return metadata
+
+
+class CategoryBundle:
+    """
+    One bundle file, loaded into memory
+
+    Raises ValueError for a file that is not a bundle of this format version
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(path, allow_pickle=False) as data:
+            if "metadata" not in data.files or "labels" not in data.files:
+                raise ValueError(f"{path} is not a category bundle")
+            self.metadata = json.loads(str(data["metadata"]))
+            if self.metadata.get("format") != BUNDLE_FORMAT:
+                raise ValueError(f"{path} has bundle format {self.metadata.get('format')}, expected {BUNDLE_FORMAT}")
+            self.labels = [str(label) for label in data["labels"]]
+            if categories_hash(self.labels) != self.metadata.get("categories_hash"):
+                raise ValueError(f"{path}: the labels do not match the category hash")
+            self.matrices = {}
+            for model_family, info in self.metadata["models"].items():
+                matrix = data[model_family]
+                expected = family_dimension(model_family)
+                if matrix.shape != (len(self.labels), info["dim"]) or expected not in (None, info["dim"]):
+                    continue
+                self.matrices[model_family] = matrix
+        self.rows = {label: row for row, label in enumerate(self.labels)}
+
+    @property
+    def model_families(self):
+        return list(self.matrices)
+
+
+class BundleSet:
+    """
+    Every bundle found at a path (a bundle file or a directory of them), looked up label by label
+    Later bundles (by file name) win when several hold the same label for the same model family
+
+    Args:
+        fingerprints: {model_family: fingerprint} of the models in use; model_fingerprint(model_family)
+            for the others
+    """
+
+    def __init__(self, bundles=(), fingerprints=None):
+        self.bundles = list(bundles)
+        self.fingerprints = dict(fingerprints or {})
+        self.skipped = {}
+        self.hits = 0
+        self.misses = 0
+        self._vectors = {}
+
+    def vectors(self, model_family):
+        """
+        {label: normalized vector} of a model family (empty without a matching bundle for it)
+        Bundles whose fingerprint does not match the model in use are skipped
+        """
+        vectors = self._vectors.get(model_family)
+        if vectors is not None:
+            return vectors
+        bundles = [bundle for bundle in self.bundles if model_family in bundle.matrices]
+        if not bundles:
+            return {}
+        try:
+            current = self.fingerprints.get(model_family) or model_fingerprint(model_family)
+        except Exception:
+            # the model is not available yet (e.g. the GloVe store is not built): checked again next time
+            return {}
+        vectors = {}
+        for bundle in bundles:
+            recorded = bundle.metadata["models"][model_family].get("fingerprint")
+            if recorded != current:
+                reason = f"embedded with {recorded}, the model in use is {current}"
+                self.skipped[f"{bundle.path} ({model_family})"] = reason
+                continue
+            matrix = bundle.matrices[model_family]
+            for label, row in bundle.rows.items():
+                vectors[label] = matrix[row]
+        self._vectors[model_family] = vectors
+        return vectors
+
+    def lookup(self, model_family, labels):
+        """
+        {label: vector} for the labels a bundle holds; the others are left to live embedding
+        """
+        vectors = self.vectors(model_family)
+        found = {label: vectors[label] for label in labels if label in vectors}
+        self.hits += len(found)
+        self.misses += len(labels) - len(found)
+        return found
+
+    def stats(self):
+        return {
+            "bundles": len(self.bundles),
+            "labels": len({label for bundle in self.bundles for label in bundle.labels}),
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": len(self.skipped),
+        }
+
+
+def load_bundles(path=None, fingerprints=None):
+    """
+    BundleSet of the bundles at path (default: bundle_location()); empty if there are none
+    Files that cannot be read as bundles are skipped and recorded in BundleSet.skipped
+    fingerprints: see BundleSet
+    """
+    path = path or bundle_location()
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".npz")]
+    else:
+        paths = [path] if os.path.isfile(path) else []
+    bundles, skipped = [], {}
+    for bundle_file in paths:
+        try:
+            bundles.append(CategoryBundle(bundle_file))
+        except (OSError, ValueError, KeyError) as e:
+            skipped[bundle_file] = str(e)
+    bundle_set = BundleSet(bundles, fingerprints)
+    bundle_set.skipped = skipped
+    return bundle_set
+
+
+def embed_with_bundles(bundles, model_family, labels, embed_batch):
+    """
+    Vectors for labels, in order: bundled ones from bundles (may be None), the rest from one
+    embed_batch(missing_labels) call
+    """
+    labels = list(labels)
+    found = bundles.lookup(model_family, labels) if bundles is not None else {}
+    missing = [label for label in dict.fromkeys(labels) if label not in found]
+    if missing:
+        found.update(zip(missing, embed_batch(missing)))
+    return [found[label] for label in labels]
+
+
+def compile_bundle(categories, model_families, directory=DEFAULT_BUNDLE_DIR, encoder_kwargs=None):
+    """
+    Embed categories with every model family and write them to one bundle in directory
+    A model family that cannot be loaded or embedded is reported and left out
+    encoder_kwargs: optional {model_family: kwargs for embedders.get_encoder}
+
+    Returns (path, metadata, {model_family: error})
+    """
+    from embedders import OPENAI_MODELS, get_encoder
+
+    categories = list(dict.fromkeys(categories))
+    matrices, model_names, fingerprints, errors = {}, {}, {}, {}
+    for model_family in model_families:
+        try:
+            encoder = get_encoder(model_family, **(encoder_kwargs or {}).get(model_family, {}))
+            matrices[model_family] = encoder.encode(categories)
+            fingerprints[model_family] = model_fingerprint(model_family, encoder)
+        except Exception as e:
+            matrices.pop(model_family, None)
+            errors[model_family] = e
+            continue
+        model_names[model_family] = OPENAI_MODELS.get(model_family) or getattr(encoder, "model_name", model_family)
+    path = bundle_path(directory, categories)
+    if not matrices:
+        return path, None, errors
+    return path, write_bundle(path, categories, matrices, model_names, fingerprints), errors
+
+
+def main(argv=None):
+    from embedders import MODEL_FAMILIES, OPENAI_MODELS
+
+    parser = argparse.ArgumentParser(description="Compile category lists into category-embedding bundles")
+    parser.add_argument("categories", nargs="?", help="space separated categories, like in the app")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FAMILIES), choices=MODEL_FAMILIES)
+    parser.add_argument("--output", default=None, help="bundle directory (default: CATEGORY_BUNDLES or category_bundles)")
+    parser.add_argument("--list", action="store_true", help="list the bundles in the directory instead")
+    args = parser.parse_args(argv)
+    directory = args.output or bundle_location()
+
+    if args.list:
+        bundles = load_bundles(directory)
+        for bundle in bundles.bundles:
+            models = ", ".join(f"{family} ({bundle.metadata['models'][family]['dim']}d)" for family in bundle.model_families)
+            print(f"{bundle.path}: {len(bundle.labels)} labels, {models}; created {bundle.metadata['created']}")
+        for path, reason in bundles.skipped.items():
+            print(f"{path}: skipped, {reason}")
+        return
+    if not args.categories:
+        parser.error("categories are required unless --list is given")
+
+    from embedding_cache import get_embedding_cache
+
+    # OpenAI vectors already in the app's embedding cache are not requested again
+    encoder_kwargs = {model_family: {"cache": get_embedding_cache()} for model_family in OPENAI_MODELS}
+    path, metadata, errors = compile_bundle(args.categories.split(" "), args.models, directory, encoder_kwargs)
+    for model_family, error in errors.items():
+        print(f"{model_family} skipped: {error}", file=sys.stderr)
+    if metadata is None:
+        sys.exit("No model family could embed the categories")
+    print(f"Wrote {path} ({', '.join(metadata['models'])})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+### Incremental category registry: the categories of one model with their embeddings.
+# Editing the "Categories" box only embeds the labels that were not there before (in one batch) and
+# frees the rows of the labels that were removed. The scoring matrix (a CategoryScorer over matrix
+# rows) is updated row by row in place instead of being rebuilt, and freed rows are reused.
+# Categories map to rows through an index array, so reordering or repeating labels costs nothing.
+# A registry lives in st.session_state and is shared by the reruns of a session, whose model jobs
+# run on worker threads: update() (diff, embed, apply) and scoring hold the registry's lock.
+
+import threading
+
+import numpy as np
+
+from scoring import CategoryScorer, top_k_indices
+
+MIN_CAPACITY = 8
+
+
+class CategoryRegistry:
+    """
+    Category labels of one model, their embeddings and the matching scoring matrix
+
+    Args:
+        precision, rerank, dimensions: storage of the scoring matrix, see scoring.CategoryScorer
+    """
+
+    def __init__(self, precision="float32", rerank=0, dimensions=None):
+        self.scorer = CategoryScorer([], precision=precision, rerank=rerank, dimensions=dimensions)
+        self.vectors = {}
+        self.rows = {}
+        self.free = []
+        self.categories = []
+        # category index -> matrix row
+        self.order = np.empty(0, dtype=np.int64)
+        self.embedded = 0
+        # row without an embedding for labels that failed to embed (they score 0.0)
+        self.blank_row = None
+        self.lock = threading.RLock()
+
+    def __contains__(self, label):
+        return label in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def failed(self):
+        """
+        Current categories without an embedding (they failed to embed and score 0.0)
+        """
+        with self.lock:
+            return [label for label in dict.fromkeys(self.categories) if label not in self.rows]
+
+    def diff(self, categories):
+        """
+        (added, removed) labels of a new category list; each label appears once, in list order
+        """
+        wanted = dict.fromkeys(categories)
+        added = [label for label in wanted if label not in self.rows]
+        removed = [label for label in self.rows if label not in wanted]
+        return added, removed
+
+    def update(self, categories, embed_batch):
+        """
+        Make the registry hold exactly these categories
+        embed_batch(labels) -> vectors is called once with the added labels (not at all if none);
+        a None vector marks a label that failed to embed: it scores 0.0 and is not kept, so the
+        next update embeds it again
+
+        The whole update runs under the registry's lock, so concurrent updates (e.g. a superseded
+        rerun still in flight) see and apply consistent diffs.
+
+        Returns the (added, removed) labels
+        """
+        categories = list(categories)
+        with self.lock:
+            added, removed = self.diff(categories)
+            for label in removed:
+                row = self.rows.pop(label)
+                del self.vectors[label]
+                self.scorer.set_vectors([row], [None])
+                self.free.append(row)
+            if added:
+                embedded = [
+                    (label, vector) for label, vector in zip(added, embed_batch(added)) if vector is not None
+                ]
+                rows = [self._allocate() for _ in embedded]
+                self.scorer.set_vectors(rows, [vector for _, vector in embedded])
+                self.rows.update(zip((label for label, _ in embedded), rows))
+                self.vectors.update(embedded)
+                self.embedded += len(embedded)
+            if self.blank_row is None and any(label not in self.rows for label in categories):
+                self.blank_row = self._allocate()
+                self.scorer.set_vectors([self.blank_row], [None])
+            self.categories = categories
+            self.order = np.array([self.rows.get(label, self.blank_row) for label in categories], dtype=np.int64)
+            return added, removed
+
+    def _allocate(self):
+        if not self.free:
+            size = self.scorer.num_categories
+            capacity = max(MIN_CAPACITY, 2 * size)
+            self.scorer.resize(capacity)
+            # lowest rows are handed out first
+            self.free.extend(range(capacity - 1, size - 1, -1))
+        return self.free.pop()
+
+    def scores(self, query):
+        """
+        Exponentiated cosine similarity of a query against every current category
+        With a reduced-precision or truncated matrix the best rows are rescored at full precision first
+        """
+        query = np.asarray(query)
+        with self.lock:
+            row_scores = self.scorer.score(query)
+            if self.scorer.rerank and len(self.order):
+                self.scorer.rescore(query, row_scores, top_k_indices(row_scores, self.scorer.rerank))
+            return row_scores[self.order]
+
+    def top_k(self, query, k=None):
+        """
+        Sorted [(category_index, score), ...] for a query, highest first (all categories for k=None)
+        """
+        scores = self.scores(query)
+        indices = top_k_indices(scores, len(scores) if k is None else k)
+        return [(int(index), float(scores[index])) for index in indices]
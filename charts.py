@@ -0,0 +1,91 @@
+### Chart rendering for the result tabs.
+# Figures are built with matplotlib's object-oriented API (matplotlib.figure.Figure), not pyplot:
+# pyplot keeps every figure in a global registry until plt.close, which is how a long-running
+# server leaks one figure per chart per rerun. Charts are rendered to PNG bytes (or an altair /
+# Vega-Lite spec, a small dict the browser draws itself), so the app can memoize them by
+# (model, categories, rounded scores) and repeated reruns never build a figure at all.
+
+import io
+
+# Scores are rounded before they become part of the memoization key; the pie slices are
+# percentages with one decimal, so 4 decimals never change the picture
+SCORE_DECIMALS = 4
+PNG_DPI = 200
+
+
+def chart_inputs(sorted_cosine_scores_items, categories):
+    """
+    (labels, rounded scores) tuples for a ranking [(category_index, score), ...]
+    """
+    labels = tuple(categories[index] for index, _ in sorted_cosine_scores_items)
+    scores = tuple(round(float(score), SCORE_DECIMALS) for _, score in sorted_cosine_scores_items)
+    return labels, scores
+
+
+def pie_explode(count):
+    """
+    Offsets that pull the best category (and the runner-up a little) out of the pie
+    """
+    explode = [0.0] * count
+    if count:
+        explode[0] = 0.2
+    if count == 3:
+        explode[1] = 0.1
+    elif count > 3:
+        explode[2] = 0.05
+    return explode
+
+
+def pie_figure(labels, scores, figsize=(3, 3), explode=True):
+    """
+    matplotlib Figure with a pie chart; not registered with pyplot, so it is freed like any object
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    ax.pie(scores, labels=labels, autopct="%1.1f%%", explode=pie_explode(len(labels)) if explode else None)
+    return fig
+
+
+def figure_png(fig, dpi=PNG_DPI):
+    """
+    PNG bytes of a figure; the figure is cleared afterwards so its artists can be freed right away
+    """
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+def pie_chart_png(labels, scores):
+    """
+    PNG of the results pie chart (same look as plot_piechart_helper)
+    """
+    return figure_png(pie_figure(labels, scores))
+
+
+def pie_chart_spec(labels, scores):
+    """
+    Vega-Lite spec (dict) of the results pie chart, drawn by the browser
+    """
+    import altair as alt
+
+    total = sum(scores) or 1.0
+    data = [
+        {"category": label, "score": score, "share": score / total, "rank": rank}
+        for rank, (label, score) in enumerate(zip(labels, scores))
+    ]
+    chart = (
+        alt.Chart(alt.Data(values=data))
+        .mark_arc(outerRadius=110)
+        .encode(
+            theta=alt.Theta("score:Q", stack=True),
+            color=alt.Color("category:N", sort=list(labels), legend=alt.Legend(title=None)),
+            order=alt.Order("rank:Q"),
+            tooltip=["category:N", alt.Tooltip("score:Q", format=".4f"), alt.Tooltip("share:Q", format=".1%")],
+        )
+    )
+    return chart.to_dict()
@@ -0,0 +1,202 @@
+### Headless bulk classification.
+# Streams sentences from a JSONL or CSV file in bounded-memory chunks, embeds and scores each chunk
+# in one batch with any of the four model families, and writes the ranked categories incrementally.
+# GloVe and sentence-transformer chunks can be spread over a process pool; OpenAI chunks are
+# already batched into few HTTP requests and run in the main process.
+#
+#   python classify.py titles.jsonl --model glove_50d --categories "Flowers Colors Cars Weather Food" \
+#       --output ranked.jsonl --top-k 3 --processes 4
+# With many categories and an OpenAI model, --coarse-dimensions 256 shortlists the categories on
+# the first 256 components and reranks the --shortlist best at full width.
+# Categories found in the bundles of --bundles (see category_bundles.py) are not embedded again.
+
+import argparse
+import collections
+import csv
+import itertools
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from category_bundles import bundle_location, embed_with_bundles, load_bundles
+from embedders import MODEL_FAMILIES, get_encoder
+from scoring import CategoryScorer
+
+POOLABLE_FAMILIES = ("glove_", "sentence_transformer_")
+
+
+def read_records(path, text_field="text", id_field=None, file_format=None):
+    """
+    Stream (record_id, text) pairs from a JSONL or CSV file ("-" reads JSONL from stdin)
+
+    JSONL lines can be objects (text in text_field) or plain JSON strings.
+    Without id_field the record id is the 0-based line number.
+    """
+    if file_format is None:
+        file_format = "csv" if path.endswith(".csv") else "jsonl"
+    f = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if file_format == "csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for index, row in enumerate(rows):
+            if isinstance(row, str):
+                yield index, row
+            else:
+                yield (row[id_field] if id_field else index), row[text_field]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Classifier:
+    """
+    Ranks categories for batches of sentences with one model family
+
+    Args:
+        model_family: one of embedders.MODEL_FAMILIES
+        categories: list of category labels
+        top_k: number of ranked categories kept per sentence (None = all)
+        coarse_dimensions, shortlist: score on a truncated prefix and rerank the shortlist
+            at full width (see scoring.CategoryScorer dimensions / rerank)
+        bundles: optional category_bundles.BundleSet consulted before embedding the categories
+        encoder_kwargs: passed to embedders.get_encoder
+    """
+
+    def __init__(
+        self, model_family, categories, top_k=None, coarse_dimensions=None, shortlist=100, bundles=None, **encoder_kwargs
+    ):
+        self.model_family = model_family
+        self.categories = list(categories)
+        self.top_k = top_k
+        self.encoder = get_encoder(model_family, **encoder_kwargs)
+        self.scorer = CategoryScorer(
+            embed_with_bundles(bundles, model_family, self.categories, self.encoder.encode),
+            rerank=shortlist,
+            dimensions=coarse_dimensions,
+        )
+
+    def rank(self, texts):
+        """
+        [[(category, score), ...], ...] for a batch of texts, highest score first
+        """
+        rankings = self.scorer.top_k_batch(self.encoder.encode(texts), self.top_k)
+        return [[(self.categories[index], score) for index, score in ranking] for ranking in rankings]
+
+    def classify_chunk(self, records):
+        ids = [record_id for record_id, _ in records]
+        rankings = self.rank([text for _, text in records])
+        return [
+            {"id": record_id, "categories": [{"category": category, "score": score} for category, score in ranking]}
+            for record_id, ranking in zip(ids, rankings)
+        ]
+
+
+# per-process classifier for the process pool
+_worker_classifier = None
+
+
+def _init_worker(model_family, categories, top_k, coarse_dimensions, shortlist, bundle_path):
+    global _worker_classifier
+    bundles = load_bundles(bundle_path) if bundle_path else None
+    _worker_classifier = Classifier(model_family, categories, top_k, coarse_dimensions, shortlist, bundles)
+
+
+def _classify_in_worker(records):
+    return _worker_classifier.classify_chunk(records)
+
+
+def classify_records(
+    records,
+    model_family,
+    categories,
+    top_k=None,
+    chunk_size=1024,
+    processes=1,
+    coarse_dimensions=None,
+    shortlist=100,
+    bundle_path=None,
+):
+    """
+    Classify a stream of (record_id, text) pairs; yields one result dict per record, in input order
+    bundle_path: category bundle file or directory whose categories are not embedded again
+
+    Only chunk_size records (times 2 * processes with a pool) are held in memory at a time.
+    """
+    chunks = chunked(records, chunk_size)
+    if processes <= 1 or not model_family.startswith(POOLABLE_FAMILIES):
+        bundles = load_bundles(bundle_path) if bundle_path else None
+        classifier = Classifier(model_family, categories, top_k, coarse_dimensions, shortlist, bundles)
+        for chunk in chunks:
+            yield from classifier.classify_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(model_family, list(categories), top_k, coarse_dimensions, shortlist, bundle_path),
+    ) as executor:
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_classify_in_worker, chunk))
+            # keep the pool busy but bound the number of chunks held in memory
+            if len(in_flight) >= 2 * processes:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def write_jsonl(results, path):
+    """
+    Write results incrementally as JSON lines ("-" writes to stdout); returns the number written
+    """
+    f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+    count = 0
+    try:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+            count += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify sentences from a JSONL/CSV file into categories")
+    parser.add_argument("input", help='JSONL or CSV file ("-" for JSONL on stdin)')
+    parser.add_argument("--model", default="glove_50d", choices=MODEL_FAMILIES)
+    parser.add_argument("--categories", required=True, help="space separated categories, like in the app")
+    parser.add_argument("--output", default="-", help='output JSONL file ("-" for stdout)')
+    parser.add_argument("--top-k", type=int, default=None, help="ranked categories kept per sentence")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="sentences embedded per batch")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes (GloVe / transformers)")
+    parser.add_argument("--text-field", default="text", help="JSON key or CSV column holding the sentence")
+    parser.add_argument("--id-field", default=None, help="JSON key or CSV column holding the record id")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default=None, help="input format (default: by extension)")
+    parser.add_argument("--coarse-dimensions", type=int, default=None, help="shortlist on this many leading dimensions")
+    parser.add_argument("--shortlist", type=int, default=100, help="categories reranked at full width")
+    parser.add_argument("--bundles", default=bundle_location(), help="category bundle file or directory")
+    args = parser.parse_args(argv)
+
+    records = read_records(args.input, args.text_field, args.id_field, args.format)
+    results = classify_records(
+        records, args.model, args.categories.split(" "), args.top_k, args.chunk_size, args.processes,
+        args.coarse_dimensions, args.shortlist, args.bundles,
+    )
+    count = write_jsonl(results, args.output)
+    print(f"Classified {count} sentences with {args.model}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
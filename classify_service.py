@@ -0,0 +1,492 @@
+### Asynchronous HTTP classification service.
+# Serves the app's ranking (exponentiated cosine similarity of a sentence against every category,
+# highest first, like get_sorted_cosine_similarity) over HTTP for any of the model families, so
+# other services can call it at a real request rate instead of going through the Streamlit page.
+# Encoders are loaded (and warmed up) once at startup and stay resident. Every model has its own
+# queue: texts from concurrent requests are encoded together, up to max_batch_size texts or
+# max_wait_ms after the first one, and category labels not seen before are embedded in the same
+# batch. When max_pending texts are already waiting for a model, new requests are answered with
+# 503 and Retry-After instead of growing the queue, and so are requests OpenAI kept throttling.
+# Connections are kept alive (HTTP/1.1). Category labels found in a precompiled bundle (--bundles,
+# see category_bundles.py) are never embedded. Requests are validated before they join a batch, and
+# when encoding a batch fails its requests are encoded one by one, so only the bad one gets the error.
+#
+#   python classify_service.py --models glove_50d sentence_transformer_384 --port 8080
+#   curl -s localhost:8080/v1/classify -d '{"model": "glove_50d",
+#       "categories": "Flowers Colors Cars Weather Food", "texts": ["Roses are red"]}'
+#
+# POST /v1/classify  {"model", "categories" (space separated like the app, or a list),
+#                     "texts" (list) or "text", optional "top_k"}
+#                    -> {"model", "results": [{"ranking": [{"index", "category", "score"}, ...]}]}
+# GET  /healthz, GET /stats (queue depth, batch sizes and rejections per model)
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import sys
+import threading
+import time
+from http import HTTPStatus
+
+from category_bundles import bundle_location, load_bundles
+from embedders import MODEL_FAMILIES, OPENAI_MODELS, EmbeddingError, get_encoder
+from instrumentation import metrics, start_metrics_server
+from openai_limits import RateLimited
+from pipeline import get_executor
+from scoring import CategoryScorer
+
+MAX_HEADER_BYTES = 16384
+MAX_BODY_BYTES = 4 << 20
+MAX_TEXTS_PER_REQUEST = 2048
+KEEP_ALIVE_TIMEOUT = 15.0
+RETRY_AFTER_S = 1
+# category label embeddings and scoring matrices kept per model
+LABEL_CACHE_SIZE = 50000
+SCORER_CACHE_SIZE = 256
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Overloaded(Exception):
+    """
+    Raised when a model's queue is full
+    """
+
+
+class PendingRequest:
+    def __init__(self, texts, categories, top_k, future):
+        self.texts = texts
+        self.categories = categories
+        self.top_k = top_k
+        self.future = future
+
+
+class ModelWorker:
+    """
+    Queue and batching loop for one resident encoder
+
+    Args:
+        model_family: one of embedders.MODEL_FAMILIES
+        encoder: anything with encode(sentences) -> (n, dim) matrix
+        max_batch_size: texts (queries plus new category labels) per encode call
+        max_wait_ms: how long the first request of a batch waits for more
+        max_pending: texts allowed to wait in the queue before requests are rejected
+        concurrency: batches encoded at the same time (more than one only helps network-bound models)
+        bundled: {label: vector} from category bundles, used instead of embedding those labels
+    """
+
+    def __init__(
+        self, model_family, encoder, max_batch_size=64, max_wait_ms=2.0, max_pending=2048, concurrency=1, bundled=None
+    ):
+        self.model_family = model_family
+        self.encoder = encoder
+        self.bundled = bundled or {}
+        self.kind = "io" if model_family in OPENAI_MODELS else "cpu"
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self.pending = 0
+
+        self._queue = collections.deque()
+        self._added = None
+        self._slots = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._labels = collections.OrderedDict()
+        self._scorers = collections.OrderedDict()
+
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.texts = 0
+        self.labels_embedded = 0
+
+    def start(self):
+        self._added = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def classify(self, texts, categories, top_k=None):
+        """
+        [[(category_index, score), ...], ...] for texts, once their batch has been encoded
+        """
+        if self.pending and self.pending + len(texts) > self.max_pending:
+            self.rejected += 1
+            raise Overloaded(f"{self.model_family} has {self.pending} texts queued")
+        self.requests += 1
+        self.pending += len(texts)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(PendingRequest(texts, categories, top_k, future))
+        self._added.set()
+        try:
+            return await future
+        finally:
+            self.pending -= len(texts)
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch, size, deadline = [], 0, None
+        while size < self.max_batch_size:
+            if not self._queue:
+                if batch and loop.time() >= deadline:
+                    break
+                self._added.clear()
+                try:
+                    await asyncio.wait_for(self._added.wait(), None if not batch else deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                continue
+            request = self._queue.popleft()
+            # the client went away while its request was queued
+            if request.future.done():
+                continue
+            if not batch:
+                deadline = loop.time() + self.max_wait
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # requests that arrive while every slot is busy make up the next batch
+            await self._slots.acquire()
+            batch = await self._next_batch()
+            loop.create_task(self._run_batch(loop, batch))
+
+    async def _run_batch(self, loop, batch):
+        try:
+            rankings = await loop.run_in_executor(get_executor(self.kind), self._classify_batch, batch)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        else:
+            for request, ranking in zip(batch, rankings):
+                if request.future.done():
+                    continue
+                if isinstance(ranking, Exception):
+                    request.future.set_exception(ranking)
+                else:
+                    request.future.set_result(ranking)
+        finally:
+            self._slots.release()
+
+    def _classify_batch(self, batch):
+        """
+        Rankings of the requests of a batch, or the exception of each request that failed (worker thread)
+        """
+        try:
+            return self._classify(batch)
+        except RateLimited:
+            # one request per batch member would only add to the throttling
+            raise
+        except Exception:
+            if len(batch) == 1:
+                raise
+        outcomes = []
+        for request in batch:
+            try:
+                outcomes.extend(self._classify([request]))
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    def _classify(self, batch):
+        """
+        Encode the queries of a batch and its new category labels in one call, then score
+        """
+        with metrics.stage("service_batch", self.model_family):
+            with self._lock:
+                labels = {
+                    label: self.bundled.get(label, self._labels.get(label))
+                    for request in batch
+                    for label in request.categories
+                }
+                for label, vector in labels.items():
+                    if label in self._labels:
+                        self._labels.move_to_end(label)
+            missing = [label for label, vector in labels.items() if vector is None]
+            texts = list(dict.fromkeys([text for request in batch for text in request.texts] + missing))
+            vectors = dict(zip(texts, self.encoder.encode(texts)))
+            labels.update((label, vectors[label]) for label in missing)
+            with self._lock:
+                for label in missing:
+                    self._labels[label] = labels[label]
+                while len(self._labels) > LABEL_CACHE_SIZE:
+                    self._labels.popitem(last=False)
+                self.batches += 1
+                self.texts += sum(len(request.texts) for request in batch)
+                self.labels_embedded += len(missing)
+
+            rankings = []
+            for request in batch:
+                scorer = self._scorer(request.categories, labels)
+                rankings.append(scorer.top_k_batch([vectors[text] for text in request.texts], request.top_k))
+            return rankings
+
+    def _scorer(self, categories, labels):
+        with self._lock:
+            scorer = self._scorers.get(categories)
+            if scorer is not None:
+                self._scorers.move_to_end(categories)
+                return scorer
+        scorer = CategoryScorer([labels[label] for label in categories])
+        with self._lock:
+            self._scorers[categories] = scorer
+            while len(self._scorers) > SCORER_CACHE_SIZE:
+                self._scorers.popitem(last=False)
+        return scorer
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "pending": self.pending,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "labels_embedded": self.labels_embedded,
+            "labels_bundled": len(self.bundled),
+        }
+
+
+def parse_classify_request(payload):
+    """
+    (model, texts, categories, top_k) from a /v1/classify body; raises HTTPError(400) when malformed
+    """
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "body must be a JSON object")
+    texts = payload.get("texts", [payload["text"]] if "text" in payload else None)
+    if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+        raise HTTPError(400, '"texts" must be a non-empty list of strings (or "text" a string)')
+    if len(texts) > MAX_TEXTS_PER_REQUEST:
+        raise HTTPError(413, f"at most {MAX_TEXTS_PER_REQUEST} texts per request")
+    if not all(text.strip() for text in texts):
+        raise HTTPError(400, '"texts" must not contain empty strings')
+    categories = payload.get("categories")
+    if isinstance(categories, str):
+        # same as the app's "Categories" box
+        categories = categories.split(" ")
+    if not isinstance(categories, list) or not categories or not all(isinstance(label, str) for label in categories):
+        raise HTTPError(400, '"categories" must be a space separated string or a non-empty list of strings')
+    if not all(label.strip() for label in categories):
+        raise HTTPError(400, '"categories" must not contain empty labels (e.g. two spaces in a row)')
+    top_k = payload.get("top_k")
+    if top_k is not None and (not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1):
+        raise HTTPError(400, '"top_k" must be a positive integer')
+    return payload.get("model"), texts, tuple(categories), top_k
+
+
+class ClassificationService:
+    """
+    HTTP front end over one ModelWorker per loaded model family
+
+    Args:
+        workers: {model_family: ModelWorker}
+        keep_alive_timeout: seconds an idle connection is kept open
+    """
+
+    def __init__(self, workers, keep_alive_timeout=KEEP_ALIVE_TIMEOUT):
+        self.workers = workers
+        self.keep_alive_timeout = keep_alive_timeout
+        self.connections = 0
+        self.open_connections = 0
+        self.responses = collections.Counter()
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=8080):
+        for worker in self.workers.values():
+            worker.start()
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        return self.server
+
+    @property
+    def url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        self.open_connections += 1
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keep_alive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 431, {"error": {"message": "request headers too large"}}, close=True)
+                    break
+                keep_alive = await self.handle_request(head, reader, writer)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def handle_request(self, head, reader, writer):
+        """
+        Read the body of one request, answer it and return whether the connection stays open
+        """
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, version = lines[0].split(" ", 2)
+        except ValueError:
+            await self.respond(writer, 400, {"error": {"message": "malformed request line"}}, close=True)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            await self.respond(writer, 411, {"error": {"message": "send a Content-Length"}}, close=True)
+            return False
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self.respond(writer, 400, {"error": {"message": "malformed Content-Length"}}, close=True)
+            return False
+        if length > MAX_BODY_BYTES:
+            await self.respond(writer, 413, {"error": {"message": "request body too large"}}, close=True)
+            return False
+        body = await reader.readexactly(length) if length else b""
+
+        try:
+            status, payload, extra_headers = await self.dispatch(method, path.split("?", 1)[0], body)
+        except HTTPError as e:
+            status, payload, extra_headers = e.status, {"error": {"message": str(e)}}, e.headers
+        except Exception as e:
+            status, payload, extra_headers = 500, {"error": {"message": f"{type(e).__name__}: {e}"}}, {}
+        await self.respond(writer, status, payload, extra_headers, close=not keep_alive)
+        return keep_alive
+
+    async def respond(self, writer, status, payload, headers=None, close=False):
+        self.responses[status] += 1
+        body = json.dumps(payload).encode("utf-8")
+        lines = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: " + ("close" if close else "keep-alive"),
+        ]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        # headers and body in one write
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, method, path, body):
+        """
+        Route one request: returns (status, payload, headers)
+        """
+        if path == "/healthz" and method == "GET":
+            return 200, {"status": "ok", "models": list(self.workers)}, {}
+        if path == "/stats" and method == "GET":
+            return 200, self.stats(), {}
+        if path != "/v1/classify":
+            raise HTTPError(404, f"no route for {path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST", {"Allow": "POST"})
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON") from None
+        model, texts, categories, top_k = parse_classify_request(payload)
+        worker = self.workers.get(model)
+        if worker is None:
+            raise HTTPError(404, f"model {model!r} is not loaded; loaded: {', '.join(self.workers)}")
+        try:
+            rankings = await worker.classify(texts, categories, top_k)
+        except Overloaded as e:
+            raise HTTPError(503, str(e), {"Retry-After": str(RETRY_AFTER_S)}) from None
+        except RateLimited as e:
+            retry_after = math.ceil(e.retry_after) if e.retry_after else RETRY_AFTER_S
+            raise HTTPError(503, str(e), {"Retry-After": str(retry_after)}) from None
+        except EmbeddingError as e:
+            raise HTTPError(502, str(e)) from None
+        results = [
+            {"ranking": [{"index": index, "category": categories[index], "score": score} for index, score in ranking]}
+            for ranking in rankings
+        ]
+        return 200, {"model": model, "results": results}, {}
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "open_connections": self.open_connections,
+            "responses": {str(status): count for status, count in sorted(self.responses.items())},
+            "models": {name: worker.stats() for name, worker in self.workers.items()},
+        }
+
+
+def load_workers(model_families, max_batch_size=64, max_wait_ms=2.0, max_pending=2048, bundles=None):
+    """
+    {model_family: ModelWorker} with every encoder loaded and warmed up by one encode call
+    bundles: optional category_bundles.BundleSet whose labels the workers never embed
+    """
+    workers = {}
+    for model_family in model_families:
+        start = time.perf_counter()
+        encoder = get_encoder(model_family)
+        encoder.encode(["warm up"])
+        concurrency = 4 if model_family in OPENAI_MODELS else 1
+        bundled = bundles.vectors(model_family) if bundles is not None else None
+        workers[model_family] = ModelWorker(
+            model_family, encoder, max_batch_size, max_wait_ms, max_pending, concurrency, bundled
+        )
+        metrics.add_collector("service_" + model_family, workers[model_family].stats)
+        print(f"Loaded {model_family} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return workers
+
+
+async def serve(workers, host, port):
+    service = ClassificationService(workers)
+    await service.start(host, port)
+    # the load generator reads the address from this line
+    print(f"Serving {', '.join(workers)} on {service.url}", flush=True)
+    async with service.server:
+        await service.server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve category rankings over HTTP")
+    parser.add_argument("--models", nargs="+", default=["glove_50d"], choices=MODEL_FAMILIES)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="0 picks a free port")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="texts encoded per batch")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="how long a batch waits to fill up")
+    parser.add_argument("--max-pending", type=int, default=2048, help="queued texts per model before 503")
+    parser.add_argument("--bundles", default=bundle_location(), help="category bundle file or directory")
+    args = parser.parse_args(argv)
+
+    bundles = load_bundles(args.bundles)
+    if bundles.bundles:
+        print(f"Loaded {bundles.stats()['labels']} bundled category embeddings from {args.bundles}", file=sys.stderr)
+    workers = load_workers(args.models, args.max_batch_size, args.max_wait_ms, args.max_pending, bundles)
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(int(os.environ["METRICS_PORT"]))
+    try:
+        asyncio.run(serve(workers, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+### Request coalescing for rapid Streamlit reruns.
+# SessionWork (one per session) keeps at most one computation per model in flight. A rerun with the
+# same inputs joins the computation that is already running (or reuses its finished result, unless
+# the result was marked as not reusable, e.g. because some categories failed to embed); a rerun with new inputs supersedes it: its CancelToken is cancelled and the old computation stops at
+# its next check_cancelled() call, before it issues another backend request.
+# Singleflight (one per process) merges identical concurrent backend requests, e.g. two sessions
+# embedding the same sentence with the same model, into a single call. Keys merged into a call that
+# was superseded are fetched again by the waiting caller instead of failing with it.
+
+import threading
+from concurrent.futures import Future
+
+_local = threading.local()
+
+
+class Superseded(Exception):
+    """
+    Raised inside a computation whose inputs were replaced by a newer rerun
+    """
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise Superseded("superseded by a newer rerun")
+
+
+def check_cancelled():
+    """
+    Raise Superseded if the computation running in this thread was superseded
+    Call it before expensive steps (backend requests); a no-op outside SessionWork.run
+    """
+    token = getattr(_local, "token", None)
+    if token is not None:
+        token.check()
+
+
+class SessionWork:
+    """
+    At most one in-flight computation per name (model) for one session
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.started = 0
+        self.reused = 0
+        self.superseded = 0
+
+    def run(self, name, key, fn, reuse=None):
+        """
+        Result of fn() for inputs key, computed at most once while key stays the same
+        reuse(value) -> False keeps a finished result from being reused: runs already waiting for it
+        still get it, the next run with the same key computes it again
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == key and not (entry[1].done() and entry[1].exception() is not None):
+                self.reused += 1
+                future, token = entry[1], None
+            else:
+                if entry is not None and not entry[1].done():
+                    entry[2].cancel()
+                    self.superseded += 1
+                future, token = Future(), CancelToken()
+                self._entries[name] = (key, future, token)
+                self.started += 1
+        if token is None:
+            return future.result()
+
+        previous, _local.token = getattr(_local, "token", None), token
+        try:
+            value = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            _local.token = previous
+        future.set_result(value)
+        if reuse is not None and not reuse(value):
+            with self._lock:
+                if self._entries.get(name, (None, None))[1] is future:
+                    del self._entries[name]
+        return value
+
+    def stats(self):
+        return {"started": self.started, "reused": self.reused, "superseded": self.superseded}
+
+
+class Singleflight:
+    """
+    Merges identical concurrent requests: while one caller fetches a key, others wait for its result
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.calls = 0
+        self.keys_fetched = 0
+        self.keys_merged = 0
+
+    def run_many(self, keys, fetch):
+        """
+        Values for keys; fetch(owned_keys) -> values is called (once) only for the keys no other
+        caller is fetching right now, the rest are waited for
+        """
+        check_cancelled()
+        owned, futures = [], {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    owned.append(key)
+                else:
+                    self.keys_merged += 1
+                futures[key] = future
+            if owned:
+                self.calls += 1
+                self.keys_fetched += len(owned)
+
+        if owned:
+            try:
+                values = fetch(owned)
+            except BaseException as e:
+                for key in owned:
+                    futures[key].set_exception(e)
+                raise
+            else:
+                for key, value in zip(owned, values):
+                    futures[key].set_result(value)
+            finally:
+                with self._lock:
+                    for key in owned:
+                        del self._inflight[key]
+        # keys merged into a computation that was superseded are fetched again by this caller
+        # (which raises Superseded itself if it was superseded too)
+        owned = set(owned)
+        retry = [
+            key for key, future in futures.items() if key not in owned and isinstance(future.exception(), Superseded)
+        ]
+        fetched_again = dict(zip(retry, self.run_many(retry, fetch))) if retry else {}
+        return [fetched_again[key] if key in fetched_again else futures[key].result() for key in keys]
+
+    def run(self, key, fn):
+        return self.run_many([key], lambda owned: [fn()])[0]
+
+    def stats(self):
+        return {"calls": self.calls, "keys_fetched": self.keys_fetched, "keys_merged": self.keys_merged}
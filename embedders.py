@@ -0,0 +1,138 @@
+### Streamlit-free sentence encoders for the four model families used by the app.
+# Every encoder has encode(sentences) -> (n, dim) float32 matrix, so headless callers (bulk
+# classification, benchmarks, services) can embed batches without st.session_state.
+# Model families use the same names as the result tabs in the app.
+
+import numpy as np
+
+from glove_batch import GloveBatchEncoder
+from glove_shared import open_glove_store
+from glove_store import glove_store_exists, glove_store_path
+from openai_limits import RateLimited
+import st_inference
+
+MODEL_FAMILIES = (
+    "glove_25d",
+    "glove_50d",
+    "glove_100d",
+    "sentence_transformer_384",
+    "openai_small_1536",
+    "openai_large_3072",
+)
+
+OPENAI_MODELS = {
+    "openai_small_1536": "text-embedding-3-small",
+    "openai_large_3072": "text-embedding-3-large",
+}
+
+# OpenAI does not expose model revisions; bump this if the served embeddings ever change
+OPENAI_EMBEDDING_VERSION = "1"
+
+
+class EmbeddingError(RuntimeError):
+    """
+    Raised when a batch of sentences could not be embedded
+    """
+
+
+class GloveEncoder:
+    """
+    Averaged GloVe embeddings, same as averaged_glove_embeddings_gdrive (glove_batch tokenization):
+    lowercase, punctuation dropped from words not in the vocabulary, unknown words count as zero vectors
+    """
+
+    def __init__(self, model_type="50d", store_path=None, idf=None):
+        self.model_type = model_type
+        self.store_path = store_path or glove_store_path(model_type)
+        if not glove_store_exists(self.store_path):
+            raise FileNotFoundError(
+                f"GloVe store {self.store_path} not found; run the app once or "
+                f"python glove_store.py {model_type} to build it"
+            )
+        self.store = open_glove_store(self.store_path)
+        self.dim = self.store.dim
+        self.batch_encoder = GloveBatchEncoder(self.store, self.store.embeddings, idf=idf)
+
+    def encode(self, sentences):
+        return self.batch_encoder.encode(sentences)
+
+
+class SentenceTransformerEncoder:
+    """
+    Sentence-transformer embeddings (all-MiniLM-L6-v2 by default), loaded on first use
+
+    Args:
+        inference: st_inference settings (backend, thread pools, length_buckets); from the ST_*
+            environment variables by default
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", batch_size=64, inference=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.inference = inference or st_inference.config_from_env()
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = st_inference.load_sentence_transformer(self.model_name, **self.inference)
+        return self._model
+
+    def encode(self, sentences):
+        return st_inference.encode_bucketed(self.model, sentences, self.inference.get("length_buckets"), self.batch_size)
+
+
+class OpenAIEncoder:
+    """
+    OpenAI embeddings through the batched request path (openai_batching.BatchEmbedder)
+
+    Args:
+        model_name: "text-embedding-3-small" or "text-embedding-3-large"
+        client: OpenAI client; by default a rate-limited one (openai_limits.build_openai_client)
+            is built from OPENAI_API_KEY / OPENAI_BASE_URL
+        cache: optional embedding_cache.EmbeddingCache checked before any request
+    """
+
+    def __init__(self, model_name="text-embedding-3-small", client=None, cache=None, version=OPENAI_EMBEDDING_VERSION):
+        from openai_batching import BatchEmbedder
+        from openai_limits import build_openai_client
+
+        if client is None:
+            client = build_openai_client()
+        self.model_name = model_name
+        self.cache = cache
+        self.version = version
+        self.embedder = BatchEmbedder(client)
+
+    def encode(self, sentences):
+        sentences = list(sentences)
+        found = self.cache.get_many(self.model_name, self.version, sentences) if self.cache else {}
+        missing = [sentence for sentence in dict.fromkeys(sentences) if sentence not in found]
+        if missing:
+            vectors, errors = self.embedder.embed(missing, self.model_name)
+            if errors:
+                index, error = next(iter(errors.items()))
+                if isinstance(error, RateLimited):
+                    raise error
+                raise EmbeddingError(
+                    f"{len(errors)} of {len(missing)} inputs failed for {self.model_name}, "
+                    f"e.g. {missing[index]!r}: {error}"
+                )
+            new_vectors = dict(zip(missing, vectors))
+            if self.cache:
+                self.cache.put_many(self.model_name, self.version, new_vectors)
+            found.update(new_vectors)
+        return np.array([found[sentence] for sentence in sentences], dtype=np.float32)
+
+
+def get_encoder(model_family, **kwargs):
+    """
+    Encoder for one of MODEL_FAMILIES
+    """
+    if model_family.startswith("glove_"):
+        return GloveEncoder(model_family.split("_", 1)[1], **kwargs)
+    if model_family == "sentence_transformer_384":
+        return SentenceTransformerEncoder(**kwargs)
+    if model_family in OPENAI_MODELS:
+        return OpenAIEncoder(OPENAI_MODELS[model_family], **kwargs)
+    raise ValueError(f"Unknown model family {model_family!r}; choose from {', '.join(MODEL_FAMILIES)}")
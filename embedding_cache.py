@@ -0,0 +1,250 @@
+### Persistent, content-addressed embedding cache.
+# Embeddings are stored in a local SQLite database keyed by (model, model version, normalized text),
+# so identical strings are embedded once across browser sessions, Streamlit reruns, worker processes
+# and restarts. SQLite in WAL mode lets many processes read while one writes; every thread gets its
+# own connection. The cache is bounded in bytes and evicts the least recently used entries; the
+# byte and entry totals are kept up to date by triggers, so a write never scans the whole table.
+
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = "embedding_cache.sqlite3"
+DEFAULT_MAX_MB = 512
+
+# last_used is only rewritten when it is older than this, so hot reads do not turn into writes
+TOUCH_INTERVAL_S = 60.0
+
+# the totals of a database created before the totals table existed are counted once, in the same
+# transaction that creates the triggers
+SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    version TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    nbytes INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, entries, bytes) SELECT 0, COUNT(*), COALESCE(SUM(nbytes), 0) FROM embeddings;
+CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN
+    UPDATE totals SET entries = entries + 1, bytes = bytes + new.nbytes WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS embeddings_update AFTER UPDATE OF nbytes ON embeddings BEGIN
+    UPDATE totals SET bytes = bytes - old.nbytes + new.nbytes WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN
+    UPDATE totals SET entries = entries - 1, bytes = bytes - old.nbytes WHERE id = 0;
+END;
+COMMIT;
+"""
+
+
+def normalize_text(text):
+    """
+    Normalize text for cache keys: unicode NFC, trimmed, runs of whitespace collapsed
+    Case is kept because the transformer and OpenAI models are case sensitive
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model, version, text):
+    key = "\0".join((model, version, normalize_text(text)))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache shared by all processes that use the same path
+
+    Args:
+        path: SQLite database file
+        max_bytes: upper bound for the stored vectors; least recently used entries are evicted
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # one connection per thread and per process (connections must not cross a fork)
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_many(self, model, version, texts):
+        """
+        Look up several texts at once
+        Returns {text: vector} for the texts that are cached
+        Texts that normalize to the same key (e.g. differing only in whitespace) all get the vector
+        """
+        keys = {}
+        for text in dict.fromkeys(texts):
+            keys.setdefault(cache_key(model, version, text), []).append(text)
+        if not keys:
+            return {}
+        connection = self._connection()
+        found = {}
+        stale = []
+        now = time.time()
+        key_list = list(keys)
+        # stay well below SQLite's limit on bound parameters
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            rows = connection.execute(
+                "SELECT key, dtype, vector, last_used FROM embeddings WHERE key IN (%s)" % ",".join("?" * len(chunk)),
+                chunk,
+            ).fetchall()
+            for key, dtype, vector, last_used in rows:
+                vector = np.frombuffer(vector, dtype=dtype).copy()
+                for text in keys[key]:
+                    found[text] = vector
+                if now - last_used > TOUCH_INTERVAL_S:
+                    stale.append(key)
+        if stale:
+            try:
+                connection.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in stale])
+            except sqlite3.OperationalError:
+                # the LRU timestamp is best effort; a busy database must not fail a read
+                pass
+
+        hits = sum(1 for text in set(texts) if text in found)
+        self._count(hits, len(set(texts)) - hits)
+        return found
+
+    def get(self, model, version, text):
+        """
+        Cached vector for one text, or None
+        """
+        return self.get_many(model, version, [text]).get(text)
+
+    def put_many(self, model, version, vectors):
+        """
+        Store {text: vector} and evict old entries if the cache is over its size limit
+        """
+        now = time.time()
+        rows = []
+        for text, vector in vectors.items():
+            vector = np.ascontiguousarray(vector)
+            rows.append((cache_key(model, version, text), model, version, vector.dtype.str, vector.tobytes(), vector.nbytes, now))
+        if not rows:
+            return
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                # an upsert (not INSERT OR REPLACE, whose implicit delete fires no trigger) keeps the totals exact
+                "INSERT INTO embeddings (key, model, version, dtype, vector, nbytes, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "dtype = excluded.dtype, vector = excluded.vector, nbytes = excluded.nbytes, last_used = excluded.last_used",
+                rows,
+            )
+            self._evict(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def put(self, model, version, text, vector):
+        self.put_many(model, version, {text: vector})
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        evicted = []
+        for key, nbytes in connection.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used"):
+            evicted.append((key,))
+            excess -= nbytes
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        with self._lock:
+            self.evictions += len(evicted)
+
+    def stats(self):
+        """
+        Hit/miss counters of this process plus the size of the shared store
+        """
+        entries, total = self._connection().execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total,
+            }
+
+
+class NullEmbeddingCache:
+    """
+    Same interface as EmbeddingCache, but never stores anything (every lookup is a miss)
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, model, version, texts):
+        self.misses += len(set(texts))
+        return {}
+
+    def get(self, model, version, text):
+        self.misses += 1
+        return None
+
+    def put_many(self, model, version, vectors):
+        pass
+
+    def put(self, model, version, text, vector):
+        pass
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": 0, "entries": 0, "bytes": 0}
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_cache():
+    """
+    The process-wide embedding cache
+    Configure it with EMBEDDING_CACHE_PATH and EMBEDDING_CACHE_MAX_MB;
+    EMBEDDING_CACHE_PATH=off disables it
+    """
+    path = os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+    if path.lower() in ("", "off", "none"):
+        return NullEmbeddingCache()
+    max_mb = float(os.getenv("EMBEDDING_CACHE_MAX_MB", DEFAULT_MAX_MB))
+    return EmbeddingCache(path, max_bytes=int(max_mb * 1024 * 1024))
@@ -0,0 +1,472 @@
+### GloVe asset pipeline: verified, resumable, parallel fetches and a streaming text converter.
+# The word index pickle and embedding matrix of a model type (word_index_dict_<type>_temp.pkl,
+# embeddings_<type>_temp.npy) come from GLOVE_ASSET_SOURCE:
+#   gdrive (default)         the Google Drive files the app always used (gdown)
+#   a directory or file://   a local mirror, for offline installs
+#   http(s)://host/path/     a mirror serving <url>/<file name>
+# Files are fetched in parallel into <name>.part, resumed from what is already there (HTTP Range
+# requests, a seek for local files, gdown's resume), verified, and only then renamed to their final
+# name, so an interrupted or corrupt download is never mistaken for the asset. Verification uses the
+# sha256 recorded in GLOVE_ASSET_MANIFEST (glove_assets.json) or listed in the source's SHA256SUMS;
+# a file without a known hash has to pass a structural check (complete .npy payload, pickle STOP
+# opcode) and its hash is recorded for later fetches.
+# A source directory that holds the original Stanford release (glove.twitter.27B.<type>.txt, or the
+# glove.twitter.27B.zip archive) is converted straight into the GloVe store instead, streaming the
+# text in blocks of rows so memory stays bounded whatever the vocabulary size.
+#
+#   python glove_assets.py fetch 25d 50d 100d --source /mnt/glove
+#   python glove_assets.py convert glove.twitter.27B.zip --model-type 100d
+#   python glove_assets.py verify 50d
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from glove_store import GloveStoreWriter, convert_glove_pickle, glove_store_exists, glove_store_path
+from pipeline import get_executor
+
+# Google Drive ids of (word index pickle, embeddings npy) per model type
+GDRIVE_IDS = {
+    "25d": ("13qMXs3-oB9C6kfSRMwbAtzda9xuAUtt8", "1-RXcfBvWyE-Av3ZHLcyJVsps0RYRRr_2"),
+    "50d": ("1rB4ksHyHZ9skes-fJHMa2Z8J1Qa7awQ9", "1DBaVpJsitQ1qxtUvV1Kz7ThDc3az16kZ"),
+    "100d": ("1-oWV0LqG3fmrozRZ7WB1jzeTJHRUI3mq", "1SRHfX130_6Znz7zbdfqboKosz-PfNvNp"),
+}
+GLOVE_ZIP_NAME = "glove.twitter.27B.zip"
+DEFAULT_MANIFEST = "glove_assets.json"
+CHECKSUMS_NAME = "SHA256SUMS"
+CHUNK_BYTES = 1 << 20
+
+_manifest_lock = threading.Lock()
+
+
+class AssetError(RuntimeError):
+    """
+    Raised when an asset cannot be fetched or fails verification
+    """
+
+
+def asset_names(model_type):
+    """
+    (word index pickle, embeddings npy) file names of a model type
+    """
+    return "word_index_dict_" + str(model_type) + "_temp.pkl", "embeddings_" + str(model_type) + "_temp.npy"
+
+
+def glove_text_name(model_type):
+    return "glove.twitter.27B." + str(model_type) + ".txt"
+
+
+def asset_source():
+    return os.getenv("GLOVE_ASSET_SOURCE", "gdrive")
+
+
+def manifest_path():
+    return os.getenv("GLOVE_ASSET_MANIFEST", DEFAULT_MANIFEST)
+
+
+def local_directory(source):
+    """
+    Directory of a local source (a path or a file:// URL), None for remote ones
+    """
+    if source.startswith("file://"):
+        return urllib.request.url2pathname(urlsplit(source).path)
+    if source == "gdrive" or "://" in source:
+        return None
+    return source
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def record_hash(path, name, digest):
+    """
+    Add name -> sha256 to the manifest (rewritten atomically)
+    """
+    with _manifest_lock:
+        manifest = load_manifest(path)
+        manifest[name] = digest
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+
+def source_checksums(source):
+    """
+    {file name: sha256} from the source's SHA256SUMS (sha256sum output), empty without one
+    """
+    directory = local_directory(source)
+    try:
+        if directory is not None:
+            with open(os.path.join(directory, CHECKSUMS_NAME)) as f:
+                text = f.read()
+        elif source != "gdrive":
+            with urllib.request.urlopen(source.rstrip("/") + "/" + CHECKSUMS_NAME, timeout=30) as response:
+                text = response.read().decode("utf-8")
+        else:
+            return {}
+    except OSError:
+        return {}
+    checksums = {}
+    for line in text.splitlines():
+        digest, _, name = line.strip().partition(" ")
+        if digest and name:
+            checksums[os.path.basename(name.strip().lstrip("*"))] = digest.lower()
+    return checksums
+
+
+def check_structure(path):
+    """
+    Cheap completeness check for an asset without a known hash; raises AssetError
+    """
+    if path.endswith(".npy") or path.endswith(".npy.part"):
+        with open(path, "rb") as f:
+            try:
+                if np.lib.format.read_magic(f) == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            except ValueError as e:
+                raise AssetError(f"{path} is not a valid .npy file: {e}") from e
+            expected = f.tell() + int(np.prod(shape)) * dtype.itemsize
+        if os.path.getsize(path) != expected:
+            raise AssetError(f"{path} is truncated: {os.path.getsize(path)} of {expected} bytes")
+    else:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                raise AssetError(f"{path} is empty")
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != pickle.STOP:
+                raise AssetError(f"{path} is truncated (no pickle STOP opcode)")
+
+
+def verify_asset(path, name, expected=None):
+    """
+    sha256 of path, checked against expected (or the structural check without one); raises AssetError
+    """
+    if expected is None:
+        check_structure(path)
+    digest = file_sha256(path)
+    if expected is not None and digest != expected:
+        raise AssetError(f"{name}: sha256 {digest} does not match the expected {expected}")
+    return digest
+
+
+def fetch_local(source_path, part_path):
+    """
+    Copy source_path into part_path, continuing after the bytes part_path already has
+    """
+    size = os.path.getsize(source_path)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > size:
+        offset = 0
+    with open(source_path, "rb") as src, open(part_path, "r+b" if offset else "wb") as dst:
+        src.seek(offset)
+        dst.seek(offset)
+        dst.truncate()
+        for chunk in iter(lambda: src.read(CHUNK_BYTES), b""):
+            dst.write(chunk)
+
+
+def fetch_url(url, part_path):
+    """
+    Download url into part_path with a Range request for the bytes still missing
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    request = urllib.request.Request(url, headers={"Range": f"bytes={offset}-"} if offset else {})
+    try:
+        response = urllib.request.urlopen(request, timeout=60)
+    except urllib.error.HTTPError as e:
+        if e.code == 416:
+            # nothing left to fetch
+            return
+        raise
+    with response:
+        # 206: the server resumed; 200: it ignored the range and sends the whole file
+        mode = "ab" if response.status == 206 else "wb"
+        with open(part_path, mode) as f:
+            for chunk in iter(lambda: response.read(CHUNK_BYTES), b""):
+                f.write(chunk)
+
+
+def fetch_gdrive(file_id, part_path):
+    import gdown
+
+    try:
+        result = gdown.download(id=file_id, output=part_path, quiet=False, resume=True)
+    except TypeError:
+        # gdown before 4.5 has no resume
+        result = gdown.download(id=file_id, output=part_path, quiet=False)
+    if result is None:
+        raise AssetError(f"gdown could not download Google Drive file {file_id}")
+
+
+def fetch_asset(name, source, directory=".", gdrive_id=None, manifest=None, checksums=None):
+    """
+    Install one asset as directory/name: fetch (resuming a .part file), verify, rename
+    An already installed file is verified too and fetched again if it fails
+
+    Returns the installed path
+    """
+    manifest = manifest_path() if manifest is None else manifest
+    expected = load_manifest(manifest).get(name) or (checksums or {}).get(name)
+    final_path = os.path.join(directory, name)
+    if os.path.exists(final_path):
+        try:
+            digest = verify_asset(final_path, name, expected)
+            if expected is None:
+                record_hash(manifest, name, digest)
+            return final_path
+        except AssetError:
+            # e.g. left behind by an interrupted download of an older version
+            os.remove(final_path)
+
+    part_path = final_path + ".part"
+    local = local_directory(source)
+    try:
+        if local is not None:
+            fetch_local(os.path.join(local, name), part_path)
+        elif source == "gdrive":
+            fetch_gdrive(gdrive_id, part_path)
+        else:
+            fetch_url(source.rstrip("/") + "/" + name, part_path)
+    except (OSError, urllib.error.URLError) as e:
+        raise AssetError(f"Fetching {name} from {source} failed (kept {part_path} to resume): {e}") from e
+
+    try:
+        digest = verify_asset(part_path, name, expected)
+    except AssetError:
+        os.remove(part_path)
+        raise
+    os.replace(part_path, final_path)
+    if expected is None:
+        record_hash(manifest, name, digest)
+    return final_path
+
+
+def fetch_glove_assets(model_types, source=None, directory="."):
+    """
+    Fetch the pickle and npy of every model type in parallel
+
+    Returns {model_type: (word index path, embeddings path)}; raises the first AssetError after
+    every fetch has finished (the others are installed or left resumable)
+    """
+    if isinstance(model_types, str):
+        model_types = [model_types]
+    source = source or asset_source()
+    checksums = source_checksums(source)
+    futures = {}
+    for model_type in model_types:
+        for name, gdrive_id in zip(asset_names(model_type), GDRIVE_IDS.get(model_type, (None, None))):
+            futures[model_type, name] = get_executor("io").submit(
+                fetch_asset, name, source, directory, gdrive_id, None, checksums
+            )
+    errors = []
+    for future in futures.values():
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(e)
+    if errors:
+        raise errors[0]
+    return {
+        model_type: tuple(os.path.join(directory, name) for name in asset_names(model_type))
+        for model_type in model_types
+    }
+
+
+def find_glove_text(source, model_type):
+    """
+    (path, zip member or None) of the raw Stanford text for a model type in a local source, else None
+    """
+    directory = local_directory(source)
+    if directory is None:
+        return None
+    text_path = os.path.join(directory, glove_text_name(model_type))
+    if os.path.isfile(text_path):
+        return text_path, None
+    zip_path = os.path.join(directory, GLOVE_ZIP_NAME)
+    if os.path.isfile(zip_path):
+        with zipfile.ZipFile(zip_path) as archive:
+            if glove_text_name(model_type) in archive.namelist():
+                return zip_path, glove_text_name(model_type)
+    return None
+
+
+@contextlib.contextmanager
+def open_text(path, member=None):
+    """
+    Binary file object of a GloVe text file, or of a member of a zip archive (streamed)
+    """
+    if member is None:
+        with open(path, "rb") as f:
+            yield f
+    else:
+        with zipfile.ZipFile(path) as archive, archive.open(member) as f:
+            yield f
+
+
+def count_lines(path, member=None):
+    lines, last = 0, b"\n"
+    with open_text(path, member) as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    return lines + (last != b"\n")
+
+
+def parse_block(lines, dim, first_row=0, name="GloVe text"):
+    """
+    (words, (len(lines), dim) float32 matrix) of GloVe text lines
+    """
+    words, values = [], []
+    for line in lines:
+        word, _, rest = line.partition(b" ")
+        words.append(word.decode("utf-8", errors="replace"))
+        values.append(rest)
+    try:
+        return words, np.loadtxt(values, dtype=np.float32, ndmin=2).reshape(len(lines), dim)
+    except ValueError:
+        pass
+    # words containing spaces: the last dim fields of a line are the vector
+    words, values = [], []
+    for number, line in enumerate(lines):
+        fields = line.rstrip().rsplit(b" ", dim)
+        if len(fields) != dim + 1:
+            raise AssetError(f"{name} line {first_row + number + 1}: expected {dim} values")
+        words.append(fields[0].decode("utf-8", errors="replace"))
+        values.append(b" ".join(fields[1:]))
+    return words, np.loadtxt(values, dtype=np.float32, ndmin=2)
+
+
+def convert_glove_text(path, store_path, member=None, dim=None, block_rows=16384):
+    """
+    Convert a raw GloVe text file ("word v1 ... vdim" per line) into a GloVe store
+
+    Two streaming passes: one counts the rows, one parses block_rows lines at a time straight into
+    the store's memory-mapped matrix, so memory does not grow with the vocabulary. Rows follow the
+    lines of the file; a word repeated later in the file keeps its first row.
+    """
+    num_rows = count_lines(path, member)
+    with open_text(path, member) as f:
+        first = f.readline()
+    if dim is None:
+        dim = len(first.split()) - 1
+    writer = GloveStoreWriter(store_path, num_rows, num_rows, dim)
+    try:
+        with open_text(path, member) as f:
+            row = 0
+            while True:
+                block = list(itertools.islice(f, block_rows))
+                if not block:
+                    break
+                lines = [line for line in block if line.strip()]
+                if not lines:
+                    continue
+                words, vectors = parse_block(lines, dim, row, member or path)
+                writer.vectors[row:row + len(words)] = vectors
+                for offset, word in enumerate(words):
+                    writer.add_word(word, row + offset)
+                row += len(words)
+        return writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def ensure_glove_store(model_type, source=None, directory="."):
+    """
+    Path of the GloVe store of a model type, installing it first if needed: converted from the raw
+    Stanford text when a local source has it, otherwise from the fetched pickle and npy
+    """
+    store_path = os.path.join(directory, glove_store_path(model_type))
+    if glove_store_exists(store_path):
+        return store_path
+    source = source or asset_source()
+    text = find_glove_text(source, model_type)
+    if text is not None:
+        return convert_glove_text(text[0], store_path, text[1], dim=int(str(model_type).rstrip("d")))
+    word_index_path, embeddings_path = fetch_glove_assets(model_type, source, directory)[model_type]
+    return convert_glove_pickle(word_index_path, embeddings_path, store_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch, verify and convert GloVe assets")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch = commands.add_parser("fetch", help="fetch the pickle/npy assets (and build the stores)")
+    fetch.add_argument("model_types", nargs="+", choices=sorted(GDRIVE_IDS))
+    fetch.add_argument("--source", default=None, help="gdrive, a directory, file:// or http(s):// URL")
+    fetch.add_argument("--no-store", action="store_true", help="only fetch, do not build the stores")
+    convert = commands.add_parser("convert", help="convert raw GloVe text (or the Stanford zip) into a store")
+    convert.add_argument("path", help="glove.twitter.27B.<type>.txt or glove.twitter.27B.zip")
+    convert.add_argument("--model-type", required=True, help='e.g. "50d"')
+    convert.add_argument("--output", help="store directory (default: glove_<type>_store)")
+    verify = commands.add_parser("verify", help="check installed assets against the manifest")
+    verify.add_argument("model_types", nargs="+", choices=sorted(GDRIVE_IDS))
+    args = parser.parse_args(argv)
+
+    if args.command == "fetch":
+        if args.no_store:
+            for model_type, paths in fetch_glove_assets(args.model_types, args.source).items():
+                print(model_type, *paths)
+        else:
+            source = args.source or asset_source()
+            # every download runs in parallel first, then the stores are built one after another
+            to_fetch = [
+                model_type for model_type in args.model_types
+                if not glove_store_exists(glove_store_path(model_type)) and find_glove_text(source, model_type) is None
+            ]
+            if to_fetch:
+                fetch_glove_assets(to_fetch, source)
+            for model_type in args.model_types:
+                print("GloVe store ready:", ensure_glove_store(model_type, source))
+    elif args.command == "convert":
+        member = glove_text_name(args.model_type) if args.path.endswith(".zip") else None
+        output = args.output or glove_store_path(args.model_type)
+        print("Converted store written to", convert_glove_text(
+            args.path, output, member, dim=int(args.model_type.rstrip("d"))
+        ))
+    else:
+        manifest = load_manifest(manifest_path())
+        failed = False
+        for model_type in args.model_types:
+            for name in asset_names(model_type):
+                if not os.path.exists(name):
+                    print(f"{name}: not installed")
+                    continue
+                try:
+                    verify_asset(name, name, manifest.get(name))
+                    print(f"{name}: ok" + ("" if name in manifest else " (structure only, no recorded hash)"))
+                except AssetError as e:
+                    failed = True
+                    print(f"{name}: FAILED, {e}")
+        if failed:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+### Batched GloVe sentence averaging with a sparse bag-of-words product.
+# A compiled tokenizer maps text straight to embedding rows (with an LRU of word -> rows), a whole
+# batch of sentences becomes one scipy CSR matrix whose entries already hold the averaging weights,
+# and a single sparse x dense product against the embedding matrix yields every average at once.
+# Only the rows of words that actually occur are read, so this works on a memory-mapped matrix.
+# IDF weighting only changes the weights stored in the sparse matrix, so it costs nothing extra.
+# A single sentence does not pay for building a sparse matrix: encode_one looks its rows up directly.
+# This is the one GloVe tokenization: the app (sentences and category labels), classify.py, the
+# service and the category bundles all go through GloveBatchEncoder.
+
+import functools
+import re
+
+import numpy as np
+import scipy.sparse as sp
+
+# Text is split on whitespace and every lowercased word that is in the vocabulary is kept as it is
+# (so "<3", ":)", emoji and "e-mail" keep their vectors). Only a word the vocabulary does not have is
+# split further with TOKEN_PATTERN: words with inner apostrophes ("don't"), hashtags and mentions stay
+# single tokens, punctuation around words ("red," "blue.") is dropped
+TOKEN_PATTERN = r"[#@]?\w+(?:'\w+)*"
+
+OOV = -1
+
+
+class GloveBatchEncoder:
+    """
+    Sentence averages for batches of sentences
+
+    Args:
+        word_index_dict: word -> embedding row (dict or GloveStore)
+        embeddings: embedding matrix (may be memory-mapped)
+        idf: optional per-row weights (see compute_idf); None = plain average
+        cache_size: entries in the word -> rows LRU
+        count_oov: unknown tokens count as zero vectors in the average, like
+            averaged_glove_embeddings_gdrive; with False they are ignored
+    """
+
+    def __init__(self, word_index_dict, embeddings, idf=None, cache_size=1 << 17, count_oov=True):
+        self.word_index_dict = word_index_dict
+        self.embeddings = embeddings
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float32)
+        self.count_oov = count_oov
+        self.split_word = re.compile(TOKEN_PATTERN).findall
+        self.word_rows = functools.lru_cache(maxsize=cache_size)(self._word_rows)
+
+    def _lookup(self, token):
+        row = self.word_index_dict.get(token)
+        return OOV if row is None else int(row)
+
+    def _word_rows(self, word):
+        row = self._lookup(word)
+        if row != OOV:
+            return (row,)
+        return tuple(self._lookup(token) for token in self.split_word(word))
+
+    def token_rows(self, sentence):
+        """
+        Embedding rows of a sentence's tokens (OOV = -1)
+        """
+        rows = []
+        for word in sentence.lower().split():
+            rows.extend(self.word_rows(word))
+        return rows
+
+    def bag_of_words(self, sentences):
+        """
+        CSR matrix (n_sentences x n_rows) whose product with embeddings gives the averages
+        """
+        indptr = [0]
+        indices = []
+        weights = []
+        for sentence in sentences:
+            rows = self.token_rows(sentence)
+            known = [row for row in rows if row != OOV]
+            if self.idf is not None:
+                row_weights = self.idf[known] if known else np.empty(0, dtype=np.float32)
+                total = float(row_weights.sum())
+                row_weights = row_weights / total if total > 0 else row_weights
+            else:
+                denominator = len(rows) if self.count_oov else len(known)
+                row_weights = np.full(len(known), 1.0 / denominator if denominator else 0.0, dtype=np.float32)
+            indices.extend(known)
+            weights.append(row_weights)
+            indptr.append(len(indices))
+        data = np.concatenate(weights).astype(np.float32) if weights else np.empty(0, dtype=np.float32)
+        return sp.csr_matrix(
+            (data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(sentences), self.embeddings.shape[0]),
+        )
+
+    def encode(self, sentences):
+        """
+        (n_sentences x dim) float32 matrix of sentence averages
+        """
+        sentences = list(sentences)
+        if not sentences:
+            return np.zeros((0, self.embeddings.shape[1]), dtype=np.float32)
+        if len(sentences) == 1:
+            return self.encode_one(sentences[0])[None]
+        bag = self.bag_of_words(sentences)
+        # gather only the distinct rows this batch uses: a memory-mapped matrix is never read in full,
+        # and a float64 matrix is never converted to float32 as a whole
+        used = np.unique(bag.indices)
+        compact = sp.csr_matrix((bag.data, np.searchsorted(used, bag.indices), bag.indptr), shape=(len(sentences), len(used)))
+        return np.asarray(compact @ np.asarray(self.embeddings[used], dtype=np.float32), dtype=np.float32)
+
+    def encode_one(self, sentence):
+        """
+        Average of one sentence (dim,), from its rows looked up directly
+        """
+        rows = self.token_rows(sentence)
+        known = [row for row in rows if row != OOV]
+        if not known:
+            return np.zeros(self.embeddings.shape[1], dtype=np.float32)
+        vectors = np.asarray(self.embeddings[known], dtype=np.float32)
+        if self.idf is not None:
+            weights = self.idf[known]
+            total = float(weights.sum())
+            return (weights / total if total > 0 else weights) @ vectors
+        return vectors.sum(axis=0) / np.float32(len(rows) if self.count_oov else len(known))
+
+
+def compute_idf(encoder, sentences):
+    """
+    Smoothed IDF weight per embedding row from a corpus: log((1 + N) / (1 + df)) + 1
+    Rows that never occur get the weight of a word seen in no document
+    """
+    document_frequency = np.zeros(encoder.embeddings.shape[0], dtype=np.int64)
+    count = 0
+    for sentence in sentences:
+        rows = {row for row in encoder.token_rows(sentence) if row != OOV}
+        document_frequency[list(rows)] += 1
+        count += 1
+    return (np.log((1.0 + count) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+
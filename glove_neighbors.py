@@ -0,0 +1,168 @@
+### Nearest-word lookup over the full GloVe vocabulary.
+# Works on the (word_index_dict, embeddings) pair returned by load_glove_embeddings_gdrive.
+# The embedding matrix is row-normalized once (blockwise, so a memory-mapped matrix is never
+# fully materialized in float64), after which a query is a blocked matrix product with
+# argpartition top-k (vector_index.blocked_top_k). For a GloVe store the normalized matrix is
+# saved in a cache directory of its own and memory-mapped on later starts; it is never written into
+# the store, which may be the read-only asset directory or the shared copy in /dev/shm.
+#
+#   GLOVE_NORMALIZED_DIR   cache directory (default glove_normalized); "off" normalizes in memory
+
+import functools
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from glove_shared import open_glove_store
+from glove_store import GloveStore, glove_store_path
+from scoring import normalize_rows
+from vector_index import blocked_top_k
+
+DEFAULT_NORMALIZED_DIR = "glove_normalized"
+NORMALIZE_BLOCK_ROWS = 65536
+
+
+def normalize_matrix(embeddings, out=None, block_rows=NORMALIZE_BLOCK_ROWS):
+    """
+    Row-normalized float32 copy of embeddings, computed block by block
+    out can be a preallocated (e.g. memory-mapped) array
+    """
+    if out is None:
+        out = np.empty(embeddings.shape, dtype=np.float32)
+    for start in range(0, len(embeddings), block_rows):
+        out[start:start + block_rows] = normalize_rows(embeddings[start:start + block_rows])
+    return out
+
+
+def normalized_matrix_path(store, cache_dir):
+    """
+    File for the normalized matrix of a GloveStore in cache_dir
+    Named after the store's meta.json and vectors.npy (size and mtime), so a rebuilt store gets a new
+    file and the shared-memory copy (copied with its mtime) uses the one of the store on disk
+    """
+    vectors = os.stat(os.path.join(store.path, "vectors.npy"))
+    key = json.dumps(store.meta, sort_keys=True) + f"\0{vectors.st_size}\0{vectors.st_mtime_ns}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+    rows, dim = store.embeddings.shape
+    return os.path.join(cache_dir, f"vectors_normalized-{rows}x{dim}-{digest}.npy")
+
+
+def load_normalized_matrix(store, cache_dir=None):
+    """
+    Normalized matrix of a GloveStore, built once in cache_dir and memory-mapped afterwards
+    cache_dir defaults to GLOVE_NORMALIZED_DIR; "off" computes it in memory every time
+    """
+    cache_dir = cache_dir or os.getenv("GLOVE_NORMALIZED_DIR", DEFAULT_NORMALIZED_DIR)
+    if cache_dir.lower() in ("off", "none"):
+        return normalize_matrix(store.embeddings)
+    path = normalized_matrix_path(store, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + ".tmp-" + str(os.getpid())
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=store.embeddings.shape)
+        normalize_matrix(store.embeddings, out)
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+class GloveNeighbors:
+    """
+    Nearest-neighbour word search
+
+    Args:
+        word_index_dict: word -> row mapping (dict or GloveStore)
+        embeddings: embedding matrix (may be memory-mapped)
+        block_rows: rows per matrix product; bounds peak memory to n_queries x block_rows scores
+    """
+
+    def __init__(self, word_index_dict, embeddings, block_rows=NORMALIZE_BLOCK_ROWS):
+        self.word_index_dict = word_index_dict
+        self.block_rows = block_rows
+        if isinstance(word_index_dict, GloveStore):
+            self.matrix = load_normalized_matrix(word_index_dict)
+            # row -> vocabulary entry, so results can be turned back into words
+            self.row_entry = np.full(len(embeddings), -1, dtype=np.int64)
+            self.row_entry[np.asarray(word_index_dict.rows)] = np.arange(len(word_index_dict))
+            self.row_word = lambda row: word_index_dict.word(self.row_entry[row]) if self.row_entry[row] >= 0 else None
+        else:
+            self.matrix = normalize_matrix(embeddings)
+            row_words = [None] * len(embeddings)
+            for word, row in word_index_dict.items():
+                row_words[row] = word
+            self.row_word = row_words.__getitem__
+
+    def vector(self, word):
+        """
+        Normalized vector of a word (lowercased like get_glove_embeddings), or None if unknown
+        """
+        row = self.word_index_dict.get(word.lower())
+        if row is None:
+            return None
+        return np.asarray(self.matrix[row], dtype=np.float32)
+
+    def search_vectors(self, queries, k=10, exclude=()):
+        """
+        Nearest words for a batch of query vectors
+        exclude: per-query collections of words to leave out (e.g. the query words themselves)
+
+        Returns a list of [(word, cosine), ...] per query, highest first
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        exclude = list(exclude) or [()] * len(queries)
+        extra = max((len(words) for words in exclude), default=0)
+        scores, rows = blocked_top_k(self.matrix, queries, k + extra, self.block_rows)
+        results = []
+        for query_scores, query_rows, excluded in zip(scores, rows, exclude):
+            excluded = {word.lower() for word in excluded}
+            neighbours = []
+            for score, row in zip(query_scores, query_rows):
+                if row < 0:
+                    break
+                word = self.row_word(row)
+                if word is None or word in excluded:
+                    continue
+                neighbours.append((word, float(score)))
+                if len(neighbours) == k:
+                    break
+            results.append(neighbours)
+        return results
+
+    def nearest(self, words, k=10):
+        """
+        Nearest words for each of several words (one batched search)
+        Unknown words get an empty list
+        """
+        vectors = [self.vector(word) for word in words]
+        known = [index for index, vector in enumerate(vectors) if vector is not None]
+        results = [[] for _ in words]
+        if known:
+            found = self.search_vectors(
+                np.stack([vectors[index] for index in known]), k, [[words[index]] for index in known]
+            )
+            for index, neighbours in zip(known, found):
+                results[index] = neighbours
+        return results
+
+    def analogy(self, a, b, c, k=10):
+        """
+        "a is to b as c is to ?": nearest words to b - a + c, excluding a, b and c
+        Returns [] if one of the words is unknown
+        """
+        vectors = [self.vector(word) for word in (a, b, c)]
+        if any(vector is None for vector in vectors):
+            return []
+        query = vectors[1] - vectors[0] + vectors[2]
+        return self.search_vectors(query, k, [[a, b, c]])[0]
+
+
+@functools.lru_cache(maxsize=None)
+def load_glove_neighbors(model_type):
+    """
+    GloveNeighbors for the GloVe store of a model type (once per process)
+    """
+    store = open_glove_store(glove_store_path(model_type))
+    return GloveNeighbors(store, store.embeddings)
@@ -0,0 +1,131 @@
+### Shared-memory residency for GloVe stores.
+# A GloVe store is memory-mapped, so worker processes already share its pages through the page
+# cache, but those pages can be evicted and read back from disk. With GLOVE_SHARED_MEMORY=1 the
+# first worker publishes the store into /dev/shm (tmpfs, i.e. RAM) and every worker maps those same
+# files: one resident copy of the matrix and the vocabulary index, attached zero-copy. The arrays
+# are read-only, so reading them needs no locks.
+#
+# Lifecycle: each attached process holds a shared flock on <root>/<name>.lock. When a process exits
+# it tries to take that lock exclusively; if no other process is attached, it removes the copy and
+# the lock file (a process that locked the removed lock file notices and retries with a new one).
+# The kernel drops the locks of processes that crash, and removing tmpfs files that are still
+# mapped is safe (their memory is freed when the last mapping goes away).
+
+import atexit
+import fcntl
+import functools
+import hashlib
+import os
+import shutil
+
+from glove_store import GloveStore, glove_store_exists, load_glove_store
+
+SHM_ROOT = "/dev/shm"
+
+
+def shared_memory_enabled():
+    return os.getenv("GLOVE_SHARED_MEMORY") == "1"
+
+
+def shared_store_name(store_path):
+    """
+    Name of the shared copy: changes when the store is moved or rebuilt
+    """
+    store_path = os.path.abspath(store_path)
+    with open(os.path.join(store_path, "meta.json"), "rb") as f:
+        digest = hashlib.blake2b(store_path.encode("utf-8") + b"\0" + f.read(), digest_size=8).hexdigest()
+    return "textsearch-" + os.path.basename(store_path) + "-" + digest
+
+
+def publish_store(store_path, shared_path):
+    """
+    Copy a store to shared_path (atomically; a concurrent publisher may win the race)
+    """
+    if glove_store_exists(shared_path):
+        return
+    tmp_path = shared_path + ".tmp-" + str(os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    # meta.json last, like GloveStoreWriter, so a partial copy is never a valid store
+    # (vectors_normalized.npy: written into the store by older versions of glove_neighbors.py)
+    shutil.copytree(
+        store_path, tmp_path, ignore=shutil.ignore_patterns("meta.json", "*.tmp-*", "vectors_normalized.npy")
+    )
+    shutil.copy2(os.path.join(store_path, "meta.json"), os.path.join(tmp_path, "meta.json"))
+    try:
+        os.rename(tmp_path, shared_path)
+    except OSError:
+        # another worker published it first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not glove_store_exists(shared_path):
+            raise
+
+
+class SharedGloveStore:
+    """
+    Attachment of this process to the shared copy of a GloVe store
+
+    Args:
+        store_path: the GloVe store on disk
+        root: tmpfs directory for the shared copy
+    """
+
+    def __init__(self, store_path, root=SHM_ROOT):
+        name = shared_store_name(store_path)
+        self.path = os.path.join(root, name)
+        self.lock_path = os.path.join(root, name + ".lock")
+        self._lock_file = self._lock_shared()
+        try:
+            publish_store(store_path, self.path)
+            self.store = GloveStore(self.path)
+        except BaseException:
+            self._lock_file.close()
+            raise
+
+    def _lock_shared(self):
+        while True:
+            lock_file = open(self.lock_path, "a+")
+            # blocks while an exiting process is removing the copy
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(self.lock_path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            # the lock file was removed by the last process of an earlier group; start over
+            lock_file.close()
+
+    def release(self):
+        """
+        Detach; the last process to detach removes the shared copy
+        The store stays readable in this process (its files are still mapped)
+        """
+        if self._lock_file.closed:
+            return
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.unlink(self.lock_path)
+        finally:
+            self._lock_file.close()
+
+
+@functools.lru_cache(maxsize=None)
+def attach_glove_store(store_path, root=SHM_ROOT):
+    """
+    GloveStore read from the shared copy (once per process, released at exit)
+    """
+    shared = SharedGloveStore(store_path, root)
+    atexit.register(shared.release)
+    return shared.store
+
+
+def open_glove_store(store_path):
+    """
+    The store's shared-memory copy with GLOVE_SHARED_MEMORY=1, the store on disk otherwise
+    """
+    if shared_memory_enabled() and os.path.isdir(SHM_ROOT):
+        return attach_glove_store(store_path)
+    return load_glove_store(store_path)
@@ -0,0 +1,276 @@
+### Compact, memory-mapped GloVe store.
+# The pickled word_index dict + full np.load of the embeddings is replaced by a directory of flat arrays:
+#   vectors.npy       float32 embedding matrix (rows as in the original embeddings_*_temp.npy)
+#   words.bin         utf-8 bytes of every word, back to back
+#   word_offsets.npy  start offset of each word in words.bin (+ one end offset)
+#   word_rows.npy     embedding row of each word
+#   word_hashes.npy   64-bit hash of each word
+#   table.npy         open-addressing hash table: slot -> word entry (-1 = empty)
+#   meta.json         format version and shapes, written last so a half-built store is never picked up
+# Everything is opened with mmap_mode="r", so a cold start only maps files and the OS shares the pages
+# between worker processes.
+
+import functools
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+STORE_VERSION = 1
+EMPTY_SLOT = -1
+
+
+def glove_store_path(model_type):
+    """
+    Default store directory for a GloVe model type ("25d", "50d", "100d")
+    """
+    return "glove_" + str(model_type) + "_store"
+
+
+def hash_word(word_bytes):
+    """
+    Stable 64-bit hash of a utf-8 encoded word
+    """
+    return int.from_bytes(hashlib.blake2b(word_bytes, digest_size=8).digest(), "little")
+
+
+def table_capacity(num_words):
+    """
+    Hash table size: power of two with a load factor of at most 0.5
+    """
+    capacity = 1
+    while capacity < 2 * max(num_words, 1):
+        capacity *= 2
+    return capacity
+
+
+class GloveStoreWriter:
+    """
+    Streaming writer for a GloVe store
+
+    Vectors and the vocabulary are written straight into memory-mapped files, so building a store
+    never needs the whole vocabulary or matrix in memory. The store is built in a temporary
+    directory and moved into place by close().
+
+    Args:
+        path: target store directory
+        num_words: number of words that will be added (sizes the hash table)
+        num_rows: number of embedding rows
+        dim: embedding dimension
+    """
+
+    def __init__(self, path, num_words, num_rows, dim, dtype=np.float32):
+        self.path = path
+        self.tmp_path = path + ".tmp-" + str(os.getpid())
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+
+        self.num_words = num_words
+        self.capacity = table_capacity(num_words)
+        self.vectors = np.lib.format.open_memmap(
+            os.path.join(self.tmp_path, "vectors.npy"), mode="w+", dtype=dtype, shape=(num_rows, dim)
+        )
+        self.offsets = np.lib.format.open_memmap(
+            os.path.join(self.tmp_path, "word_offsets.npy"), mode="w+", dtype=np.int64, shape=(num_words + 1,)
+        )
+        self.rows = np.lib.format.open_memmap(
+            os.path.join(self.tmp_path, "word_rows.npy"), mode="w+", dtype=np.int64, shape=(num_words,)
+        )
+        self.hashes = np.lib.format.open_memmap(
+            os.path.join(self.tmp_path, "word_hashes.npy"), mode="w+", dtype=np.uint64, shape=(num_words,)
+        )
+        self.table = np.lib.format.open_memmap(
+            os.path.join(self.tmp_path, "table.npy"), mode="w+", dtype=np.int64, shape=(self.capacity,)
+        )
+        self.table[:] = EMPTY_SLOT
+        self.words_file = open(os.path.join(self.tmp_path, "words.bin"), "w+b")
+        self.count = 0
+        self.offset = 0
+
+    def add_word(self, word, row):
+        """
+        Add a word pointing at an embedding row
+        Returns False (and adds nothing) if the word is already in the store
+        """
+        word_bytes = word.encode("utf-8")
+        word_hash = hash_word(word_bytes)
+        mask = self.capacity - 1
+        slot = word_hash & mask
+        while self.table[slot] != EMPTY_SLOT:
+            entry = int(self.table[slot])
+            # equal hashes are only the same word if the bytes are equal too (64-bit collisions)
+            if int(self.hashes[entry]) == word_hash and self._word_bytes(entry) == word_bytes:
+                return False
+            slot = (slot + 1) & mask
+        if self.count >= self.num_words:
+            raise ValueError("More words added than the store was sized for")
+
+        self.table[slot] = self.count
+        self.hashes[self.count] = word_hash
+        self.rows[self.count] = row
+        self.offsets[self.count] = self.offset
+        self.words_file.write(word_bytes)
+        self.offset += len(word_bytes)
+        self.count += 1
+        return True
+
+    def _word_bytes(self, entry):
+        self.words_file.flush()
+        start = int(self.offsets[entry])
+        end = int(self.offsets[entry + 1]) if entry + 1 < self.count else self.offset
+        return os.pread(self.words_file.fileno(), end - start, start)
+
+    def close(self):
+        """
+        Flush everything and atomically install the store at self.path
+        """
+        self.words_file.close()
+        self.offsets[self.count] = self.offset
+        num_words = self.count
+        for array in (self.vectors, self.offsets, self.rows, self.hashes, self.table):
+            array.flush()
+        del self.vectors, self.offsets, self.rows, self.hashes, self.table
+
+        with open(os.path.join(self.tmp_path, "meta.json"), "w") as f:
+            json.dump({"version": STORE_VERSION, "num_words": num_words, "capacity": self.capacity}, f)
+
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        """
+        Throw away a partially built store
+        """
+        if not self.words_file.closed:
+            self.words_file.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class GloveStore:
+    """
+    Read-only GloVe store, memory-mapped from disk
+
+    Behaves like the old word_index_dict ("word in store", store[word] -> row, store.get(word)),
+    so it can be passed anywhere word_index_dict is used. The embedding matrix is store.embeddings.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported GloVe store version in {path}: {self.meta.get('version')}")
+
+        self.embeddings = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "word_offsets.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, "word_rows.npy"), mmap_mode="r")
+        self.hashes = np.load(os.path.join(path, "word_hashes.npy"), mmap_mode="r")
+        self.table = np.load(os.path.join(path, "table.npy"), mmap_mode="r")
+        words_path = os.path.join(path, "words.bin")
+        if os.path.getsize(words_path) > 0:
+            self.words = np.memmap(words_path, dtype=np.uint8, mode="r")
+        else:
+            self.words = np.zeros(0, dtype=np.uint8)
+        self.num_words = self.meta["num_words"]
+        self.mask = self.meta["capacity"] - 1
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    def word(self, entry):
+        """
+        The word stored at a vocabulary entry
+        """
+        return self.word_bytes(entry).decode("utf-8")
+
+    def word_bytes(self, entry):
+        return self.words[self.offsets[entry]:self.offsets[entry + 1]].tobytes()
+
+    def find(self, word):
+        """
+        Vocabulary entry of a word, or -1 if the word is not in the store
+        """
+        word_bytes = word.encode("utf-8")
+        word_hash = hash_word(word_bytes)
+        slot = word_hash & self.mask
+        while True:
+            entry = int(self.table[slot])
+            if entry == EMPTY_SLOT:
+                return -1
+            if int(self.hashes[entry]) == word_hash and self.word_bytes(entry) == word_bytes:
+                return entry
+            slot = (slot + 1) & self.mask
+
+    def get(self, word, default=None):
+        entry = self.find(word)
+        if entry < 0:
+            return default
+        return int(self.rows[entry])
+
+    def __contains__(self, word):
+        return self.find(word) >= 0
+
+    def __getitem__(self, word):
+        entry = self.find(word)
+        if entry < 0:
+            raise KeyError(word)
+        return int(self.rows[entry])
+
+    def __len__(self):
+        return self.num_words
+
+
+@functools.lru_cache(maxsize=None)
+def load_glove_store(path):
+    """
+    Open a GloVe store (once per process)
+    """
+    return GloveStore(path)
+
+
+def glove_store_exists(path):
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def convert_glove_pickle(word_index_path, embeddings_path, store_path, block_rows=65536):
+    """
+    Convert the word_index_dict_*_temp.pkl / embeddings_*_temp.npy pair into a GloVe store
+    The embeddings are copied block by block as float32
+    """
+    with open(word_index_path, "rb") as f:
+        word_index_dict = pickle.load(f, encoding="latin")
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+
+    writer = GloveStoreWriter(store_path, len(word_index_dict), embeddings.shape[0], embeddings.shape[1])
+    try:
+        for start in range(0, embeddings.shape[0], block_rows):
+            writer.vectors[start:start + block_rows] = embeddings[start:start + block_rows]
+        for word, row in word_index_dict.items():
+            writer.add_word(word, int(row))
+        return writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert GloVe npy/pkl files into a memory-mapped store")
+    parser.add_argument("model_type", help='GloVe model type, e.g. "50d"')
+    parser.add_argument("--word-index", help="word_index pickle (default: word_index_dict_<type>_temp.pkl)")
+    parser.add_argument("--embeddings", help="embeddings npy (default: embeddings_<type>_temp.npy)")
+    parser.add_argument("--output", help="store directory (default: glove_<type>_store)")
+    args = parser.parse_args()
+
+    word_index_path = args.word_index or "word_index_dict_" + args.model_type + "_temp.pkl"
+    embeddings_path = args.embeddings or "embeddings_" + args.model_type + "_temp.npy"
+    output = args.output or glove_store_path(args.model_type)
+    print("Converted store written to", convert_glove_pickle(word_index_path, embeddings_path, output))
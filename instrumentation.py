@@ -0,0 +1,264 @@
+### Per-stage timing and resource instrumentation.
+# Every instrumented stage (loading, embedding per model, category embedding, scoring, plotting)
+# records wall time, call count, errors and bytes allocated into a process-wide registry.
+# The registry can be rendered as Prometheus text or JSON and served on a local port for scraping.
+# Bytes allocated come from tracemalloc and are only recorded while it is tracing
+# (INSTRUMENT_TRACEMALLOC=1 or metrics.enable_allocation_tracking()); tracing is process-wide,
+# so concurrent stages see each other's allocations.
+# Besides the process-wide registry, a stage is also recorded into the RunMetrics bound to its
+# thread (metrics.bind_run), so the work of one unit (e.g. one Streamlit rerun of one session) can be
+# shown on its own, with its own maxima, without the other sessions' work.
+
+import contextlib
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.bytes_allocated = 0
+
+    def add(self, elapsed, failed, allocated):
+        self.calls += 1
+        self.errors += failed
+        self.total_s += elapsed
+        self.max_s = max(self.max_s, elapsed)
+        self.bytes_allocated += allocated
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_s": self.total_s,
+            "mean_s": self.total_s / self.calls if self.calls else 0.0,
+            "max_s": self.max_s,
+            "bytes_allocated": self.bytes_allocated,
+        }
+
+
+class RunMetrics:
+    """
+    Stage timings of one unit of work, recorded by the threads it is bound to (Metrics.bind_run)
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, elapsed, failed, allocated):
+        with self._lock:
+            self._stages.setdefault(key, StageStats()).add(elapsed, failed, allocated)
+
+    def stages(self):
+        """
+        {(stage, label): stats dict}, same shape as the "stages" of Metrics.snapshot()
+        """
+        with self._lock:
+            return {key: stats.as_dict() for key, stats in self._stages.items()}
+
+
+_local = threading.local()
+
+
+class Metrics:
+    """
+    Registry of stage timings plus gauges from registered collectors
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def enable_allocation_tracking(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add_collector(self, name, fn):
+        """
+        Register fn() -> {key: number}; exported as gauges <name>_<key> (e.g. cache hit/miss counters)
+        """
+        with self._lock:
+            self._collectors[name] = fn
+
+    @contextlib.contextmanager
+    def stage(self, name, label=""):
+        """
+        Time a block as stage name (label: usually the model)
+        """
+        tracing = tracemalloc.is_tracing()
+        allocated_before = tracemalloc.get_traced_memory()[0] if tracing else 0
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = max(0, tracemalloc.get_traced_memory()[0] - allocated_before) if tracing else 0
+            with self._lock:
+                self._stages.setdefault((name, label), StageStats()).add(elapsed, failed, allocated)
+            run = getattr(_local, "run", None)
+            if run is not None:
+                run.record((name, label), elapsed, failed, allocated)
+
+    @contextlib.contextmanager
+    def bind_run(self, run):
+        """
+        Also record the stages of this thread into run (a RunMetrics, or None) within the block
+        """
+        previous, _local.run = getattr(_local, "run", None), run
+        try:
+            yield run
+        finally:
+            _local.run = previous
+
+    def start_run(self):
+        """
+        Bind a new RunMetrics to this thread, replacing the previous one, and return it
+        (for a thread that starts a new unit of work each time, like a Streamlit script thread)
+        """
+        _local.run = RunMetrics()
+        return _local.run
+
+    def current_run(self):
+        """
+        RunMetrics bound to this thread, if any (to bind it in worker threads)
+        """
+        return getattr(_local, "run", None)
+
+    def timed(self, name, label=""):
+        """
+        Decorator version of stage(); label can be a string or a function of the call's arguments
+        """
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                stage_label = label(*args, **kwargs) if callable(label) else label
+                with self.stage(name, stage_label):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self):
+        """
+        {"stages": {(stage, label): stats dict}, "gauges": {name: value}}
+        """
+        with self._lock:
+            stages = {key: stats.as_dict() for key, stats in self._stages.items()}
+            collectors = dict(self._collectors)
+        gauges = {}
+        for name, fn in collectors.items():
+            try:
+                values = fn()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    gauges[name + "_" + key] = value
+        return {"stages": stages, "gauges": gauges}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def to_json(self):
+        snapshot = self.snapshot()
+        stages = [dict(stage=name, label=label, **stats) for (name, label), stats in sorted(snapshot["stages"].items())]
+        return json.dumps({"stages": stages, "gauges": snapshot["gauges"]}, indent=2)
+
+    def to_prometheus(self, prefix="textsearch"):
+        snapshot = self.snapshot()
+        lines = []
+        series = (
+            ("stage_calls_total", "counter", "Number of calls per stage", "calls"),
+            ("stage_errors_total", "counter", "Number of failed calls per stage", "errors"),
+            ("stage_seconds_total", "counter", "Wall time spent per stage", "total_s"),
+            ("stage_seconds_max", "gauge", "Slowest call per stage", "max_s"),
+            ("stage_allocated_bytes_total", "counter", "Bytes allocated per stage (tracemalloc)", "bytes_allocated"),
+        )
+        for metric, kind, help_text, field in series:
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for (name, label), stats in sorted(snapshot["stages"].items()):
+                lines.append(f'{prefix}_{metric}{{stage="{name}",model="{label}"}} {stats[field]}')
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def stage_delta(before, after):
+    """
+    Per-stage difference between two snapshots of the process-wide registry
+
+    The difference includes the work of every thread in between (use RunMetrics for one unit of
+    work). max_s is only known when the maximum grew in between (then it is the new maximum);
+    otherwise it is None.
+    """
+    delta = {}
+    for key, stats in after["stages"].items():
+        previous = before["stages"].get(key)
+        if previous is None:
+            delta[key] = dict(stats)
+            continue
+        calls = stats["calls"] - previous["calls"]
+        if calls == 0:
+            continue
+        total_s = stats["total_s"] - previous["total_s"]
+        delta[key] = {
+            "calls": calls,
+            "errors": stats["errors"] - previous["errors"],
+            "total_s": total_s,
+            "mean_s": total_s / calls,
+            "max_s": stats["max_s"] if stats["max_s"] > previous["max_s"] else None,
+            "bytes_allocated": stats["bytes_allocated"] - previous["bytes_allocated"],
+        }
+    return delta
+
+
+metrics = Metrics()
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=None):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json on a background thread
+    """
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = registry.to_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            body = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
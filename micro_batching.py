@@ -0,0 +1,130 @@
+### Dynamic micro-batching for model inference shared across sessions.
+# Concurrent callers submit single items; a background thread collects them for up to max_wait_ms
+# (or until max_batch_size items are waiting), runs one batched call, and routes every result back
+# to its caller through a Future. This turns many batch-size-1 forward passes into a few larger ones.
+
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# number of recent queueing delays kept for the percentiles in stats()
+DELAY_WINDOW = 10000
+
+
+class MicroBatcher:
+    """
+    Collects single requests into batches for encode_batch
+
+    Args:
+        encode_batch: callable(list of items) -> sequence of results, one per item
+        max_batch_size: largest batch passed to encode_batch
+        max_wait_ms: how long the first item of a batch waits for more items
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0, name="micro-batcher"):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = collections.Counter()
+        self.delays = collections.deque(maxlen=DELAY_WINDOW)
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        Queue one item; returns a Future with its result
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def encode(self, item, timeout=None):
+        """
+        Submit one item and wait for its result
+        """
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # close() was called; finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            # callers may have cancelled their futures while waiting in the queue
+            live = [(item, future) for item, future, _ in batch if future.set_running_or_notify_cancel()]
+            items = [item for item, _ in live]
+            futures = [future for _, future in live]
+            with self._lock:
+                self.batches += 1
+                self.items += len(items)
+                self.batch_sizes[len(items)] += 1
+                self.delays.extend(started - enqueued for _, _, enqueued in batch)
+            if not items:
+                continue
+            try:
+                results = self.encode_batch(items)
+            except BaseException as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self):
+        """
+        Achieved batch sizes and queueing delays (milliseconds)
+        """
+        with self._lock:
+            delays = np.array(self.delays) * 1000.0
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+            batches, items = self.batches, self.items
+        return {
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "batch_sizes": batch_sizes,
+            "queue_delay_ms_mean": float(delays.mean()) if len(delays) else 0.0,
+            "queue_delay_ms_p50": float(np.percentile(delays, 50)) if len(delays) else 0.0,
+            "queue_delay_ms_p95": float(np.percentile(delays, 95)) if len(delays) else 0.0,
+            "queue_delay_ms_max": float(delays.max()) if len(delays) else 0.0,
+        }
+
+    def close(self):
+        """
+        Stop the batching thread after the queued items are processed
+        """
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
@@ -16,17 +16,37 @@
 
 ### Import necessary libraries: here you will use streamlit library to run a text search demo, please make sure to install it.
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import numpy as np
 import numpy.linalg as la
 import pickle
 import subprocess
 import sys
 import os
-import gdown
-from sentence_transformers import SentenceTransformer
-import matplotlib.pyplot as plt
+import threading
 import math
-from openai import OpenAI  # Added for OpenAI embeddings
+import re
+# gdown, sentence_transformers (torch), openai and matplotlib are imported where they are used,
+# so a rerun or a headless caller only pays for the libraries it actually needs
+from category_bundles import embed_with_bundles, load_bundles
+from category_registry import CategoryRegistry
+from coalescing import SessionWork, Singleflight, Superseded
+from embedders import OPENAI_EMBEDDING_VERSION, OPENAI_MODELS, EmbeddingError
+from embedding_cache import get_embedding_cache
+from openai_batching import BatchEmbedder
+from openai_limits import RateLimited, build_openai_client
+from pipeline import ModelJob, run_concurrently
+import st_inference
+from micro_batching import MicroBatcher
+from instrumentation import metrics, start_metrics_server
+from charts import chart_inputs, pie_chart_png, pie_chart_spec, pie_figure
+from glove_batch import GloveBatchEncoder
+from glove_neighbors import load_glove_neighbors
+from glove_shared import open_glove_store
+from glove_assets import GDRIVE_IDS, asset_source, ensure_glove_store, fetch_glove_assets
+from glove_store import glove_store_exists, glove_store_path
+from pairwise import embed_unique, similarity_matrix
+from warmup import WarmUp, shared_loader
 
 
 ### Some predefined utility functions for you to load the text embeddings
@@ -40,92 +60,104 @@ def load_glove_embeddings(glove_path="Data/embeddings.pkl"):
 
 
 def get_model_id_gdrive(model_type):
-    if model_type == "25d":
-        word_index_id = "13qMXs3-oB9C6kfSRMwbAtzda9xuAUtt8"
-        embeddings_id = "1-RXcfBvWyE-Av3ZHLcyJVsps0RYRRr_2"
-    elif model_type == "50d":
-        embeddings_id = "1DBaVpJsitQ1qxtUvV1Kz7ThDc3az16kZ"
-        word_index_id = "1rB4ksHyHZ9skes-fJHMa2Z8J1Qa7awQ9"
-    elif model_type == "100d":
-        word_index_id = "1-oWV0LqG3fmrozRZ7WB1jzeTJHRUI3mq"
-        embeddings_id = "1SRHfX130_6Znz7zbdfqboKosz-PfNvNp"
-        
+    word_index_id, embeddings_id = GDRIVE_IDS[model_type]
     return word_index_id, embeddings_id
 
 
 def download_glove_embeddings_gdrive(model_type):
-    # Get glove embeddings from google drive
-    word_index_id, embeddings_id = get_model_id_gdrive(model_type)
-
-    # Use gdown to get files from google drive
-    embeddings_temp = "embeddings_" + str(model_type) + "_temp.npy"
-    word_index_temp = "word_index_dict_" + str(model_type) + "_temp.pkl"
-
-    # Download word_index pickle file
-    print("Downloading word index dictionary....\n")
-    gdown.download(id=word_index_id, output=word_index_temp, quiet=False)
-
-    # Download embeddings numpy file
-    print("Donwloading embedings...\n\n")
-    gdown.download(id=embeddings_id, output=embeddings_temp, quiet=False)
-
-
-# @st.cache_data()
+    """
+    Fetch the word index pickle and the embeddings npy in parallel from GLOVE_ASSET_SOURCE
+    (Google Drive by default), verified and installed atomically (see glove_assets.py)
+    """
+    return fetch_glove_assets(model_type)[model_type]
 
 
+@metrics.timed("load", lambda model_type: "glove_" + str(model_type))
 def load_glove_embeddings_gdrive(model_type):
-
-    word_index_temp = "word_index_dict_" + str(model_type) + "_temp.pkl"
-    embeddings_temp = "embeddings_" + str(model_type) + "_temp.npy"
-
-    if not os.path.exists(word_index_temp) or not os.path.exists(embeddings_temp):
-        st.info(f"Downloading GloVe {model_type} embeddings from Google Drive... This may take a moment.")
-        
-        word_index_id, embeddings_id = get_model_id_gdrive(model_type)
-
+    """
+    Load GloVe embeddings as a memory-mapped store
+    The assets are fetched (verified, resumable, see glove_assets.py) and converted only the first
+    time; after that the store is opened once per process (open_glove_store) and returned as
+    (word_index_dict, embeddings)
+    With GLOVE_SHARED_MEMORY=1 all worker processes read one copy in shared memory (glove_shared.py)
+    """
+    store_path = glove_store_path(model_type)
+    if not glove_store_exists(store_path):
+        source = asset_source()
+        st.info(f"Installing GloVe {model_type} embeddings from {source}... This may take a moment.")
         try:
-            if not os.path.exists(word_index_temp):
-                gdown.download(id=word_index_id, output=word_index_temp, quiet=False)
-            
-            if not os.path.exists(embeddings_temp):
-                gdown.download(id=embeddings_id, output=embeddings_temp, quiet=False)
+            with st.spinner(f"Fetching and converting GloVe {model_type} embeddings into a memory-mapped store..."):
+                ensure_glove_store(model_type, source)
         except Exception as e:
+            # a failed fetch leaves only a resumable .part file, never a corrupt asset
             st.error(f"Error downloading files: {e}")
             return None, None
 
-    if not os.path.exists(word_index_temp) or not os.path.exists(embeddings_temp):
-        st.error("Embedding files not found after download attempt.")
-        return None, None
-
     try:
-        with open(word_index_temp, "rb") as f:
-            word_index_dict = pickle.load(f, encoding="latin")
-        
-        embeddings = np.load(embeddings_temp)
-        return word_index_dict, embeddings
+        store = open_glove_store(store_path)
+        return store, store.embeddings
     except Exception as e:
         st.error(f"Error loading files: {e}")
         return None, None
 
+# Inference backend, thread pools and length buckets of the sentence transformer (see st_inference.py)
+ST_INFERENCE = st_inference.config_from_env()
+
+
+@shared_loader
+def load_sentence_transformer(model_name):
+    """
+    SentenceTransformer model, loaded once per process (by the warm-up or by the first query)
+    with the ST_BACKEND inference backend
+    """
+    return st_inference.load_sentence_transformer(model_name, **ST_INFERENCE)
+
+
 @st.cache_resource()
+@metrics.timed("load", lambda model_name: model_name)
 def load_sentence_transformer_model(model_name):
-    sentenceTransformer = SentenceTransformer(model_name)
+    sentenceTransformer = load_sentence_transformer(model_name)
     return sentenceTransformer
 
 
 @st.cache_resource()
+def load_sentence_transformer_batcher(model_name):
+    """
+    Micro-batching service in front of the cached model, shared by all sessions
+    Requests arriving within ST_BATCH_MAX_WAIT_MS (up to ST_BATCH_MAX_SIZE) are encoded together,
+    split into ST_LENGTH_BUCKETS so short sentences are not padded to the longest one
+    """
+    sentenceTransformer = load_sentence_transformer_model(model_name)
+    batcher = MicroBatcher(
+        lambda sentences: st_inference.encode_bucketed(sentenceTransformer, sentences, ST_INFERENCE["length_buckets"]),
+        max_batch_size=int(os.getenv("ST_BATCH_MAX_SIZE", 32)),
+        max_wait_ms=float(os.getenv("ST_BATCH_MAX_WAIT_MS", 5)),
+        name="st-batcher-" + model_name,
+    )
+    metrics.add_collector("st_batcher", batcher.stats)
+    return batcher
+
+
+@st.cache_resource()
+@metrics.timed("load", "openai_client")
 def load_openai_client():
     """
     Load OpenAI client (cached to avoid multiple initializations)
     Make sure to set OPENAI_API_KEY environment variable
+
+    Requests go through openai_limits: RPM/TPM budgets, adaptive concurrency and retries that
+    honour Retry-After, over one pooled HTTP connection
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         st.warning("OpenAI API key not found. Please set OPENAI_API_KEY environment variable.")
         return None
-    return OpenAI(api_key=api_key)
+    client = build_openai_client(api_key=api_key)
+    metrics.add_collector("openai_limits", client.stats)
+    return client
 
 
+@metrics.timed("embed", lambda sentence, model_name="text-embedding-3-small": model_name)
 def get_openai_embeddings(sentence, model_name="text-embedding-3-small"):
     """
     Get OpenAI embeddings for a sentence
@@ -141,28 +173,110 @@ def get_openai_embeddings(sentence, model_name="text-embedding-3-small"):
     Returns:
         numpy array of embeddings
     """
+    cache = get_embedding_cache()
+    cached = cache.get(model_name, OPENAI_EMBEDDING_VERSION, sentence)
+    if cached is not None:
+        return cached
+
     client = load_openai_client()
     if client is None:
         # Return zero vector if API key not available
         if model_name == "text-embedding-3-small":
-            return np.zeros(1536)
+            return np.zeros(1536, dtype=np.float32)
         else:  # text-embedding-3-large
-            return np.zeros(3072)
+            return np.zeros(3072, dtype=np.float32)
     
     try:
-        response = client.embeddings.create(
-            input=sentence,
-            model=model_name
+        response = load_request_coalescer().run(
+            (model_name, sentence),
+            lambda: client.embeddings.create(input=sentence, model=model_name),
         )
-        return np.array(response.data[0].embedding)
+        embedding = np.array(response.data[0].embedding, dtype=np.float32)
+        cache.put(model_name, OPENAI_EMBEDDING_VERSION, sentence, embedding)
+        return embedding
+    except (RateLimited, Superseded):
+        # a zero vector would score exp(0) = 1.0 for every category; report the throttling instead
+        # (a superseded rerun just stops)
+        raise
     except Exception as e:
         st.error(f"Error getting OpenAI embeddings: {e}")
         if model_name == "text-embedding-3-small":
-            return np.zeros(1536)
+            return np.zeros(1536, dtype=np.float32)
         else:
-            return np.zeros(3072)
+            return np.zeros(3072, dtype=np.float32)
+
+
+@st.cache_resource()
+def load_request_coalescer():
+    """
+    Singleflight shared by all sessions: identical concurrent embedding requests
+    (same model, same text) are sent to the backend once
+    """
+    coalescer = Singleflight()
+    metrics.add_collector("coalescing", coalescer.stats)
+    return coalescer
 
 
+@st.cache_resource()
+def load_openai_batch_embedder():
+    """
+    Load the batched OpenAI embedder (shares the cached OpenAI client)
+    """
+    client = load_openai_client()
+    if client is None:
+        return None
+    return BatchEmbedder(client)
+
+
+@metrics.timed("embed_batch", lambda sentences, model_name="text-embedding-3-small", **_: model_name)
+def get_openai_embeddings_batch(sentences, model_name="text-embedding-3-small", fill_failed=True):
+    """
+    Get OpenAI embeddings for several sentences with as few API requests as possible
+
+    Cached sentences are served from the embedding cache; the rest are packed into
+    size- and token-limited requests (see openai_batching.py).
+
+    Args:
+        fill_failed: zero vectors for sentences that could not be embedded (None with False)
+
+    Returns:
+        list of numpy arrays, in the order of sentences
+    """
+    dim = 1536 if model_name == "text-embedding-3-small" else 3072
+    fallback = np.zeros(dim, dtype=np.float32) if fill_failed else None
+    cache = get_embedding_cache()
+    cached = cache.get_many(model_name, OPENAI_EMBEDDING_VERSION, sentences)
+    missing = [sentence for sentence in dict.fromkeys(sentences) if sentence not in cached]
+
+    if missing:
+        embedder = load_openai_batch_embedder()
+        if embedder is None:
+            # Return zero vectors if API key not available
+            return [cached.get(sentence, fallback) for sentence in sentences]
+
+        def fetch(owned):
+            vectors, errors = embedder.embed([sentence for _, sentence in owned], model_name)
+            throttled = next((error for error in errors.values() if isinstance(error, RateLimited)), None)
+            if throttled is not None:
+                # keep what was embedded, and fail the model instead of scoring zero vectors
+                cache.put_many(model_name, OPENAI_EMBEDDING_VERSION, {
+                    sentence: vector for (_, sentence), vector in zip(owned, vectors) if vector is not None
+                })
+                raise throttled
+            if errors:
+                st.error(f"Error getting OpenAI embeddings for {len(errors)} input(s): {next(iter(errors.values()))}")
+            return vectors
+
+        # sentences another session is already requesting are waited for, not requested again
+        vectors = load_request_coalescer().run_many([(model_name, sentence) for sentence in missing], fetch)
+        new_vectors = {sentence: vector for sentence, vector in zip(missing, vectors) if vector is not None}
+        cache.put_many(model_name, OPENAI_EMBEDDING_VERSION, new_vectors)
+        cached.update(new_vectors)
+
+    return [cached.get(sentence, fallback) for sentence in sentences]
+
+
+@metrics.timed("embed", lambda sentence, model_name="all-MiniLM-L6-v2": model_name)
 def get_sentence_transformer_embeddings(sentence, model_name="all-MiniLM-L6-v2"):
     """
     Get sentence transformer embeddings for a sentence
@@ -170,61 +284,217 @@ def get_sentence_transformer_embeddings(sentence, model_name="all-MiniLM-L6-v2")
     # 384 dimensional embedding
     # Default model: https://huggingface.co/sentence-transformers/all-MiniLM-L6-v2  
 
-    sentenceTransformer = load_sentence_transformer_model(model_name)
+    cache = get_embedding_cache()
+    # package metadata gives the version without importing torch
+    version = st_inference.embedding_version(ST_INFERENCE["backend"])
+    cached = cache.get(model_name, version, sentence)
+    if cached is not None:
+        return cached
+
+    batcher = load_sentence_transformer_batcher(model_name)
 
     try:
-        return sentenceTransformer.encode(sentence)
+        embedding = load_request_coalescer().run((model_name, sentence), lambda: batcher.encode(sentence))
+        cache.put(model_name, version, sentence, embedding)
+        return embedding
+    except Superseded:
+        raise
     except:
         if model_name == "all-MiniLM-L6-v2":
-            return np.zeros(384)
+            return np.zeros(384, dtype=np.float32)
         else:
-            return np.zeros(512)
+            return np.zeros(512, dtype=np.float32)
+
+
+def get_sentence_transformer_embeddings_batch(sentences, model_name="all-MiniLM-L6-v2", fill_failed=True):
+    """
+    Get sentence transformer embeddings for several sentences
+    Uncached sentences are submitted to the micro-batcher together, so they are encoded as one batch
+    fill_failed: zero vectors for sentences that could not be embedded (None with False)
+
+    Returns:
+        list of numpy arrays, in the order of sentences
+    """
+    cache = get_embedding_cache()
+    version = st_inference.embedding_version(ST_INFERENCE["backend"])
+    cached = cache.get_many(model_name, version, sentences)
+    missing = [sentence for sentence in dict.fromkeys(sentences) if sentence not in cached]
+
+    if missing:
+        batcher = load_sentence_transformer_batcher(model_name)
+
+        def fetch(owned):
+            futures = [batcher.submit(sentence) for _, sentence in owned]
+            vectors = []
+            for future in futures:
+                try:
+                    vectors.append(future.result())
+                except Exception:
+                    vectors.append(None)
+            return vectors
+
+        vectors = load_request_coalescer().run_many([(model_name, sentence) for sentence in missing], fetch)
+        new_vectors = {sentence: vector for sentence, vector in zip(missing, vectors) if vector is not None}
+        cache.put_many(model_name, version, new_vectors)
+        cached.update(new_vectors)
+
+    dim = 384 if model_name == "all-MiniLM-L6-v2" else 512
+    fallback = np.zeros(dim, dtype=np.float32) if fill_failed else None
+    return [cached.get(sentence, fallback) for sentence in sentences]
+
+
+@st.cache_resource()
+def load_glove_batch_encoder(model_type, vocabulary_id, _word_index_dict, _embeddings):
+    """
+    Batched GloVe sentence encoder (tokenizer + token LRU), shared by all sessions
+    vocabulary_id identifies the word_index_dict, which itself is not hashed by Streamlit
+    """
+    return GloveBatchEncoder(_word_index_dict, _embeddings)
 
 
 def get_glove_embeddings(word, word_index_dict, embeddings, model_type):
     """
     Get glove embedding for a single word
+    Tokenized like sentences and categories (glove_batch.py), so a word the vocabulary does not
+    have as it is ("Cars," -> "cars") still gets a vector
     """
-    if word.lower() in word_index_dict:
-        return embeddings[word_index_dict[word.lower()]]
-    else:
-        return np.zeros(int(model_type.split("d")[0]))
+    encoder = load_glove_batch_encoder(model_type, id(word_index_dict), word_index_dict, embeddings)
+    return encoder.encode_one(word)
+
+
+def metadata_label(embeddings_metadata):
+    """
+    Model label used for instrumentation, e.g. "glove_50d" or "text-embedding-3-small"
+    """
+    if embeddings_metadata["embedding_model"] == "glove":
+        return "glove_" + embeddings_metadata["model_type"]
+    return embeddings_metadata.get("model_name") or embeddings_metadata["embedding_model"]
 
 
 ##################
-def get_category_embeddings(embeddings_metadata):
+def category_cache_key(embeddings_metadata):
     """
-    Get embeddings for each category
-    1. Split categories into words
-    2. Get embeddings for each word
+    st.session_state key of a model's CategoryRegistry
     """
     model_name = embeddings_metadata.get("model_name")
     embedding_model = embeddings_metadata["embedding_model"]
 
     # 最小改动：确保 cache_key 拼接安全
     if embedding_model == "glove":
-        cache_key = "cat_embed_glove_" + embeddings_metadata.get("model_type", "")
-    else:
-        cache_key = "cat_embed_" + embedding_model + "_" + (model_name if model_name else "default")
+        return "cat_embed_glove_" + embeddings_metadata.get("model_type", "")
+    return "cat_embed_" + embedding_model + "_" + (model_name if model_name else "default")
 
-    st.session_state[cache_key] = {}
-    
-    for category in st.session_state.categories.split(" "):
-        if embedding_model == "openai":
-            if category not in st.session_state[cache_key]:
-                st.session_state[cache_key][category] = get_openai_embeddings(category, model_name=model_name)
-        elif embedding_model == "glove": # 针对 GloVe 的处理
-            if category not in st.session_state[cache_key]:
-                word_index_dict = embeddings_metadata["word_index_dict"]
-                embeddings = embeddings_metadata["embeddings"]
-                model_type = embeddings_metadata["model_type"]
-                st.session_state[cache_key][category] = get_glove_embeddings(category, word_index_dict, embeddings, model_type)
-        elif model_name:
-            if category not in st.session_state[cache_key]:
-                st.session_state[cache_key][category] = get_sentence_transformer_embeddings(category, model_name=model_name)
-        else:
-            if category not in st.session_state[cache_key]:
-                st.session_state[cache_key][category] = get_sentence_transformer_embeddings(category)
+
+# Storage of the category matrices: "float32", "float16" or "int8" (see quantized_vectors.py).
+# With a reduced precision the VECTOR_RERANK best categories are rescored at full precision.
+VECTOR_PRECISION = os.environ.get("VECTOR_PRECISION", "float32")
+VECTOR_RERANK = int(os.environ.get("VECTOR_RERANK", "10"))
+# Coarse-to-fine for the text-embedding-3 models: categories are shortlisted on the first
+# OPENAI_COARSE_DIMENSIONS components (renormalized) and the VECTOR_RERANK best are rescored at
+# full width. Unset or 0 scores at full width.
+OPENAI_COARSE_DIMENSIONS = int(os.environ.get("OPENAI_COARSE_DIMENSIONS", "0")) or None
+
+
+@st.cache_resource(show_spinner=False)
+def load_category_bundles():
+    """
+    Precompiled category embeddings (category_bundles.py) from CATEGORY_BUNDLES, loaded once per process
+    """
+    bundles = load_bundles()
+    metrics.add_collector("category_bundles", bundles.stats)
+    return bundles
+
+
+def model_family(embeddings_metadata):
+    """
+    Model family of a model, as used by the result tabs and category bundles (e.g. "openai_small_1536")
+    """
+    embedding_model = embeddings_metadata["embedding_model"]
+    if embedding_model == "glove":
+        return "glove_" + embeddings_metadata["model_type"]
+    if embedding_model == "openai":
+        return {name: family for family, name in OPENAI_MODELS.items()}.get(embeddings_metadata["model_name"])
+    if (embeddings_metadata.get("model_name") or "all-MiniLM-L6-v2") == "all-MiniLM-L6-v2":
+        return "sentence_transformer_384"
+    return None
+
+
+def get_category_registry(embeddings_metadata):
+    """
+    The model's CategoryRegistry (created in st.session_state on first use)
+    """
+    cache_key = category_cache_key(embeddings_metadata)
+    if cache_key not in st.session_state:
+        # GloVe and MiniLM vectors are not trained to be truncated
+        dimensions = OPENAI_COARSE_DIMENSIONS if embeddings_metadata["embedding_model"] == "openai" else None
+        st.session_state[cache_key] = CategoryRegistry(
+            precision=VECTOR_PRECISION, rerank=VECTOR_RERANK, dimensions=dimensions
+        )
+    return st.session_state[cache_key]
+
+
+def embed_categories(embeddings_metadata, categories):
+    """
+    Embeddings of several categories with one model, batched where the model allows it
+    Categories found in a precompiled bundle are not embedded again; failed ones are None
+    """
+    return embed_with_bundles(
+        load_category_bundles(), model_family(embeddings_metadata), categories,
+        lambda missing: embed_categories_live(embeddings_metadata, missing, fill_failed=False),
+    )
+
+
+def embed_categories_live(embeddings_metadata, categories, fill_failed=True):
+    model_name = embeddings_metadata.get("model_name")
+    embedding_model = embeddings_metadata["embedding_model"]
+    if embedding_model == "openai":
+        return get_openai_embeddings_batch(categories, model_name=model_name, fill_failed=fill_failed)
+    if embedding_model == "glove":
+        word_index_dict = embeddings_metadata["word_index_dict"]
+        embeddings = embeddings_metadata["embeddings"]
+        model_type = embeddings_metadata["model_type"]
+        # same tokenization as the query sentence, classify.py, the service and the category bundles
+        encoder = load_glove_batch_encoder(model_type, id(word_index_dict), word_index_dict, embeddings)
+        return list(encoder.encode(categories))
+    return get_sentence_transformer_embeddings_batch(
+        categories, model_name=model_name or "all-MiniLM-L6-v2", fill_failed=fill_failed
+    )
+
+
+def embed_sentences(embeddings_metadata, sentences):
+    """
+    (n, dim) float32 embeddings of several sentences with one model, batched where the model allows it
+    Raises EmbeddingError if some of them could not be embedded (instead of scoring zero vectors)
+    """
+    if embeddings_metadata["embedding_model"] == "glove":
+        word_index_dict = embeddings_metadata["word_index_dict"]
+        encoder = load_glove_batch_encoder(
+            embeddings_metadata["model_type"], id(word_index_dict), word_index_dict, embeddings_metadata["embeddings"]
+        )
+        return encoder.encode(sentences)
+    vectors = embed_categories_live(embeddings_metadata, sentences, fill_failed=False)
+    failed = [sentence for sentence, vector in zip(sentences, vectors) if vector is None]
+    if failed:
+        raise EmbeddingError(f"{len(failed)} of {len(sentences)} sentences could not be embedded, e.g. {failed[0]!r}")
+    return np.asarray(vectors, dtype=np.float32)
+
+
+@metrics.timed("category_embedding", metadata_label)
+def get_category_embeddings(embeddings_metadata):
+    """
+    Get embeddings for each category
+    1. Split categories into words
+    2. Get embeddings for each word
+
+    Only categories that are new since the last call are embedded (in one batch); removed ones
+    are dropped from the model's CategoryRegistry, which is returned
+    """
+    registry = get_category_registry(embeddings_metadata)
+    registry.update(
+        st.session_state.categories.split(" "),
+        lambda added: embed_categories(embeddings_metadata, added),
+    )
+    return registry
 
 
 # def get_category_embeddings(embeddings_metadata):
@@ -266,6 +536,101 @@ def update_category_embeddings(embeddings_metadata):
 
 
 
+# Per-model timeouts (seconds) for the concurrent pipeline in __main__
+MODEL_TIMEOUTS = {
+    "glove": 60,
+    "transformers": 60,
+    "openai": 30,
+}
+
+
+def with_script_run_ctx(fn):
+    """
+    Wrap fn so it runs with the current Streamlit script context (and records into this rerun's metrics)
+    Pipeline worker threads need it to read st.session_state
+    """
+    ctx = get_script_run_ctx()
+    run_metrics = metrics.current_run()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        with metrics.bind_run(run_metrics):
+            return fn()
+
+    return run
+
+
+ANALOGY_PATTERN = re.compile(r"^\s*(\S+)\s*-\s*(\S+)\s*\+\s*(\S+)\s*$")
+
+
+def find_closest_words(text, model_type, k=10):
+    """
+    Closest GloVe words for each space separated word in text, or for an analogy "b - a + c"
+
+    Returns:
+        {query: [(word, cosine), ...]}
+    """
+    neighbours = load_glove_neighbors(model_type)
+    analogy = ANALOGY_PATTERN.match(text)
+    if analogy:
+        b, a, c = analogy.groups()
+        return {f"{b} - {a} + {c}": neighbours.analogy(a, b, c, k)}
+    words = text.split()
+    return dict(zip(words, neighbours.nearest(words, k)))
+
+
+@st.cache_resource()
+def start_app_metrics():
+    """
+    Register the cache counters with the metrics registry and, if METRICS_PORT is set,
+    serve /metrics (Prometheus text) and /metrics.json on that port (once per process)
+    """
+    metrics.add_collector("embedding_cache", lambda: get_embedding_cache().stats())
+    if os.getenv("INSTRUMENT_TRACEMALLOC") == "1":
+        metrics.enable_allocation_tracking()
+    port = os.getenv("METRICS_PORT")
+    if port:
+        return start_metrics_server(int(port))
+    return None
+
+
+@st.cache_resource(show_spinner=False)
+def start_model_warm_up(model_type, sentence_transformer_name="all-MiniLM-L6-v2"):
+    """
+    Preload the GloVe store and the sentence transformer (plus one dummy encode) in a background
+    thread, once per process and GloVe model type, so the page is usable while they load
+    A query that arrives before the warm-up is done joins the load already in progress
+    """
+    tasks = []
+    store_path = glove_store_path(model_type)
+    if glove_store_exists(store_path):
+        tasks.append(("glove_" + model_type, lambda: open_glove_store(store_path)))
+    tasks.append((
+        sentence_transformer_name,
+        lambda: load_sentence_transformer(sentence_transformer_name).encode(["warm up"]),
+    ))
+    return WarmUp(tasks, name="warm-up-" + model_type).start()
+
+
+def performance_table(stages):
+    """
+    DataFrame of per-stage timings for the Performance panel
+    """
+    import pandas as pd
+
+    rows = []
+    for (stage, label), stats in sorted(stages.items(), key=lambda item: -item[1]["total_s"]):
+        rows.append({
+            "Stage": stage,
+            "Model": label,
+            "Calls": stats["calls"],
+            "Total (ms)": round(stats["total_s"] * 1000, 1),
+            "Max (ms)": round(stats["max_s"] * 1000, 1),
+            "Allocated (KB)": round(stats["bytes_allocated"] / 1024, 1),
+        })
+    return pd.DataFrame(rows)
+
+
 ### Plotting utility functions
     
 def plot_piechart(sorted_cosine_scores_items):
@@ -279,8 +644,7 @@ def plot_piechart(sorted_cosine_scores_items):
         categories[sorted_cosine_scores_items[index][0]]
         for index in range(len(sorted_cosine_scores_items))
     ]
-    fig, ax = plt.subplots()
-    ax.pie(sorted_cosine_scores, labels=categories_sorted, autopct="%1.1f%%")
+    fig = pie_figure(categories_sorted, sorted_cosine_scores, figsize=(6.4, 4.8), explode=False)
     st.pyplot(fig)  # Figure
 
 
@@ -296,24 +660,13 @@ def plot_piechart_helper(sorted_cosine_scores_items):
         categories[sorted_cosine_scores_items[index][0]]
         for index in range(len(sorted_cosine_scores_items))
     ]
-    fig, ax = plt.subplots(figsize=(3, 3))
-    my_explode = np.zeros(len(categories_sorted))
-    my_explode[0] = 0.2
-    if len(categories_sorted) == 3:
-        my_explode[1] = 0.1  # explode this by 0.2
-    elif len(categories_sorted) > 3:
-        my_explode[2] = 0.05
-    ax.pie(
-        sorted_cosine_scores,
-        labels=categories_sorted,
-        autopct="%1.1f%%",
-        explode=my_explode,
-    )
-
-    return fig
+    # pyplot-free figure (see charts.py), so it is not kept alive by pyplot's figure registry
+    return pie_figure(categories_sorted, sorted_cosine_scores)
 
 
 def plot_piecharts(sorted_cosine_scores_models):
+    from matplotlib.figure import Figure
+
     scores_list = []
     categories = st.session_state.categories.split(" ")
     index = 0
@@ -323,7 +676,8 @@ def plot_piecharts(sorted_cosine_scores_models):
         index += 1
 
     if len(sorted_cosine_scores_models) == 2:
-        fig, (ax1, ax2) = plt.subplots(2)
+        fig = Figure()
+        ax1, ax2 = fig.subplots(2)
 
         categories_sorted = [
             categories[scores_list[0][index][0]] for index in range(len(scores_list[0]))
@@ -344,16 +698,75 @@ def plot_piecharts(sorted_cosine_scores_models):
     st.pyplot(fig)
 
 
+def plot_alatirchart_streaming(models, model_results):
+    """
+    Same tabs as plot_alatirchart, but each tab is filled as soon as its model's result arrives
+
+    Args:
+        models: tab names, in display order
+        model_results: iterable of pipeline.ModelResult (e.g. from run_concurrently)
+
+    Returns:
+        dict of the successful results, in display order
+    """
+    tabs = st.tabs(models)
+    placeholders = {}
+    for model, tab in zip(models, tabs):
+        with tab:
+            placeholders[model] = st.empty()
+            placeholders[model].info(f"Computing {model}...")
+
+    results = {}
+    for result in model_results:
+        if result.ok:
+            results[result.name] = result.value
+            with metrics.stage("plotting", result.name):
+                show_piechart(placeholders[result.name], result.name, result.value)
+        elif result.timed_out:
+            placeholders[result.name].warning(str(result.error))
+        else:
+            placeholders[result.name].error(f"{result.name} failed: {result.error}")
+
+    return {model: results[model] for model in models if model in results}
+
+
 def plot_alatirchart(sorted_cosine_scores_models):
     models = list(sorted_cosine_scores_models.keys())
     tabs = st.tabs(models)
-    figs = {}
-    for model in models:
-        figs[model] = plot_piechart_helper(sorted_cosine_scores_models[model])
-
     for index in range(len(tabs)):
-        with tabs[index]:
-            st.pyplot(figs[models[index]])
+        show_piechart(tabs[index], models[index], sorted_cosine_scores_models[models[index]])
+
+
+# "matplotlib" (PNG, same look as before) or "altair" (Vega-Lite spec drawn by the browser)
+CHART_RENDERER = os.environ.get("CHART_RENDERER", "matplotlib")
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_piechart(model, labels, scores, renderer):
+    """
+    Pie chart of one model's ranking, memoized by (model, categories, rounded scores)
+    Returns PNG bytes, or a Vega-Lite spec for renderer="altair"
+    """
+    if renderer == "altair":
+        return pie_chart_spec(labels, scores)
+    return pie_chart_png(labels, scores)
+
+
+def show_piechart(container, model, sorted_cosine_scores_items):
+    """
+    Draw a model's pie chart into a Streamlit container (tab, placeholder, ...)
+    """
+    labels, scores = chart_inputs(sorted_cosine_scores_items, st.session_state.categories.split(" "))
+    if not any(scores):
+        # categories that could not be embedded score 0.0; such a result is not reused by SessionWork,
+        # so the next rerun embeds them again
+        container.warning(f"{model}: none of the categories could be embedded, they are retried on the next rerun")
+        return
+    chart = render_piechart(model, labels, scores, CHART_RENDERER)
+    if CHART_RENDERER == "altair":
+        container.vega_lite_chart(spec=chart, width="stretch")
+    else:
+        container.image(chart, width="stretch")
 
 
 ### Your Part To Complete: Follow the instructions in each function below to complete the similarity calculation between text embeddings
@@ -384,6 +797,7 @@ def cosine_similarity(x, y):
 
     
 # Task II: Average Glove Embedding Calculation
+@metrics.timed("embed", lambda sentence, word_index_dict, embeddings, model_type="50d": "glove_" + model_type)
 def averaged_glove_embeddings_gdrive(sentence, word_index_dict, embeddings, model_type="50d"):
     """
     Get averaged glove embeddings for a sentence
@@ -394,25 +808,15 @@ def averaged_glove_embeddings_gdrive(sentence, word_index_dict, embeddings, mode
     5. Return averaged embeddings
     (30 pts)
     """
-    embedding_dim = int(model_type.split("d")[0])
-    embedding = np.zeros(embedding_dim)
-    
-    words = sentence.lower().split()
-    
-    count = 0
-
-    for word in words:
-        word_vector = get_glove_embeddings(word, word_index_dict, embeddings, model_type)
-        embedding += word_vector
-        count += 1
-    
-    if count > 0:
-        embedding = embedding / count
-    
+    # 分词时去掉标点（"red," -> "red"），未登录词按零向量计入；单句直接按行查表求平均，
+    # 比一次磁盘缓存查询还快，所以 GloVe 不走 embedding cache
+    encoder = load_glove_batch_encoder(model_type, id(word_index_dict), word_index_dict, embeddings)
+    embedding = encoder.encode_one(sentence)
     return embedding 
 
 
 # Task III: Sort the cosine similarity
+@metrics.timed("model_total", metadata_label)
 def get_sorted_cosine_similarity(embeddings_metadata):
     """
     Get sorted cosine similarity between input sentence and categories
@@ -455,8 +859,7 @@ def get_sorted_cosine_similarity(embeddings_metadata):
     """
     sentence = st.session_state.text_search
     categories = st.session_state.categories.split(" ")
-    cosine_sim = {}
-    
+
     if embeddings_metadata["embedding_model"] == "glove":
         # Extract GloVe-specific parameters
         word_index_dict = embeddings_metadata["word_index_dict"]
@@ -464,47 +867,53 @@ def get_sorted_cosine_similarity(embeddings_metadata):
         model_type = embeddings_metadata["model_type"]
 
         query_vector = averaged_glove_embeddings_gdrive(sentence, word_index_dict, embeddings, model_type)
-        cache_key = "cat_embed_glove_" + model_type # 定义 GloVe 的缓存键
-        
-        
-        
+        registry = get_category_embeddings(embeddings_metadata)
+
     elif embeddings_metadata["embedding_model"] == "openai":
         # Extract OpenAI-specific parameters
         model_name = embeddings_metadata["model_name"]
-        cache_key = "cat_embed_openai_" + model_name
-        query_vector = get_openai_embeddings(sentence, model_name=model_name)
-        
+        registry = get_category_registry(embeddings_metadata)
+        query = {}
+
+        def embed_with_query(labels):
+            # 查询句子和新增的类别放在同一批请求里
+            vectors = get_openai_embeddings_batch([sentence] + labels, model_name=model_name, fill_failed=False)
+            query["vector"] = vectors[0]
+            return vectors[1:]
+
+        # the registry diffs and embeds under its lock, so only labels still missing are requested
+        with metrics.stage("category_embedding", metadata_label(embeddings_metadata)):
+            registry.update(
+                categories,
+                lambda added: embed_with_bundles(
+                    load_category_bundles(), model_family(embeddings_metadata), added, embed_with_query
+                ),
+            )
+        query_vector = query.get("vector")
+        if query_vector is None:
+            query_vector = get_openai_embeddings(sentence, model_name=model_name)
 
     else:  # Sentence transformers
         # Extract Sentence Transformer-specific parameters
         model_name = embeddings_metadata["model_name"]
-        cache_key = "cat_embed_transformers_" + (model_name if model_name else "default")
         query_vector = get_sentence_transformer_embeddings(sentence, model_name=model_name)
-        
-    if cache_key not in st.session_state or not st.session_state[cache_key]:
-        get_category_embeddings(embeddings_metadata)
-    
-    category_vectors = st.session_state[cache_key]
-
-    similarity_list = []
-    for index, category in enumerate(categories):
-        if category in category_vectors:
-            cat_vector = category_vectors[category]
-            # 使用你之前实现的指数化余弦相似度函数
-            score = cosine_similarity(query_vector, cat_vector)
-            similarity_list.append((index, score))
-        else:
-            similarity_list.append((index, 0.0))
+        registry = get_category_embeddings(embeddings_metadata)
 
-    sorted_cosine_scores = sorted(similarity_list, key=lambda x: x[1], reverse=True)
+    # 类别向量保存在一个归一化矩阵里，一次矩阵乘法完成打分
+    with metrics.stage("scoring", metadata_label(embeddings_metadata)):
+        sorted_cosine_scores = registry.top_k(query_vector)
     
     return sorted_cosine_scores
 
 
-
 ### Below is the main function, creating the app demo for text search engine using the text embeddings.
 
 if __name__ == "__main__":
+    start_app_metrics()
+    load_category_bundles()
+    # stages of this rerun (script thread and the pipeline threads it starts) for the Performance panel
+    run_metrics = metrics.start_run()
+
     ### Text Search ###
     ### There will be Bonus marks of 10% for the teams that submit a URL for your deployed web app. 
     ### Bonus: You can also submit a publicly accessible link to the deployed web app.
@@ -524,6 +933,10 @@ if __name__ == "__main__":
     )
 
     model_type = st.sidebar.selectbox("Choose the model", ("25d", "50d", "100d"), index=1)
+    # APP_WARM_UP=0 loads every model on its first use instead
+    warm_up = start_model_warm_up(model_type) if os.getenv("APP_WARM_UP", "1") != "0" else None
+    if warm_up is not None and not warm_up.done.is_set():
+        st.sidebar.caption("Warming up models: " + warm_up.status())
 
 
     st.title("Search Based Retrieval Demo")
@@ -561,58 +974,106 @@ if __name__ == "__main__":
     #     # Download embeddings from google drive
     #     with st.spinner("Downloading glove embeddings..."):
     #         download_glove_embeddings_gdrive(model_type)
-    word_index_dict, embeddings = load_glove_embeddings_gdrive(model_type)
-
 
     # Load glove embeddings
     word_index_dict, embeddings = load_glove_embeddings_gdrive(model_type)
 
 
     # Find closest word to an input word
+    with st.expander(f"Find closest words (GloVe {model_type})"):
+        st.text_input(
+            label="Words (space separated), or an analogy like: king - man + woman",
+            key="closest_words",
+        )
+        if st.session_state.closest_words and word_index_dict is not None:
+            with st.spinner("Searching the GloVe vocabulary..."), metrics.stage("closest_words", "glove_" + model_type):
+                neighbours = find_closest_words(st.session_state.closest_words, model_type)
+            for query, words in neighbours.items():
+                st.markdown(f"**{query}**: " + (", ".join(f"{word} ({score:.3f})" for word, score in words) or "not in vocabulary"))
+
+    glove_metadata = {
+        "embedding_model": "glove",
+        "word_index_dict": word_index_dict,
+        "embeddings": embeddings,
+        "model_type": model_type,
+    }
+    transformer_metadata = {
+        "embedding_model": "transformers", 
+        "model_name": "all-MiniLM-L6-v2"
+    }
+    openai_small_metadata = {
+        "embedding_model": "openai", 
+        "model_name": "text-embedding-3-small"
+    }
+    openai_large_metadata = {
+        "embedding_model": "openai", 
+        "model_name": "text-embedding-3-large"
+    }
+
+    # Compare sentences with each other, e.g. "Chocolate Milk" vs "Milk Chocolate" (word order)
+    with st.expander("Compare sentences (pairwise similarity)"):
+        st.text_area(
+            label="Sentences, one per line",
+            key="pairwise_sentences",
+            placeholder="I would like chocolate milk\nI would like milk chocolate",
+        )
+        pairwise_sentences = list(dict.fromkeys(
+            line.strip() for line in st.session_state.pairwise_sentences.splitlines() if line.strip()
+        ))
+        if len(pairwise_sentences) > 1:
+            import pandas as pd
+
+            pairwise_models = [
+                ("glove_" + str(model_type), glove_metadata),
+                ("sentence_transformer_384", transformer_metadata),
+                ("openai_small_1536", openai_small_metadata),
+                ("openai_large_3072", openai_large_metadata),
+            ]
+            st.caption("Cosine similarity of every pair (np.exp of it is the score used for the categories)")
+            for (name, metadata), tab in zip(pairwise_models, st.tabs([name for name, _ in pairwise_models])):
+                if metadata is glove_metadata and word_index_dict is None:
+                    tab.warning("GloVe embeddings are not available")
+                    continue
+                if metadata["embedding_model"] == "openai" and load_openai_client() is None:
+                    tab.warning("OPENAI_API_KEY is not set")
+                    continue
+                # one failing model (throttling, a model that does not load) only fails its own tab
+                try:
+                    with metrics.stage("pairwise", name):
+                        matrix = similarity_matrix(
+                            embed_unique(lambda batch: embed_sentences(metadata, batch), pairwise_sentences)
+                        )
+                except RateLimited as e:
+                    tab.warning(str(e))
+                except Exception as e:
+                    tab.error(f"{name} failed: {e}")
+                else:
+                    tab.dataframe(pd.DataFrame(matrix, index=pairwise_sentences, columns=pairwise_sentences).round(3))
+
     if st.session_state.text_search:
-        results_dict = {}
-        
-        # Glove embeddings
-        print("Glove Embedding")
-        embeddings_metadata = {
-            "embedding_model": "glove",
-            "word_index_dict": word_index_dict,
-            "embeddings": embeddings,
-            "model_type": model_type,
-        }
-        with st.spinner("Obtaining Cosine similarity for Glove..."):
-            sorted_cosine_sim_glove = get_sorted_cosine_similarity(embeddings_metadata)
-            results_dict["glove_" + str(model_type)] = sorted_cosine_sim_glove
-
-        # Sentence transformer embeddings
-        print("Sentence Transformer Embedding")
-        embeddings_metadata = {
-            "embedding_model": "transformers", 
-            "model_name": "all-MiniLM-L6-v2"
-        }
-        with st.spinner("Obtaining Cosine similarity for 384d sentence transformer..."):
-            sorted_cosine_sim_transformer = get_sorted_cosine_similarity(embeddings_metadata)
-            results_dict["sentence_transformer_384"] = sorted_cosine_sim_transformer
-
-        # OpenAI Small embeddings
-        print("OpenAI Small Embedding")
-        embeddings_metadata = {
-            "embedding_model": "openai", 
-            "model_name": "text-embedding-3-small"
-        }
-        with st.spinner("Obtaining Cosine similarity for OpenAI Small (1536d)..."):
-            sorted_cosine_sim_openai_small = get_sorted_cosine_similarity(embeddings_metadata)
-            results_dict["openai_small_1536"] = sorted_cosine_sim_openai_small
-
-        # OpenAI Large embeddings
-        print("OpenAI Large Embedding")
-        embeddings_metadata = {
-            "embedding_model": "openai", 
-            "model_name": "text-embedding-3-large"
-        }
-        with st.spinner("Obtaining Cosine similarity for OpenAI Large (3072d)..."):
-            sorted_cosine_sim_openai_large = get_sorted_cosine_similarity(embeddings_metadata)
-            results_dict["openai_large_3072"] = sorted_cosine_sim_openai_large
+        # Each model runs concurrently; OpenAI calls are network-bound, GloVe/MiniLM are local compute
+        # A rerun with the same inputs joins (or reuses) the previous run's computation per model;
+        # new inputs supersede it, so it stops before its next backend request
+        session_work = st.session_state.setdefault("session_work", SessionWork())
+        inputs_key = (st.session_state.text_search, st.session_state.categories)
+
+        def coalesced(name, metadata):
+            # a result with categories that failed to embed is not reused: the next rerun embeds them again
+            return lambda: session_work.run(
+                name, inputs_key, lambda: get_sorted_cosine_similarity(metadata),
+                reuse=lambda _: not get_category_registry(metadata).failed,
+            )
+
+        jobs = [
+            ModelJob("glove_" + str(model_type), coalesced("glove_" + str(model_type), glove_metadata),
+                     kind="cpu", timeout=MODEL_TIMEOUTS["glove"]),
+            ModelJob("sentence_transformer_384", coalesced("sentence_transformer_384", transformer_metadata),
+                     kind="cpu", timeout=MODEL_TIMEOUTS["transformers"]),
+            ModelJob("openai_small_1536", coalesced("openai_small_1536", openai_small_metadata),
+                     kind="io", timeout=MODEL_TIMEOUTS["openai"]),
+            ModelJob("openai_large_3072", coalesced("openai_large_3072", openai_large_metadata),
+                     kind="io", timeout=MODEL_TIMEOUTS["openai"]),
+        ]
 
         # Results and Plot Pie Chart for all models
         print("Categories are: ", st.session_state.categories)
@@ -622,8 +1083,11 @@ if __name__ == "__main__":
             + " as per different Embeddings"
         )
 
-        # Display results in tabs
-        plot_alatirchart(results_dict)
+        # Display results in tabs as each model finishes
+        results_dict = plot_alatirchart_streaming(
+            [job.name for job in jobs],
+            run_concurrently(jobs, wrap=with_script_run_ctx),
+        )
         
         # Add comparison table
         st.markdown("---")
@@ -644,12 +1108,56 @@ if __name__ == "__main__":
         
         import pandas as pd
         df = pd.DataFrame(comparison_data)
-        st.table(df)
+        if st.checkbox("Show performance", key="show_performance"):
+            table_col, performance_col = st.columns(2)
+            with table_col:
+                st.table(df)
+            with performance_col:
+                st.markdown("**Performance** (this run)")
+                st.dataframe(performance_table(run_metrics.stages()), hide_index=True)
+        else:
+            st.table(df)
 
         st.write("")
         st.write(
             "Demo developed by Phoebe Chen"
         )
+
+    cache_stats = get_embedding_cache().stats()
+    st.sidebar.caption(
+        f"Embedding cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1e6:.1f} MB)"
+    )
+    bundle_stats = load_category_bundles().stats()
+    if bundle_stats["bundles"]:
+        st.sidebar.caption(
+            f"Category bundles: {bundle_stats['bundles']} loaded, {bundle_stats['hits']} categories served, "
+            f"{bundle_stats['misses']} embedded live"
+        )
+    if st.session_state.text_search:
+        try:
+            batch_stats = load_sentence_transformer_batcher("all-MiniLM-L6-v2").stats()
+        except Exception as e:
+            # the MiniLM tab already reports the failure; the rest of the page stays up
+            st.sidebar.caption(f"MiniLM ({ST_INFERENCE['backend']}) could not be loaded: {e}")
+        else:
+            st.sidebar.caption(
+                f"MiniLM ({ST_INFERENCE['backend']}) batching: {batch_stats['mean_batch_size']:.1f} items/batch, "
+                f"queue delay p95 {batch_stats['queue_delay_ms_p95']:.1f} ms"
+            )
+        openai_client = load_openai_client()
+        if openai_client is not None and openai_client.stats()["throttled"]:
+            limit_stats = openai_client.stats()
+            st.sidebar.caption(
+                f"OpenAI throttling: {limit_stats['throttled']} 429s, {limit_stats['retries']} retries, "
+                f"{limit_stats['gave_up']} given up; concurrency limit {limit_stats['concurrency_limit']:.1f}"
+            )
+        coalescing_stats = load_request_coalescer().stats()
+        work_stats = st.session_state.session_work.stats()
+        st.sidebar.caption(
+            f"Coalescing: {coalescing_stats['calls']} backend calls, {coalescing_stats['keys_merged']} merged; "
+            f"this session {work_stats['reused']} reused, {work_stats['superseded']} superseded"
+        )
         
 
         
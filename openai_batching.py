@@ -0,0 +1,204 @@
+### Batched OpenAI embedding requests.
+# The embeddings endpoint accepts a list of inputs, so categories and queries are packed into
+# requests bounded by the number of inputs and by an (estimated) token budget. Results are mapped
+# back by their "index" field. When a request fails with a retryable error (openai_limits.is_retryable:
+# 429, 408, 409, 5xx, connection errors) it is split in half and only the failing halves are retried,
+# down to single inputs; any other error (401, 400, ...) would fail the same way again and is raised
+# at once. Retrying belongs to one layer only: a rate-limited client (openai_limits.RateLimitedClient)
+# already retries with backoff, so whatever it still raises is final and is neither split nor retried
+# here. Empty and whitespace-only inputs are rejected before any request is built. A throttled request (openai_limits.RateLimited) is
+# not split: more, smaller requests would only add to the load that got it throttled. A superseded
+# computation (coalescing.Superseded) is not a failed request: it propagates at once, without
+# splitting or retry delays.
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from coalescing import Superseded
+from openai_limits import RateLimited, RateLimitedClient, is_retryable
+
+# API limits for /v1/embeddings
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300000
+MAX_TOKENS_PER_INPUT = 8191
+
+_tokenizer = None
+
+
+def estimate_tokens(text):
+    """
+    Token count of a text
+    Uses tiktoken when it is installed, otherwise a conservative estimate (one token per 3 bytes)
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            import tiktoken
+
+            _tokenizer = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _tokenizer = False
+    if _tokenizer:
+        return len(_tokenizer.encode(text))
+    return math.ceil(len(text.encode("utf-8")) / 3) + 1
+
+
+def plan_batches(texts, max_items=MAX_INPUTS_PER_REQUEST, max_tokens=MAX_TOKENS_PER_REQUEST):
+    """
+    Pack texts into request batches
+    Returns a list of batches, each a list of indices into texts
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = min(estimate_tokens(text), MAX_TOKENS_PER_INPUT)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def request_embeddings(client, texts, model_name, **kwargs):
+    """
+    One embeddings request; returns vectors in the order of texts
+    """
+    response = client.embeddings.create(input=list(texts), model=model_name, **kwargs)
+    vectors = [None] * len(texts)
+    for item in response.data:
+        vectors[item.index] = np.array(item.embedding, dtype=np.float32)
+    if any(vector is None for vector in vectors):
+        raise ValueError(f"Embeddings response has {len(response.data)} items for {len(texts)} inputs")
+    return vectors
+
+
+class BatchEmbedder:
+    """
+    Embeds lists of texts with as few embeddings requests as possible
+
+    Args:
+        client: OpenAI client (or anything with the same embeddings.create interface)
+        max_items / max_tokens: per-request limits used to pack batches
+        max_retries: retries for a single input that keeps failing after its batch was split
+        retry_delay: seconds between those retries (doubled every time)
+        max_workers: number of batches sent concurrently
+        client_retries: whether the client retries failed requests itself, in which case failed
+            batches are not split or retried here (default: True for a RateLimitedClient)
+    """
+
+    def __init__(
+        self,
+        client,
+        max_items=MAX_INPUTS_PER_REQUEST,
+        max_tokens=MAX_TOKENS_PER_REQUEST,
+        max_retries=2,
+        retry_delay=0.5,
+        max_workers=4,
+        client_retries=None,
+    ):
+        self.client = client
+        self.client_retries = isinstance(client, RateLimitedClient) if client_retries is None else client_retries
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_workers = max_workers
+        self.requests = 0
+        self.failed_requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self, texts, model_name, kwargs):
+        with self._lock:
+            self.requests += 1
+        try:
+            return request_embeddings(self.client, texts, model_name, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed_requests += 1
+            raise
+
+    def _embed_batch(self, texts, model_name, kwargs):
+        """
+        Embed one batch, splitting it on failure
+        Returns (vectors, errors) where failed vectors are None and errors maps position -> exception
+        """
+        try:
+            return self._request(texts, model_name, kwargs), {}
+        except RateLimited as e:
+            return [None] * len(texts), {position: e for position in range(len(texts))}
+        except Superseded:
+            raise
+        except Exception as e:
+            if self.client_retries or not is_retryable(e):
+                raise
+            if len(texts) == 1:
+                return self._retry_single(texts[0], model_name, kwargs, e)
+
+        middle = len(texts) // 2
+        left_vectors, left_errors = self._embed_batch(texts[:middle], model_name, kwargs)
+        right_vectors, right_errors = self._embed_batch(texts[middle:], model_name, kwargs)
+        errors = dict(left_errors)
+        errors.update({middle + position: error for position, error in right_errors.items()})
+        return left_vectors + right_vectors, errors
+
+    def _retry_single(self, text, model_name, kwargs, error):
+        delay = self.retry_delay
+        for _ in range(self.max_retries):
+            time.sleep(delay)
+            delay *= 2
+            try:
+                return self._request([text], model_name, kwargs), {}
+            except Superseded:
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                error = e
+        return [None], {0: error}
+
+    def embed(self, texts, model_name, **kwargs):
+        """
+        Embed texts with model_name; extra keyword arguments go to embeddings.create
+
+        Duplicate texts are sent once; empty and whitespace-only texts are not sent (the API
+        rejects them) and fail with a ValueError. Returns (vectors, errors): vectors is a list in
+        the order of texts with None for inputs that could not be embedded, errors maps their
+        index to the exception. Errors that are not retryable are raised.
+        """
+        unique = [text for text in dict.fromkeys(texts) if text.strip()]
+        batches = plan_batches(unique, self.max_items, self.max_tokens)
+
+        def run(batch):
+            return batch, self._embed_batch([unique[index] for index in batch], model_name, kwargs)
+
+        unique_vectors = [None] * len(unique)
+        unique_errors = {}
+        if len(batches) > 1 and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(run, batches))
+        else:
+            results = [run(batch) for batch in batches]
+        for batch, (vectors, errors) in results:
+            for position, index in enumerate(batch):
+                unique_vectors[index] = vectors[position]
+                if position in errors:
+                    unique_errors[index] = errors[position]
+
+        position_of = {text: index for index, text in enumerate(unique)}
+        vectors = [unique_vectors[position_of[text]] if text in position_of else None for text in texts]
+        errors = {}
+        for index, text in enumerate(texts):
+            if text not in position_of:
+                errors[index] = ValueError("empty input: the embeddings API rejects empty or whitespace-only text")
+            elif position_of[text] in unique_errors:
+                errors[index] = unique_errors[position_of[text]]
+        return vectors, errors
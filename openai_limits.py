@@ -0,0 +1,337 @@
+### Rate-limit aware concurrency control for OpenAI embedding requests.
+# Every embeddings request first takes its share of two token buckets, one for requests per minute
+# and one for (estimated) tokens per minute, so the client stays under the account's limits
+# instead of discovering them through 429s. The number of requests in flight follows an AIMD limit:
+# doubled per round of successful requests until the first 429 (slow start), then +1 per round,
+# halved on a 429 from a busy server (once per congestion event). Retryable failures (429, 408, 409, 5xx, connection
+# errors) are retried with jittered exponential backoff; a Retry-After from the server is honoured
+# as the minimum delay, and when the 429 says the account's budget is used up
+# (x-ratelimit-remaining-requests/tokens: 0) it pauses every caller, not just the one that got it.
+# When a request is still throttled after its retries, RateLimited is raised so callers can report
+# it instead of scoring a zero vector.
+# The wrapped OpenAI client uses one pooled keep-alive HTTP client and no SDK retries of its own.
+#
+#   OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT   request and token budgets per minute
+#   OPENAI_MAX_CONCURRENCY                upper bound of the adaptive concurrency limit
+
+import os
+import random
+import threading
+import time
+
+from coalescing import check_cancelled
+
+# tier 1 limits of the embedding models
+DEFAULT_RPM = 3000
+DEFAULT_TPM = 1000000
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+KEEPALIVE_EXPIRY_S = 30.0
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class RateLimited(RuntimeError):
+    """
+    Raised when OpenAI kept throttling a request (or the budget would not allow it in time)
+
+    retry_after: seconds until requests are expected to succeed again, if known
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    per_minute units, refilled continuously; holds at most capacity (default: one minute's worth)
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waited_s = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Take amount units (the level may go negative); returns the seconds to wait before using them
+        Reservations are served in order, so waiting callers cannot be starved by newer ones
+        """
+        with self._lock:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+            wait = max(0.0, -self.level / self.rate)
+            self.waited_s += wait
+            return wait
+
+    def refund(self, amount):
+        """
+        Give back units that were reserved but not used (negative amounts take more)
+        """
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit with additive increase and multiplicative decrease
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY, decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self.decreases = 0
+        self.slow_start = True
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free slot; returns the start time to pass to release()
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, throttled=False, adjust=True):
+        """
+        Free a slot; adjust=False leaves the limit as it is (the outcome says nothing about concurrency)
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if not adjust:
+                pass
+            elif not throttled:
+                # +1 after about `limit` successful requests (+1 per request in slow start)
+                self.limit = min(self.maximum, self.limit + (1.0 if self.slow_start else 1.0 / self.limit))
+            elif started >= self._decreased_at:
+                # requests that were already in flight when the limit was cut do not cut it again
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._decreased_at = time.monotonic()
+                self.decreases += 1
+                self.slow_start = False
+            self._condition.notify_all()
+
+
+def response_headers(error):
+    return getattr(getattr(error, "response", None), "headers", None) or {}
+
+
+def budget_exhausted(error):
+    """
+    Whether a 429 reports the account's request or token budget as used up (not just a busy server)
+    """
+    headers = response_headers(error)
+    return any(headers.get(name) == "0" for name in ("x-ratelimit-remaining-requests", "x-ratelimit-remaining-tokens"))
+
+
+def retry_after_seconds(error):
+    """
+    Retry-After of a failed request in seconds (retry-after-ms preferred), None without one
+    """
+    headers = response_headers(error)
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return max(0.0, float(headers[name]) * scale)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    from openai import APIConnectionError
+
+    return isinstance(error, APIConnectionError)
+
+
+class RateLimitedEmbeddings:
+    """
+    embeddings.create with budgets, adaptive concurrency and retries (see the module comment)
+
+    Args:
+        embeddings: the wrapped client's embeddings resource
+        rpm / tpm: requests and tokens per minute
+        max_retries: retries of one request before giving up
+        base_delay / max_delay: backoff without Retry-After, full jitter over base_delay * 2**attempt
+        max_wait: seconds one call may spend waiting for budget and retries in total
+        count_tokens: callable(text) -> tokens (openai_batching.estimate_tokens by default)
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        rpm=DEFAULT_RPM,
+        tpm=DEFAULT_TPM,
+        limiter=None,
+        max_retries=5,
+        base_delay=0.25,
+        max_delay=8.0,
+        max_wait=20.0,
+        count_tokens=None,
+    ):
+        if count_tokens is None:
+            from openai_batching import estimate_tokens as count_tokens
+        self.embeddings = embeddings
+        self.request_budget = TokenBucket(rpm)
+        self.token_budget = TokenBucket(tpm)
+        self.limiter = limiter or AIMDLimiter()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.count_tokens = count_tokens
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.last_retry_after = None
+
+    def backoff(self, attempt, retry_after):
+        jitter = random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is None:
+            return jitter
+        # never earlier than the server asked for; the jitter spreads out the callers it paused
+        return retry_after + jitter * 0.25
+
+    def create(self, **kwargs):
+        inputs = kwargs.get("input", [])
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        tokens = sum(self.count_tokens(text) for text in texts)
+        deadline = time.monotonic() + self.max_wait
+        attempt = 0
+        while True:
+            # a superseded rerun stops here instead of waiting for budget or retrying
+            check_cancelled()
+            pause = self._paused_until - time.monotonic()
+            wait = max(pause, self.request_budget.reserve(1), self.token_budget.reserve(tokens))
+            if time.monotonic() + wait > deadline:
+                self.request_budget.refund(1)
+                self.token_budget.refund(tokens)
+                with self._lock:
+                    self.gave_up += 1
+                raise RateLimited(
+                    f"{kwargs.get('model')} rate limit budget exhausted, retry in {wait:.1f}s", retry_after=wait
+                )
+            if wait > 0:
+                time.sleep(wait)
+
+            started = self.limiter.acquire()
+            with self._lock:
+                self.requests += 1
+            try:
+                response = self.embeddings.create(**kwargs)
+            except Exception as e:
+                throttled = getattr(e, "status_code", None) == 429
+                # an exhausted budget is handled by pausing, not by running fewer requests at a time
+                exhausted = throttled and budget_exhausted(e)
+                self.limiter.release(started, throttled, adjust=not exhausted)
+                if not is_retryable(e):
+                    raise
+                retry_after = retry_after_seconds(e)
+                delay = self.backoff(attempt, retry_after)
+                with self._lock:
+                    if throttled:
+                        self.throttled += 1
+                        self.last_retry_after = retry_after
+                        if retry_after and exhausted:
+                            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    attempt += 1
+                    give_up = attempt > self.max_retries or time.monotonic() + delay > deadline
+                    if give_up:
+                        self.gave_up += 1
+                    else:
+                        self.retries += 1
+                if give_up:
+                    if throttled:
+                        raise RateLimited(
+                            f"{kwargs.get('model')} rate limited (HTTP 429) after {attempt} attempts, "
+                            f"retry in {delay:.1f}s",
+                            retry_after=delay,
+                        ) from e
+                    raise
+                time.sleep(delay)
+                continue
+
+            self.limiter.release(started)
+            # settle the token estimate with the tokens the API counted
+            total_tokens = getattr(getattr(response, "usage", None), "total_tokens", None)
+            if total_tokens is not None:
+                self.token_budget.refund(tokens - total_tokens)
+            return response
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "concurrency_decreases": self.limiter.decreases,
+            "rpm_wait_s": self.request_budget.waited_s,
+            "tpm_wait_s": self.token_budget.waited_s,
+        }
+
+
+class RateLimitedClient:
+    """
+    OpenAI client whose embeddings.create goes through RateLimitedEmbeddings
+    Everything else is the wrapped client's
+    """
+
+    def __init__(self, client, **limits):
+        self.client = client
+        self.embeddings = RateLimitedEmbeddings(client.embeddings, **limits)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def stats(self):
+        return self.embeddings.stats()
+
+
+def build_openai_client(api_key=None, base_url=None, max_concurrency=None, **limits):
+    """
+    RateLimitedClient over an OpenAI client with a pooled keep-alive HTTP client and no SDK retries
+    Limits not given come from OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT and OPENAI_MAX_CONCURRENCY
+    """
+    from openai import DefaultHttpxClient, OpenAI
+
+    try:
+        # openai 3.x is built on its httpx2 fork, older releases on httpx
+        import httpx2 as httpx
+    except ImportError:
+        import httpx
+
+    max_concurrency = max_concurrency or int(os.getenv("OPENAI_MAX_CONCURRENCY", MAX_CONCURRENCY))
+    limits.setdefault("rpm", int(os.getenv("OPENAI_RPM_LIMIT", DEFAULT_RPM)))
+    limits.setdefault("tpm", int(os.getenv("OPENAI_TPM_LIMIT", DEFAULT_TPM)))
+    limits.setdefault("limiter", AIMDLimiter(min(INITIAL_CONCURRENCY, max_concurrency), maximum=max_concurrency))
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_concurrency,
+            max_keepalive_connections=max_concurrency,
+            keepalive_expiry=KEEPALIVE_EXPIRY_S,
+        )
+    )
+    client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+    return RateLimitedClient(client, **limits)
@@ -0,0 +1,207 @@
+### Local stub of the OpenAI embeddings endpoint.
+# Serves POST /v1/embeddings with deterministic pseudo-embeddings (seeded by the input text), so the
+# OpenAI code paths can be exercised offline. Point a client at it with
+#   OpenAI(api_key="stub", base_url=server.base_url)
+# or run it standalone and export OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 for the app.
+# throttle_if answers requests with 429 and Retry-After, e.g. during scheduled windows in which the
+# rate limit budget is used up (throttle_windows) or above a number of concurrent requests
+# (throttle_above).
+
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+
+def stub_embedding(text, model_name, dimensions=None):
+    """
+    Deterministic unit vector for (model, text)
+    """
+    seed = int.from_bytes(hashlib.sha256((model_name + "\0" + text).encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(MODEL_DIMENSIONS.get(model_name, 1536))
+    if dimensions:
+        vector = vector[:dimensions]
+    return vector / np.linalg.norm(vector)
+
+
+def throttle_windows(windows, retry_after=None):
+    """
+    throttle_if for 429s during [(start_s, end_s), ...] after the server started, reported as an
+    exhausted request budget; Retry-After is the rest of the window unless retry_after is given
+    """
+
+    def throttle_if(index, elapsed, in_flight):
+        for start, end in windows:
+            if start <= elapsed < end:
+                delay = retry_after if retry_after is not None else end - elapsed
+                return delay, {"x-ratelimit-remaining-requests": "0"}
+        return None
+
+    return throttle_if
+
+
+def throttle_above(concurrency, retry_after=0.5):
+    """
+    throttle_if for 429s while more than concurrency requests are being served
+    """
+    return lambda index, elapsed, in_flight: retry_after if in_flight > concurrency else None
+
+
+class StubEmbeddingsServer:
+    """
+    Threaded HTTP server imitating /v1/embeddings
+
+    Args:
+        latency: seconds added to every request
+        fail_if: optional callable(inputs) -> True to answer that request with HTTP 500
+        throttle_if: optional callable(request_index, seconds_since_start, requests_in_flight) ->
+            Retry-After seconds, or (seconds, extra headers), to answer that request with HTTP 429
+            (None to serve it)
+        max_inputs: requests with more inputs than this get HTTP 400, like the real API
+        port: 0 picks a free port
+    """
+
+    def __init__(self, latency=0.0, fail_if=None, max_inputs=2048, host="127.0.0.1", port=0, throttle_if=None):
+        self.latency = latency
+        self.fail_if = fail_if
+        self.throttle_if = throttle_if
+        self.max_inputs = max_inputs
+        self.requests = []
+        self.throttled = 0
+        self.in_flight = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately; without this Nagle + delayed ACK add ~40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.rstrip("/") != "/v1/embeddings":
+                    self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                    return
+                request = json.loads(body or b"{}")
+                inputs = request.get("input", [])
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                status, payload, headers = server.handle(request.get("model", ""), inputs, request.get("dimensions"))
+                self.send_json(status, payload, headers)
+
+        return Handler
+
+    def handle(self, model_name, inputs, dimensions=None):
+        """
+        Answer one embeddings request: returns (status, payload, headers)
+        """
+        with self._lock:
+            index = len(self.requests)
+            self.requests.append(list(inputs))
+            self.in_flight += 1
+        try:
+            return self._respond(index, model_name, inputs, dimensions)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _respond(self, index, model_name, inputs, dimensions):
+        if self.throttle_if is not None:
+            throttle = self.throttle_if(index, time.perf_counter() - self.started, self.in_flight)
+            if throttle is not None:
+                retry_after, headers = throttle if isinstance(throttle, tuple) else (throttle, {})
+                with self._lock:
+                    self.throttled += 1
+                headers = dict(
+                    headers, **{"Retry-After": str(math.ceil(retry_after)), "retry-after-ms": str(int(retry_after * 1000))}
+                )
+                error = {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}
+                return 429, {"error": error}, headers
+        if self.latency:
+            time.sleep(self.latency)
+        if len(inputs) > self.max_inputs:
+            return 400, {"error": {"message": "Too many inputs", "type": "invalid_request_error"}}, {}
+        if self.fail_if is not None and self.fail_if(inputs):
+            return 500, {"error": {"message": "Stub failure", "type": "server_error"}}, {}
+        data = [
+            {"object": "embedding", "index": index, "embedding": stub_embedding(text, model_name, dimensions).tolist()}
+            for index, text in enumerate(inputs)
+        ]
+        tokens = sum(len(text.split()) for text in inputs)
+        payload = {
+            "object": "list",
+            "data": data,
+            "model": model_name,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+        return 200, payload, {}
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local stub of the OpenAI embeddings endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--throttle", default="", help="429 windows in seconds since start, e.g. 10-20,40-45")
+    args = parser.parse_args()
+
+    windows = [tuple(float(value) for value in window.split("-")) for window in args.throttle.split(",") if window]
+    server = StubEmbeddingsServer(
+        latency=args.latency, port=args.port, throttle_if=throttle_windows(windows) if windows else None
+    )
+    print(f"Serving stub embeddings on {server.base_url} (export OPENAI_BASE_URL={server.base_url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,196 @@
+### Pairwise sentence similarity across models (word order and sentence-pair analysis).
+# Compares N sentences with each other (N x N) or with M other sentences (N x M), for every model:
+# each unique sentence is embedded once per model in batches, rows are normalized once, and the
+# matrix is computed in blocks of block_rows rows so only block_rows x M scores exist at a time.
+# The full matrix can be written into a preallocated (e.g. memory-mapped .npy) array; with top_k only
+# the k nearest columns of every row are kept (vector_index.blocked_top_k over column blocks), which
+# is what scales to tens of thousands of sentences. Scores are plain cosine; np.exp gives the app's
+# scores (cosine_similarity).
+#
+#   python pairwise.py pairs.txt --models glove_50d sentence_transformer_384 --output pairwise
+#   python pairwise.py titles.jsonl --against queries.jsonl --top-k 5 --output neighbours
+# Input files are JSONL or CSV (see classify.read_records), or plain text with one sentence per line.
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from embedders import MODEL_FAMILIES, get_encoder
+from scoring import normalize_rows
+from vector_index import blocked_top_k
+
+DEFAULT_BLOCK_ROWS = 1024
+EMBED_BATCH_SIZE = 1024
+
+
+def unique_sentences(sentences):
+    """
+    (unique sentences in first-seen order, index of every input sentence in that list)
+    """
+    positions = {}
+    inverse = np.fromiter(
+        (positions.setdefault(sentence, len(positions)) for sentence in sentences), dtype=np.int64, count=len(sentences)
+    )
+    return list(positions), inverse
+
+
+def embed_unique(encode, sentences, batch_size=EMBED_BATCH_SIZE):
+    """
+    Row-normalized float32 embeddings of sentences, in input order
+    Every unique sentence goes through encode(list) -> (n, dim) once, in batches of batch_size
+    """
+    sentences = list(sentences)
+    unique, inverse = unique_sentences(sentences)
+    if not unique:
+        return np.empty((0, 0), dtype=np.float32)
+    vectors = np.concatenate([
+        normalize_rows(encode(unique[start:start + batch_size])) for start in range(0, len(unique), batch_size)
+    ])
+    return vectors[inverse]
+
+
+def similarity_blocks(left, right=None, block_rows=DEFAULT_BLOCK_ROWS):
+    """
+    Yield (start, scores) where scores is the cosine block of left rows start:start + block_rows
+    against every row of right (left itself when right is None); both must be row-normalized
+    """
+    right = left if right is None else right
+    for start in range(0, len(left), block_rows):
+        yield start, np.asarray(left[start:start + block_rows]) @ np.asarray(right).T
+
+
+def similarity_matrix(left, right=None, block_rows=DEFAULT_BLOCK_ROWS, out=None):
+    """
+    (len(left), len(right)) cosine matrix of row-normalized embeddings, filled block by block
+    out can be a preallocated (e.g. memory-mapped) float32 array
+    """
+    right = left if right is None else right
+    if out is None:
+        out = np.empty((len(left), len(right)), dtype=np.float32)
+    for start, scores in similarity_blocks(left, right, block_rows):
+        out[start:start + len(scores)] = scores
+    return out
+
+
+def similarity_top_k(left, right=None, k=10, block_rows=DEFAULT_BLOCK_ROWS):
+    """
+    The k most similar rows of right for every row of left (row-normalized embeddings)
+
+    Without right the rows are compared with each other and a row is never its own neighbour
+    (an identical sentence elsewhere in the input still is, with a score of 1.0).
+    Peak memory is block_rows x block_rows scores, whatever the size of left and right.
+
+    Returns (scores, columns), each len(left) x k, highest first; missing slots are -inf / -1
+    """
+    self_pairs = right is None
+    right = left if self_pairs else right
+    scores = np.full((len(left), k), -np.inf, dtype=np.float32)
+    columns = np.full((len(left), k), -1, dtype=np.int64)
+    for start in range(0, len(left), block_rows):
+        queries = np.asarray(left[start:start + block_rows])
+        block_scores, block_columns = blocked_top_k(right, queries, k + 1 if self_pairs else k, block_rows)
+        if self_pairs:
+            # drop the row itself (or, if identical rows crowded it out, the last extra slot)
+            rows = np.arange(start, start + len(queries))[:, None]
+            keep = np.argsort(block_columns == rows, axis=1, kind="stable")[:, :k]
+            block_scores = np.take_along_axis(block_scores, keep, axis=1)
+            block_columns = np.take_along_axis(block_columns, keep, axis=1)
+        scores[start:start + len(queries)] = block_scores
+        columns[start:start + len(queries)] = block_columns
+    return scores, columns
+
+
+def pairwise_similarity(sentences, others=None, model_families=MODEL_FAMILIES, top_k=None,
+                        encoders=None, block_rows=DEFAULT_BLOCK_ROWS, out=None):
+    """
+    Similarity of sentences with each other (or with others) for several models
+
+    Args:
+        encoders: model family -> object with encode(list) -> (n, dim); get_encoder(family) by default
+        top_k: keep only the top_k neighbours of every row instead of the full matrix
+        out: model family -> preallocated array for its full matrix (e.g. np.lib.format.open_memmap)
+
+    Returns:
+        {model family: (N, M) cosine matrix} or, with top_k, {model family: (scores, columns)}
+    """
+    encoders = encoders or {}
+    out = out or {}
+    results = {}
+    for model_family in model_families:
+        encoder = encoders.get(model_family) or get_encoder(model_family)
+        if others is None:
+            left, right = embed_unique(encoder.encode, sentences), None
+        else:
+            # one pass over both lists, so a sentence that is in both is embedded once
+            vectors = embed_unique(encoder.encode, list(sentences) + list(others))
+            left, right = vectors[:len(sentences)], vectors[len(sentences):]
+        if top_k:
+            results[model_family] = similarity_top_k(left, right, top_k, block_rows)
+        else:
+            results[model_family] = similarity_matrix(left, right, block_rows, out.get(model_family))
+    return results
+
+
+def read_sentences(path, text_field="text"):
+    """
+    Sentences of a JSONL or CSV file (classify.read_records), or of a text file with one per line
+    """
+    if path.endswith((".jsonl", ".csv")) or path == "-":
+        from classify import read_records
+
+        return [text for _, text in read_records(path, text_field)]
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pairwise sentence similarity for several embedding models")
+    parser.add_argument("input", help="sentences: .jsonl, .csv or a text file with one sentence per line")
+    parser.add_argument("--against", help="compare with these sentences (N x M) instead of with each other")
+    parser.add_argument("--models", nargs="+", default=["glove_50d", "sentence_transformer_384"], choices=MODEL_FAMILIES)
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--top-k", type=int, default=None, help="keep only the k nearest sentences of every row")
+    parser.add_argument("--block-rows", type=int, default=DEFAULT_BLOCK_ROWS)
+    parser.add_argument("--output", required=True, help="output directory")
+    args = parser.parse_args()
+
+    sentences = read_sentences(args.input, args.text_field)
+    others = None if args.against is None else read_sentences(args.against, args.text_field)
+    columns = sentences if others is None else others
+    os.makedirs(args.output, exist_ok=True)
+
+    if args.top_k:
+        results = pairwise_similarity(sentences, others, args.models, args.top_k, block_rows=args.block_rows)
+        path = os.path.join(args.output, f"top{args.top_k}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for row, sentence in enumerate(sentences):
+                record = {"text": sentence}
+                for model_family, (scores, indices) in results.items():
+                    record[model_family] = [
+                        {"index": int(index), "text": columns[index], "cosine": float(score)}
+                        for score, index in zip(scores[row], indices[row]) if index >= 0
+                    ]
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"{len(sentences)} rows x top {args.top_k} for {', '.join(args.models)} -> {path}")
+        return
+
+    # full matrices go straight into memory-mapped .npy files, one per model
+    out = {
+        model_family: np.lib.format.open_memmap(
+            os.path.join(args.output, model_family + ".npy"), mode="w+", dtype=np.float32,
+            shape=(len(sentences), len(columns)),
+        )
+        for model_family in args.models
+    }
+    pairwise_similarity(sentences, others, args.models, block_rows=args.block_rows, out=out)
+    for matrix in out.values():
+        matrix.flush()
+    with open(os.path.join(args.output, "sentences.json"), "w", encoding="utf-8") as f:
+        json.dump({"rows": sentences, "columns": columns}, f, ensure_ascii=False)
+    print(f"{len(sentences)} x {len(columns)} matrices for {', '.join(args.models)} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+### Concurrent per-model pipeline runner.
+# The per-model work (embed the query, embed the categories, score) is independent between models,
+# so it runs concurrently and the page latency becomes the slowest model instead of the sum.
+# Network-bound jobs (OpenAI) go to an I/O thread pool, CPU-bound jobs (GloVe, sentence transformers)
+# to a separate small pool; numpy and torch release the GIL in their heavy kernels.
+# Results are yielded as soon as each model finishes, and every model has its own timeout.
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+IO_WORKERS = 8
+CPU_WORKERS = 2
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind):
+    """
+    Process-wide executor for "io" or "cpu" jobs (created on first use)
+    """
+    with _executors_lock:
+        if kind not in _executors:
+            workers = IO_WORKERS if kind == "io" else CPU_WORKERS
+            _executors[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline-" + kind)
+        return _executors[kind]
+
+
+class ModelJob:
+    """
+    One model's work in the pipeline
+
+    Args:
+        name: result key, e.g. "openai_small_1536"
+        fn: callable without arguments returning the model's result
+        kind: "io" for network-bound work, "cpu" for local compute
+        timeout: seconds before the model is reported as timed out (None = no limit)
+    """
+
+    def __init__(self, name, fn, kind="cpu", timeout=None):
+        self.name = name
+        self.fn = fn
+        self.kind = kind
+        self.timeout = timeout
+
+
+class ModelResult:
+    """
+    Outcome of one ModelJob: value on success, error on failure or timeout
+    """
+
+    def __init__(self, name, value=None, error=None, elapsed=0.0, timed_out=False):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def run_concurrently(jobs, wrap=None):
+    """
+    Run ModelJobs concurrently and yield a ModelResult for each as soon as it is done
+
+    A job that exceeds its timeout is yielded as timed out and no longer waited for (its thread
+    finishes in the background). wrap(fn) -> fn can be used to attach per-thread context.
+    Closing the generator early cancels the jobs that have not started yet.
+    """
+    start = time.perf_counter()
+    futures = {}
+    for job in jobs:
+        fn = wrap(job.fn) if wrap is not None else job.fn
+        futures[get_executor(job.kind).submit(fn)] = job
+
+    deadlines = {
+        future: start + job.timeout for future, job in futures.items() if job.timeout is not None
+    }
+    pending = set(futures)
+    try:
+        while pending:
+            now = time.perf_counter()
+            timeout = None
+            pending_deadlines = [deadlines[future] for future in pending if future in deadlines]
+            if pending_deadlines:
+                timeout = max(0.0, min(pending_deadlines) - now)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                job = futures[future]
+                elapsed = time.perf_counter() - start
+                try:
+                    yield ModelResult(job.name, value=future.result(), elapsed=elapsed)
+                except Exception as e:
+                    yield ModelResult(job.name, error=e, elapsed=elapsed)
+
+            now = time.perf_counter()
+            for future in [future for future in pending if deadlines.get(future, float("inf")) <= now]:
+                pending.discard(future)
+                future.cancel()
+                job = futures[future]
+                yield ModelResult(
+                    job.name,
+                    error=TimeoutError(f"{job.name} did not finish within {job.timeout:g}s"),
+                    elapsed=now - start,
+                    timed_out=True,
+                )
+    finally:
+        # the consumer stopped early (e.g. a Streamlit rerun interrupted the script):
+        # jobs that have not started yet are dropped instead of running for nothing
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,103 @@
+### Reduced-precision vector storage.
+# A QuantizedMatrix holds row vectors as float32, float16 or int8 with one float32 scale per row
+# (scale = max |x| / 127, so every row uses the full int8 range). Scoring dequantizes one block of
+# rows at a time and multiplies it with the queries, so the float32 copy of the whole matrix never
+# exists. int8 needs 1/4 and float16 1/2 of the float32 memory (1/8 and 1/4 of float64).
+# Approximate scores are good enough to pick candidates; callers that need exact scores rerank the
+# few candidates against their full-precision vectors (see CategoryScorer).
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+SCORE_BLOCK_ROWS = 65536
+
+
+def quantize_int8(matrix):
+    """
+    Per-row symmetric int8 quantization: returns (codes, scales) with matrix ~= codes * scales[:, None]
+    Zero rows get scale 0 and stay zero
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+    safe = np.where(scales > 0, scales, 1.0)
+    codes = np.clip(np.rint(matrix / safe[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedMatrix:
+    """
+    Row vectors stored at reduced precision
+
+    Args:
+        matrix: 2D array of row vectors (any float dtype)
+        precision: "float32", "float16" or "int8"
+    """
+
+    def __init__(self, matrix, precision="float32"):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}; choose from {', '.join(PRECISIONS)}")
+        self.precision = precision
+        matrix = np.atleast_2d(np.asarray(matrix))
+        if precision == "int8":
+            self.codes, self.scales = quantize_int8(matrix)
+        else:
+            self.codes, self.scales = np.ascontiguousarray(matrix, dtype=precision), None
+        self.shape = self.codes.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def assign(self, rows, matrix):
+        """
+        Overwrite some rows in place with new (full-precision) vectors
+        """
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+        if isinstance(rows, (int, np.integer)):
+            rows = [rows]
+        if self.scales is not None:
+            self.codes[rows], self.scales[rows] = quantize_int8(matrix)
+        else:
+            self.codes[rows] = matrix
+
+    def resize(self, num_rows):
+        """
+        Grow (zero rows) or shrink the matrix to num_rows rows
+        """
+        codes = np.zeros((num_rows, self.shape[1]), dtype=self.codes.dtype)
+        kept = min(num_rows, self.shape[0])
+        codes[:kept] = self.codes[:kept]
+        self.codes = codes
+        if self.scales is not None:
+            scales = np.zeros(num_rows, dtype=np.float32)
+            scales[:kept] = self.scales[:kept]
+            self.scales = scales
+        self.shape = self.codes.shape
+
+    def dequantize(self, rows=slice(None)):
+        """
+        float32 copy of some rows (default: all of them)
+        """
+        block = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows, None]
+        return block
+
+    def dot(self, queries, block_rows=SCORE_BLOCK_ROWS):
+        """
+        queries (n_queries x dim) @ matrix.T in float32, one dequantized block at a time
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.precision == "float32":
+            return queries @ self.codes.T
+        out = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), block_rows):
+            rows = slice(start, start + block_rows)
+            # int8: (q @ codes.T) * scales is the same product without scaling the block first
+            out[:, rows] = queries @ self.codes[rows].astype(np.float32).T
+            if self.scales is not None:
+                out[:, rows] *= self.scales[rows]
+        return out
@@ -0,0 +1,204 @@
+### Matrix-based scoring engine for category ranking.
+# Keeps the category vectors of one model as a single pre-normalized float32 matrix,
+# so a query (or a batch of queries) is scored against every category with one matrix product.
+# Scores are the same exponentiated cosine similarity as cosine_similarity(x, y).
+# The matrix can be stored as float16 or int8 (quantized_vectors.py), or hold only a renormalized
+# prefix of each vector (text-embedding-3 vectors are trained so that their first components are an
+# embedding on their own, which is what the API's `dimensions` parameter returns). The top
+# candidates are then rescored with the original full vectors so the returned ranking stays exact.
+
+import numpy as np
+
+from quantized_vectors import QuantizedMatrix
+
+
+def normalize_rows(matrix):
+    """
+    Row-normalize a 2D matrix to unit length (float32)
+    Zero rows stay zero, so their cosine similarity is 0 like in cosine_similarity
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def inverse_norms(matrix):
+    """
+    1 / row norm (0 for zero rows)
+    """
+    norms = np.linalg.norm(matrix, axis=1)
+    return np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0).astype(np.float32)
+
+
+def truncate_dimensions(matrix, dimensions=None):
+    """
+    Rows cut to their first `dimensions` components and renormalized (just normalized for None)
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    if dimensions:
+        matrix = matrix[:, :dimensions]
+    return normalize_rows(matrix)
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k largest scores, highest first
+
+    Uses argpartition so only the k selected items are sorted.
+    Ties are broken by the lower index first, same as a stable sorted(..., reverse=True).
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # argpartition does not know about ties at the boundary: pull in every item
+        # that ties with the k-th score so the lowest indices win, like a stable sort
+        kth = scores[candidates].min()
+        candidates = np.union1d(candidates, np.flatnonzero(scores == kth))
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+class CategoryScorer:
+    """
+    Scoring engine for one model's categories
+
+    Args:
+        category_vectors: list (or 2D array) of category embeddings, in category order.
+            An entry can be None for a category without an embedding; it always scores 0.0,
+            same as the fallback in get_sorted_cosine_similarity.
+        precision: storage of the normalized matrix, "float32", "float16" or "int8"
+        rerank: with a reduced precision or dimensions, how many top candidates per query are
+            rescored with the full category_vectors (0 = approximate scores only)
+        dimensions: score with the first `dimensions` components of every vector (renormalized),
+            i.e. coarse-to-fine: shortlist on the prefix, rerank the shortlist at full width
+    """
+
+    def __init__(self, category_vectors, precision="float32", rerank=0, dimensions=None):
+        vectors = list(category_vectors)
+        self.num_categories = len(vectors)
+        self.valid = np.array([vector is not None for vector in vectors], dtype=bool)
+
+        dim = next((len(vector) for vector in vectors if vector is not None), 0)
+        matrix = np.zeros((self.num_categories, dim), dtype=np.float32)
+        for index, vector in enumerate(vectors):
+            if vector is not None:
+                matrix[index] = vector
+        self.dimensions = dimensions
+        self.matrix = QuantizedMatrix(truncate_dimensions(matrix, dimensions), precision)
+        self.precision = precision
+        self.dim = self.matrix.shape[1]
+        # references to the caller's vectors (the caller's matrix itself if it passed one), only
+        # read when reranking; their norms are kept so a rescore is one small matrix product
+        self.rerank = rerank if precision != "float32" or dimensions else 0
+        self.vectors = None
+        if self.rerank:
+            is_matrix = isinstance(category_vectors, np.ndarray) and category_vectors.ndim == 2
+            self.vectors = category_vectors if is_matrix else vectors
+            self.inverse_norms = inverse_norms(matrix)
+
+    def resize(self, num_categories):
+        """
+        Grow (new categories have no embedding yet) or shrink the number of categories
+        """
+        self.matrix.resize(num_categories)
+        valid = np.zeros(num_categories, dtype=bool)
+        kept = min(num_categories, self.num_categories)
+        valid[:kept] = self.valid[:kept]
+        self.valid = valid
+        if self.vectors is not None:
+            self.vectors = (list(self.vectors) + [None] * num_categories)[:num_categories]
+            norms = np.zeros(num_categories, dtype=np.float32)
+            norms[:kept] = self.inverse_norms[:kept]
+            self.inverse_norms = norms
+        self.num_categories = num_categories
+
+    def set_vectors(self, indices, vectors):
+        """
+        Replace the embeddings of some categories in place (None = no embedding)
+        Only those rows of the matrix are rewritten
+        """
+        for index, vector in zip(indices, vectors):
+            if vector is not None and self.dim == 0:
+                # first embedding of a scorer created without any
+                self.dim = min(len(vector), self.dimensions or len(vector))
+                self.matrix = QuantizedMatrix(np.zeros((self.num_categories, self.dim), dtype=np.float32), self.precision)
+            if vector is None:
+                self.valid[index] = False
+                if self.dim:
+                    self.matrix.assign(index, np.zeros(self.dim, dtype=np.float32))
+            else:
+                self.valid[index] = True
+                self.matrix.assign(index, truncate_dimensions(vector, self.dimensions))
+            if self.vectors is not None:
+                if isinstance(self.vectors, np.ndarray):
+                    self.vectors = list(self.vectors)
+                self.vectors[index] = vector
+                self.inverse_norms[index] = 0.0 if vector is None else inverse_norms(np.atleast_2d(vector))[0]
+
+    def cosine(self, queries):
+        """
+        Plain cosine similarity of a batch of queries (n_queries x dim) against every category
+        """
+        queries = truncate_dimensions(queries, self.dimensions)
+        if self.dim == 0:
+            # no category has an embedding
+            return np.zeros((len(queries), self.num_categories), dtype=np.float32)
+        return self.matrix.dot(queries)
+
+    def score_batch(self, queries):
+        """
+        Exponentiated cosine similarity matrix (n_queries x n_categories)
+        Categories without an embedding get a score of 0.0
+        """
+        scores = np.exp(self.cosine(queries))
+        scores[:, ~self.valid] = 0.0
+        return scores
+
+    def score(self, query):
+        """
+        Exponentiated cosine similarity of a single query against every category
+        """
+        return self.score_batch(query)[0]
+
+    def top_k(self, query, k=None):
+        """
+        Sorted [(category_index, score), ...] for a single query, highest first
+        With k=None every category is returned, like get_sorted_cosine_similarity
+        """
+        return self.top_k_batch(query, k)[0]
+
+    def top_k_batch(self, queries, k=None):
+        """
+        Sorted [(category_index, score), ...] lists for a batch of queries
+        """
+        queries = np.atleast_2d(queries)
+        scores = self.score_batch(queries)
+        if k is None:
+            k = self.num_categories
+        results = []
+        for query, row in zip(queries, scores):
+            if self.rerank:
+                self.rescore(query, row, top_k_indices(row, max(k, self.rerank)))
+            indices = top_k_indices(row, k)
+            results.append([(int(index), float(row[index])) for index in indices])
+        return results
+
+    def rescore(self, query, row, indices):
+        """
+        Overwrite the scores of some categories in row with full-precision scores
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = indices[self.valid[indices]]
+        if len(indices):
+            if isinstance(self.vectors, np.ndarray):
+                vectors = self.vectors[indices]
+            else:
+                vectors = np.array([self.vectors[index] for index in indices], dtype=np.float32)
+            query = normalize_rows(query[None, :])[0]
+            row[indices] = np.exp((vectors @ query) * self.inverse_norms[indices])
@@ -0,0 +1,183 @@
+### CPU inference backends for the sentence-transformer model.
+# ST_BACKEND picks how all-MiniLM-L6-v2 is run:
+#   torch       PyTorch in fp32 (the default, what the app always did)
+#   torch-int8  PyTorch with the Linear layers dynamically quantized to int8
+#   onnx        ONNX Runtime on the model's ONNX export (sentence-transformers' onnx backend)
+#   onnx-int8   ONNX Runtime on the dynamically int8-quantized export; the file published with the
+#               model is used when there is one for this CPU, otherwise the export is quantized
+#               locally once into ST_ONNX_DIR
+# ST_INTRA_OP_THREADS / ST_INTER_OP_THREADS set the thread pools explicitly (torch.set_num_threads
+# and set_num_interop_threads, or the ONNX Runtime session options) instead of the library defaults.
+# ST_LENGTH_BUCKETS ("16,32,64,128" token boundaries, "0" disables) splits a batch into groups of
+# similar length before encoding, so short sentences are not padded to the longest one in the batch.
+# The onnx backends need sentence-transformers >= 3.2 with optimum[onnxruntime].
+
+import bisect
+import os
+import platform
+import warnings
+
+import numpy as np
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_LENGTH_BUCKETS = (16, 32, 64, 128)
+DEFAULT_ONNX_DIR = "st_onnx"
+# machine -> (quantization config of export_dynamic_quantized_onnx_model, file it writes / publishes)
+ONNX_INT8_FILES = {
+    "x86_64": ("avx2", "onnx/model_quint8_avx2.onnx"),
+    "amd64": ("avx2", "onnx/model_quint8_avx2.onnx"),
+    "aarch64": ("arm64", "onnx/model_qint8_arm64.onnx"),
+    "arm64": ("arm64", "onnx/model_qint8_arm64.onnx"),
+}
+
+
+def config_from_env():
+    """
+    Keyword arguments for load_sentence_transformer and encode_bucketed from the ST_* variables
+    """
+    backend = os.getenv("ST_BACKEND", "torch")
+    if backend not in BACKENDS:
+        raise ValueError(f"ST_BACKEND={backend!r}; choose from {', '.join(BACKENDS)}")
+    buckets = os.getenv("ST_LENGTH_BUCKETS")
+    return {
+        "backend": backend,
+        "intra_op_threads": int(os.getenv("ST_INTRA_OP_THREADS", "0")) or None,
+        "inter_op_threads": int(os.getenv("ST_INTER_OP_THREADS", "0")) or None,
+        "length_buckets": DEFAULT_LENGTH_BUCKETS if buckets is None else tuple(
+            int(boundary) for boundary in buckets.split(",") if int(boundary) > 0
+        ),
+    }
+
+
+def embedding_version(backend="torch"):
+    """
+    Embedding cache version of the sentence-transformer embeddings computed with a backend
+    The reduced-precision and ONNX backends get their own entries, fp32 torch keeps the old ones
+    """
+    from importlib import metadata
+
+    version = "sentence-transformers-" + metadata.version("sentence-transformers")
+    return version if backend == "torch" else version + "-" + backend
+
+
+def configure_torch_threads(intra_op_threads=None, inter_op_threads=None):
+    if not intra_op_threads and not inter_op_threads:
+        return
+    import torch
+
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # only possible before the first parallel operation of the process
+            warnings.warn("torch inter-op threads are already in use; ST_INTER_OP_THREADS ignored")
+
+
+def onnx_session_options(intra_op_threads=None, inter_op_threads=None):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    return options
+
+
+def load_onnx_int8(model_name, model_kwargs, onnx_dir=None):
+    """
+    Quantized ONNX model: the published file for this CPU, else a local quantized export (made once)
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    config, file_name = ONNX_INT8_FILES.get(platform.machine().lower(), ONNX_INT8_FILES["x86_64"])
+    try:
+        return SentenceTransformer(
+            model_name, device="cpu", backend="onnx", model_kwargs=dict(model_kwargs, file_name=file_name)
+        )
+    except Exception:
+        export_dir = os.path.join(onnx_dir or os.getenv("ST_ONNX_DIR", DEFAULT_ONNX_DIR), model_name.replace("/", "--"))
+        if not os.path.isfile(os.path.join(export_dir, file_name)):
+            model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+            model.save_pretrained(export_dir)
+            export_dynamic_quantized_onnx_model(model, config, export_dir)
+        return SentenceTransformer(
+            export_dir, device="cpu", backend="onnx", model_kwargs=dict(model_kwargs, file_name=file_name)
+        )
+
+
+def load_sentence_transformer(model_name, backend="torch", intra_op_threads=None, inter_op_threads=None, **_):
+    """
+    SentenceTransformer for CPU inference with one of BACKENDS (see the module comment)
+    Extra keyword arguments (length_buckets from config_from_env) are ignored
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    if backend.startswith("onnx"):
+        model_kwargs = {
+            "provider": "CPUExecutionProvider",
+            "session_options": onnx_session_options(intra_op_threads, inter_op_threads),
+        }
+        if backend == "onnx-int8":
+            return load_onnx_int8(model_name, model_kwargs)
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    configure_torch_threads(intra_op_threads, inter_op_threads)
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    import torch
+
+    # quantized Linear layers only run on the CPU
+    model = SentenceTransformer(model_name, device="cpu")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def token_lengths(model, sentences):
+    """
+    Token count of each sentence (capped at the model's max_seq_length); words + 2 without a tokenizer
+    """
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return [len(sentence.split()) + 2 for sentence in sentences]
+    # fast tokenizers are cheap next to the forward pass, even though encode tokenizes again
+    encoded = tokenizer(list(sentences), truncation=True, max_length=getattr(model, "max_seq_length", None))
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def bucket_indices(lengths, boundaries):
+    """
+    Indices grouped by length bucket (upper bounds in boundaries; longer ones form one more bucket)
+    """
+    groups = {}
+    for index, length in enumerate(lengths):
+        groups.setdefault(bisect.bisect_left(boundaries, length), []).append(index)
+    return [groups[bucket] for bucket in sorted(groups)]
+
+
+def encode_bucketed(model, sentences, length_buckets=DEFAULT_LENGTH_BUCKETS, max_batch_size=None):
+    """
+    (n, dim) float32 embeddings of sentences, encoded per length bucket and returned in input order
+    Without length_buckets the sentences are encoded as one batch (padded to the longest)
+    """
+    sentences = list(sentences)
+    if not length_buckets or len(sentences) < 2:
+        return np.asarray(
+            model.encode(sentences, batch_size=max_batch_size or max(1, len(sentences))), dtype=np.float32
+        )
+    groups = bucket_indices(token_lengths(model, sentences), length_buckets)
+    embeddings = None
+    for group in groups:
+        vectors = np.asarray(
+            model.encode([sentences[index] for index in group], batch_size=max_batch_size or len(group)),
+            dtype=np.float32,
+        )
+        if embeddings is None:
+            embeddings = np.empty((len(sentences), vectors.shape[1]), dtype=np.float32)
+        embeddings[group] = vectors
+    return embeddings
@@ -0,0 +1,340 @@
+### Vector index for retrieval over large document corpora.
+# ExactIndex is the brute-force baseline: one blocked matrix product against every stored vector.
+# IVFIndex is an inverted-file approximate index: vectors are bucketed by their nearest k-means
+# centroid and a query only scans the nprobe closest buckets. nlist/nprobe trade recall for latency.
+# Until it has seen enough vectors to train on, an IVFIndex buffers what is added and searches the
+# buffer exactly; it trains itself (and buckets the buffer) once train_size vectors have arrived.
+# Both use cosine similarity (vectors are row-normalized on insert), support incremental add()
+# and save()/load() to a single .npz file. Scores are plain cosine; np.exp gives the app's scores.
+
+import numpy as np
+
+from scoring import normalize_rows, top_k_indices
+
+# rows scanned per matrix product in ExactIndex.search; bounds the temporary score matrix
+SEARCH_BLOCK_ROWS = 65536
+
+
+class GrowableMatrix:
+    """
+    Append-only float32 matrix with amortized O(1) appends (capacity doubles when full)
+    """
+
+    def __init__(self, dim, capacity=1024):
+        self.data = np.empty((capacity, dim), dtype=np.float32)
+        self.size = 0
+
+    def append(self, rows):
+        needed = self.size + len(rows)
+        if needed > len(self.data):
+            capacity = max(needed, 2 * len(self.data))
+            grown = np.empty((capacity, self.data.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = rows
+        self.size = needed
+
+    @property
+    def view(self):
+        return self.data[:self.size]
+
+
+class GrowableIds:
+    def __init__(self, capacity=1024):
+        self.data = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def append(self, ids):
+        needed = self.size + len(ids)
+        if needed > len(self.data):
+            grown = np.empty(max(needed, 2 * len(self.data)), dtype=np.int64)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = ids
+        self.size = needed
+
+    @property
+    def view(self):
+        return self.data[:self.size]
+
+
+def partition_top_k(scores, k):
+    """
+    Column indices of the k largest entries in every row of a 2D score matrix (unordered)
+    """
+    k = min(k, scores.shape[1])
+    if k == scores.shape[1]:
+        return np.broadcast_to(np.arange(k), scores.shape).copy()
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def blocked_top_k(matrix, queries, k, block_rows=None):
+    """
+    Top-k rows of matrix by dot product with each query, scanning matrix in blocks of block_rows
+
+    Only one (n_queries x block_rows) score block exists at a time, so peak memory is bounded
+    no matter how large (or memory-mapped) matrix is.
+
+    Returns (scores, rows), each n_queries x k, highest first; missing slots are -inf / -1
+    """
+    block_rows = block_rows or SEARCH_BLOCK_ROWS
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(matrix), block_rows):
+        block_scores = queries @ np.asarray(matrix[start:start + block_rows]).T
+        # keep the block's top-k per query, then the top-k of (previous best + block best)
+        local = partition_top_k(block_scores, k)
+        all_scores = np.concatenate([best_scores, np.take_along_axis(block_scores, local, axis=1)], axis=1)
+        all_rows = np.concatenate([best_rows, local + start], axis=1)
+        keep = partition_top_k(all_scores, k)
+        best_scores = np.take_along_axis(all_scores, keep, axis=1)
+        best_rows = np.take_along_axis(all_rows, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return pad_results(
+        list(zip(np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1))), k
+    )
+
+
+def merge_top_k(scores, ids, k):
+    """
+    Top-k (scores, ids) of one query from candidate arrays, highest score first
+    """
+    order = top_k_indices(scores, k)
+    return scores[order], ids[order]
+
+
+def pad_results(results, k):
+    """
+    Stack per-query (scores, ids) into (n_queries, k) arrays; missing slots are -inf / -1
+    """
+    scores = np.full((len(results), k), -np.inf, dtype=np.float32)
+    ids = np.full((len(results), k), -1, dtype=np.int64)
+    for row, (row_scores, row_ids) in enumerate(results):
+        scores[row, :len(row_scores)] = row_scores
+        ids[row, :len(row_ids)] = row_ids
+    return scores, ids
+
+
+class ExactIndex:
+    """
+    Brute-force cosine search over every stored vector
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.vectors = GrowableMatrix(dim)
+        self.ids = GrowableIds()
+        self.next_id = 0
+
+    def __len__(self):
+        return self.vectors.size
+
+    def add(self, vectors, ids=None):
+        """
+        Add vectors (n x dim); ids default to consecutive integers. Returns the ids
+        """
+        vectors = normalize_rows(np.atleast_2d(vectors))
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(vectors))
+        ids = np.asarray(ids, dtype=np.int64)
+        self.next_id = max(self.next_id, int(ids.max()) + 1) if len(ids) else self.next_id
+        self.vectors.append(vectors)
+        self.ids.append(ids)
+        return ids
+
+    def search(self, queries, k=10):
+        """
+        (scores, ids), each n_queries x k, highest cosine first
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        scores, rows = blocked_top_k(self.vectors.view, queries, k)
+        ids = np.where(rows >= 0, self.ids.view[np.maximum(rows, 0)], -1) if len(self) else rows
+        return scores, ids
+
+    def save(self, path):
+        np.savez(path, kind="exact", dim=self.dim, vectors=self.vectors.view, ids=self.ids.view, next_id=self.next_id)
+
+    @classmethod
+    def from_arrays(cls, data):
+        index = cls(int(data["dim"]))
+        index.vectors.append(data["vectors"])
+        index.ids.append(data["ids"])
+        index.next_id = int(data["next_id"])
+        return index
+
+
+def train_kmeans(vectors, nlist, iterations=20, seed=0):
+    """
+    Spherical k-means centroids (nlist x dim, unit length) for row-normalized vectors
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=nlist)
+        # re-seed empty clusters with random points so every list stays useful
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate cosine index
+
+    Args:
+        dim: vector dimension
+        nlist: number of k-means buckets (a common choice is about sqrt(n))
+        nprobe: buckets scanned per query by default; higher = better recall, slower
+        train_size: vectors buffered (and searched exactly) before the index trains itself on them;
+            at least nlist
+    """
+
+    def __init__(self, dim, nlist=1024, nprobe=8, train_size=None):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = max(train_size or nlist, nlist)
+        self.centroids = None
+        self.lists = [GrowableMatrix(dim, capacity=16) for _ in range(nlist)]
+        self.list_ids = [GrowableIds(capacity=16) for _ in range(nlist)]
+        # vectors added before training
+        self.pending = GrowableMatrix(dim, capacity=16)
+        self.pending_ids = GrowableIds(capacity=16)
+        self.next_id = 0
+
+    def __len__(self):
+        return sum(matrix.size for matrix in self.lists) + self.pending.size
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self, sample, iterations=20, seed=0):
+        """
+        Learn the bucket centroids from a representative sample (at least nlist vectors)
+        """
+        sample = normalize_rows(np.atleast_2d(sample))
+        if len(sample) < self.nlist:
+            raise ValueError(f"Need at least nlist={self.nlist} training vectors, got {len(sample)}")
+        self.centroids = train_kmeans(sample, self.nlist, iterations, seed)
+        if self.pending.size:
+            self._assign(self.pending.view, self.pending_ids.view)
+            self.pending = GrowableMatrix(self.dim, capacity=16)
+            self.pending_ids = GrowableIds(capacity=16)
+
+    def add(self, vectors, ids=None):
+        """
+        Add vectors to their nearest bucket
+        Before training they are buffered; the index trains on the buffer once it holds train_size vectors
+        """
+        vectors = normalize_rows(np.atleast_2d(vectors))
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(vectors))
+        ids = np.asarray(ids, dtype=np.int64)
+        self.next_id = max(self.next_id, int(ids.max()) + 1) if len(ids) else self.next_id
+        if self.is_trained:
+            self._assign(vectors, ids)
+            return ids
+        self.pending.append(vectors)
+        self.pending_ids.append(ids)
+        if self.pending.size >= self.train_size:
+            self.train(self.pending.view)
+        return ids
+
+    def _assign(self, vectors, ids):
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        buckets, starts = np.unique(assignment[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        for bucket, start, end in zip(buckets, starts, ends):
+            rows = order[start:end]
+            self.lists[bucket].append(vectors[rows])
+            self.list_ids[bucket].append(ids[rows])
+
+    def search(self, queries, k=10, nprobe=None):
+        """
+        (scores, ids), each n_queries x k, highest cosine first (approximate; exact before training)
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        queries = normalize_rows(np.atleast_2d(queries))
+        if not self.is_trained:
+            scores, rows = blocked_top_k(self.pending.view, queries, k)
+            ids = np.where(rows >= 0, self.pending_ids.view[np.maximum(rows, 0)], -1) if self.pending.size else rows
+            return scores, ids
+        centroid_scores = queries @ self.centroids.T
+        results = []
+        for row, query in enumerate(queries):
+            probes = top_k_indices(centroid_scores[row], nprobe)
+            candidates = [self.lists[bucket].view for bucket in probes if self.lists[bucket].size]
+            if not candidates:
+                results.append((np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)))
+                continue
+            candidate_ids = np.concatenate([self.list_ids[bucket].view for bucket in probes if self.lists[bucket].size])
+            scores = np.concatenate(candidates) @ query
+            results.append(merge_top_k(scores, candidate_ids, k))
+        return pad_results(results, k)
+
+    def save(self, path):
+        sizes = np.array([matrix.size for matrix in self.lists], dtype=np.int64)
+        np.savez(
+            path,
+            kind="ivf",
+            dim=self.dim,
+            nlist=self.nlist,
+            nprobe=self.nprobe,
+            train_size=self.train_size,
+            # no centroids (0 x dim) for an untrained index, whose vectors are all pending
+            centroids=self.centroids if self.is_trained else np.empty((0, self.dim), dtype=np.float32),
+            sizes=sizes,
+            vectors=np.concatenate([matrix.view for matrix in self.lists]),
+            ids=np.concatenate([ids.view for ids in self.list_ids]),
+            pending_vectors=self.pending.view,
+            pending_ids=self.pending_ids.view,
+            next_id=self.next_id,
+        )
+
+    @classmethod
+    def from_arrays(cls, data):
+        # files written before train_size and the pending buffer existed are always trained
+        train_size = int(data["train_size"]) if "train_size" in data else None
+        index = cls(int(data["dim"]), int(data["nlist"]), int(data["nprobe"]), train_size)
+        if len(data["centroids"]):
+            index.centroids = data["centroids"]
+        if "pending_vectors" in data:
+            index.pending.append(data["pending_vectors"])
+            index.pending_ids.append(data["pending_ids"])
+        offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+        vectors, ids = data["vectors"], data["ids"]
+        for bucket in range(index.nlist):
+            index.lists[bucket].append(vectors[offsets[bucket]:offsets[bucket + 1]])
+            index.list_ids[bucket].append(ids[offsets[bucket]:offsets[bucket + 1]])
+        index.next_id = int(data["next_id"])
+        return index
+
+
+def load_index(path):
+    """
+    Load an ExactIndex or IVFIndex written by save()
+    """
+    with np.load(path) as data:
+        kind = str(data["kind"])
+        if kind == "exact":
+            return ExactIndex.from_arrays(data)
+        if kind == "ivf":
+            return IVFIndex.from_arrays(data)
+    raise ValueError(f"Unknown index kind {kind!r} in {path}")
+
+
+def index_texts(index, encoder, texts, chunk_size=1024, ids=None):
+    """
+    Embed texts with an embedders encoder in chunks and add them to index
+    """
+    for start in range(0, len(texts), chunk_size):
+        chunk_ids = None if ids is None else ids[start:start + chunk_size]
+        index.add(encoder.encode(texts[start:start + chunk_size]), chunk_ids)
+    return index
@@ -0,0 +1,77 @@
+### Background warm-up of the models needed for the first query.
+# Loaders decorated with @shared_loader run once per process and arguments; a call made while the
+# same load is already running in another thread waits for it instead of loading a second copy.
+# WarmUp runs such loaders in a daemon thread, so the page is interactive while they load and the
+# first query finds the model ready (or joins the load that is already under way).
+
+import functools
+import threading
+import time
+
+
+def shared_loader(fn):
+    """
+    Memoize fn per positional arguments, loading each value at most once across threads
+    A failed load is not cached; the next call tries again
+    """
+    lock = threading.Lock()
+    key_locks = {}
+    values = {}
+
+    @functools.wraps(fn)
+    def load(*args):
+        if args in values:
+            return values[args]
+        with lock:
+            key_lock = key_locks.setdefault(args, threading.Lock())
+        with key_lock:
+            if args not in values:
+                values[args] = fn(*args)
+        return values[args]
+
+    load.loaded = lambda *args: args in values
+    return load
+
+
+class WarmUp:
+    """
+    Runs named tasks one after another in a daemon thread
+
+    Args:
+        tasks: list of (name, fn) pairs; a failing task is recorded and the rest still run
+    """
+
+    def __init__(self, tasks, name="warm-up"):
+        self.tasks = list(tasks)
+        self.elapsed = {}
+        self.errors = {}
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for name, fn in self.tasks:
+                start = time.perf_counter()
+                try:
+                    fn()
+                except Exception as e:
+                    self.errors[name] = e
+                self.elapsed[name] = time.perf_counter() - start
+        finally:
+            self.done.set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def status(self):
+        """
+        Short human readable progress, e.g. "2/3 ready (glove_50d 0.1s, all-MiniLM-L6-v2 3.2s)"
+        """
+        finished = ", ".join(
+            f"{name} {'failed' if name in self.errors else '%.1fs' % seconds}" for name, seconds in self.elapsed.items()
+        )
+        return f"{len(self.elapsed)}/{len(self.tasks)} ready" + (f" ({finished})" if finished else "")